@@ -0,0 +1,4 @@
+"""
+Benchmarks package
+Run from the project root, e.g.: python -m benchmarks.db_write_load
+"""
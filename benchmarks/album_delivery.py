@@ -0,0 +1,75 @@
+"""
+Benchmark: two photos per recipient vs one album
+Broadcasts the houses announcement (announcements/houses.json) through the
+outbound limiter and a fake Bot API with flood control, once the old way (two
+send_photo calls, keyboard on the second) and once as defined now (one
+send_media_group plus a message with the keyboard), and the same album with
+no keyboard. Prints API calls and uploads per recipient and the throughput.
+Usage: python -m benchmarks.album_delivery [--users 300] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+
+import database
+from benchmarks.fake_telegram import FloodControlSession, make_bot
+from broadcaster import Broadcaster, MediaGroupPayload, PhotoPayload, PhotoSequence, load_announcement
+from media import media
+from ratelimit import OutboundRateLimiter
+
+
+def forget_uploads():
+    """Start with nothing cached, like the first broadcast after a deploy"""
+    media._file_ids.clear()
+    with database.adb.db.pool.writer() as conn:
+        conn.execute("DELETE FROM media_cache")
+
+
+async def measure(name: str, payload, users: int, latency: float, workers: int):
+    """Broadcast to `users` fake users and print what it cost"""
+    session = FloodControlSession(latency=latency)
+    bot = make_bot(session)
+    limiter = OutboundRateLimiter()
+    bot.session.middleware(limiter)
+
+    stats = await Broadcaster(bot, payload, workers=workers, limiter=limiter).run(range(1, users + 1))
+    calls = sum(count for method, count in session.calls.items() if method.startswith("Send"))
+    print(f"{name:<22}{stats.sent:>7}{calls / users:>11.2f}{session.calls.get('upload', 0):>9}"
+          f"{session.calls.get('429', 0):>7}{stats.rate:>9.1f}")
+
+
+async def run(args: argparse.Namespace):
+    """Compare the three ways of sending the announcement"""
+    album = load_announcement("houses").payload
+    two_photos = PhotoSequence([
+        PhotoPayload(album.paths[0]),
+        PhotoPayload(album.paths[1], caption=album.caption, reply_markup=album.reply_markup)
+    ])
+
+    print(f"{'payload':<22}{'sent':>7}{'calls/user':>11}{'uploads':>9}{'429s':>7}{'users/s':>9}")
+    await measure("two send_photo", two_photos, args.users, args.latency, args.workers)
+    forget_uploads()
+    await measure("album + keyboard", album, args.users, args.latency, args.workers)
+    forget_uploads()
+    await measure("album", MediaGroupPayload(album.paths, caption=album.caption), args.users, args.latency, args.workers)
+    await database.adb.close()
+
+
+def main():
+    """Point the media registry at a temporary database and run"""
+    parser = argparse.ArgumentParser(description="Two photos vs one album per recipient")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated API latency in seconds")
+    parser.add_argument("--workers", type=int, default=20)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
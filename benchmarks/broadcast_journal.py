@@ -0,0 +1,145 @@
+"""
+Benchmark: cost of the delivery journal and exactness of --resume
+Broadcasts to fake users without a rate limit (so only the engine and the
+database are measured) with no journal, a journal row written and awaited
+per delivery, and the batched journal. Then interrupts a campaign halfway, resumes it and
+counts users who got the message twice or not at all.
+Usage: python -m benchmarks.broadcast_journal [--users 20000] [--latency 0.005]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+
+import database
+from benchmarks.fake_telegram import FakeSession, make_bot
+from broadcaster import Broadcaster, DeliveryJournal, TextPayload, iter_recipients
+
+
+class RecipientSession(FakeSession):
+    """FakeSession that counts messages per chat"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency=latency)
+        self.received: Counter = Counter()
+
+    async def make_request(self, bot, method, timeout=None):
+        self.received[method.chat_id] += 1
+        return await super().make_request(bot, method, timeout)
+
+
+class UnbufferedBroadcaster(Broadcaster):
+    """Writes each outcome to the database before the worker moves on"""
+
+    def __init__(self, *args, campaign_id: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.campaign_id = campaign_id
+        self.writes = 0
+
+    async def deliver(self, user_id: int) -> str:
+        status = await super().deliver(user_id)
+        await database.adb.record_deliveries(self.campaign_id, [(user_id, status, None, None)])
+        self.writes += 1
+        return status
+
+
+def seed_users(users: int):
+    """Insert users straight into the database"""
+    with database.adb.db.pool.writer() as conn:
+        conn.executemany("INSERT INTO users (user_id, first_name) VALUES (?, 'user')",
+                         ((user_id,) for user_id in range(1, users + 1)))
+
+
+async def measure(name: str, args: argparse.Namespace, batch_size: int = 0):
+    """Broadcast once and print the throughput; batch_size 0 means no journal, -1 unbuffered writes"""
+    payload = TextPayload(f"announcement {name}")
+    started = time.perf_counter()
+    campaign_id = await database.adb.create_campaign(payload.describe(), payload.fingerprint())
+    created = time.perf_counter() - started
+    recipients = iter_recipients(database.adb, campaign_id)
+
+    bot = make_bot(FakeSession(latency=args.latency))
+    started = time.perf_counter()
+    if batch_size > 0:
+        async with DeliveryJournal(database.adb, campaign_id, batch_size=batch_size) as journal:
+            stats = await Broadcaster(bot, payload, workers=args.workers, journal=journal).run(recipients)
+        writes = journal.flushes
+    elif batch_size < 0:
+        broadcaster = UnbufferedBroadcaster(bot, payload, workers=args.workers, campaign_id=campaign_id)
+        stats = await broadcaster.run(recipients)
+        writes = broadcaster.writes
+    else:
+        stats = await Broadcaster(bot, payload, workers=args.workers).run(recipients)
+        writes = 0
+    elapsed = time.perf_counter() - started
+
+    deliveries = (await database.adb.get_campaign(campaign_id))['deliveries']
+    print(f"{name:<18}{stats.sent:>8}{elapsed:>9.2f}{stats.sent / elapsed:>10.0f}"
+          f"{writes:>14}{deliveries.get('sent', 0):>10}{created * 1000:>12.0f}")
+
+
+async def interrupted_then_resumed(args: argparse.Namespace):
+    """Stop a campaign halfway, resume it and check every user got exactly one message"""
+    payload = TextPayload("announcement resume")
+    session = RecipientSession(latency=args.latency)
+    bot = make_bot(session)
+    campaign_id = await database.adb.create_campaign(payload.describe(), payload.fingerprint())
+
+    # First run, cancelled like Ctrl-C once half the users are done
+    journal = DeliveryJournal(database.adb, campaign_id)
+    broadcaster = Broadcaster(bot, payload, workers=args.workers, journal=journal)
+    async with journal:
+        task = asyncio.create_task(broadcaster.run(iter_recipients(database.adb, campaign_id)))
+        while broadcaster.stats.done < args.users // 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    first = broadcaster.stats.done
+
+    # The resumed run reads the pending journal rows, then continues after the cursor
+    async with DeliveryJournal(database.adb, campaign_id) as journal:
+        stats = await Broadcaster(bot, payload, workers=args.workers, journal=journal).run(
+            iter_recipients(database.adb, campaign_id))
+
+    deliveries = (await database.adb.get_campaign(campaign_id))['deliveries']
+    user_ids = range(1, args.users + 1)
+    twice = sum(1 for user_id in user_ids if session.received[user_id] > 1)
+    missed = sum(1 for user_id in user_ids if session.received[user_id] == 0)
+    print(f"\ninterrupted after {first} of {args.users}, resumed with {stats.done}: "
+          f"journal {deliveries}, {twice} users got it twice, {missed} missed")
+
+
+async def run(args: argparse.Namespace):
+    """Compare journal modes, then check resume"""
+    seed_users(args.users)
+
+    print(f"{'journal':<18}{'sent':>8}{'seconds':>9}{'users/s':>10}{'transactions':>14}{'journaled':>10}{'create ms':>12}")
+    await measure("none", args)
+    await measure("row per delivery", args, batch_size=-1)
+    await measure("batched", args, batch_size=500)
+    await interrupted_then_resumed(args)
+    await database.adb.close()
+
+
+def main():
+    """Point the broadcaster at a temporary database and run"""
+    parser = argparse.ArgumentParser(description="Delivery journal overhead and resume")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.005, help="Simulated API latency in seconds")
+    parser.add_argument("--workers", type=int, default=20)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
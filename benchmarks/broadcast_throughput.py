@@ -0,0 +1,69 @@
+"""
+Benchmark: broadcast engine throughput against simulated flood control
+Runs the Broadcaster with text and two-photo payloads through the outbound
+limiter and a fake Bot API that rejects anything over 30 messages/s, and
+compares with the old scripts' fixed 20 messages per ~6 seconds.
+Usage: python -m benchmarks.broadcast_throughput [--users 600] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+
+import database
+from benchmarks.fake_telegram import FloodControlSession, make_bot
+from broadcaster import Broadcaster, PhotoPayload, PhotoSequence, TextPayload
+from media import asset_path
+from ratelimit import OutboundRateLimiter
+
+# Old scripts: 20 sends 0.05 s apart, then a 5 s rest
+LEGACY_USERS_PER_SECOND = 20 / (20 * 0.05 + 5)
+
+
+async def measure(name: str, payload, users: int, latency: float, workers: int):
+    """Broadcast to `users` fake users and print the outcome"""
+    session = FloodControlSession(latency=latency)
+    bot = make_bot(session)
+    limiter = OutboundRateLimiter()
+    bot.session.middleware(limiter)
+
+    broadcaster = Broadcaster(bot, payload, workers=workers, limiter=limiter)
+    stats = await broadcaster.run(range(1, users + 1))
+    messages = stats.sent * (len(payload.photos) if isinstance(payload, PhotoSequence) else 1)
+    hours_100k = 100_000 / stats.rate / 3600
+    print(f"{name:<14}{stats.total:>7}{stats.sent:>7}{stats.failed:>8}{stats.elapsed:>9.1f}"
+          f"{stats.rate:>9.1f}{messages / stats.elapsed:>12.1f}{session.calls.get('429', 0):>7}{hours_100k:>11.2f}")
+
+
+async def run(args: argparse.Namespace):
+    """Run both payloads"""
+    print(f"{'payload':<14}{'users':>7}{'sent':>7}{'failed':>8}{'seconds':>9}{'users/s':>9}"
+          f"{'messages/s':>12}{'429s':>7}{'100k in h':>11}")
+    print(f"{'old scripts':<14}{'':>7}{'':>7}{'':>8}{'':>9}{LEGACY_USERS_PER_SECOND:>9.1f}"
+          f"{LEGACY_USERS_PER_SECOND:>12.1f}{'':>7}{100_000 / LEGACY_USERS_PER_SECOND / 3600:>11.2f}")
+    await measure("text", TextPayload("announcement"), args.users, args.latency, args.workers)
+    photos = PhotoSequence([
+        PhotoPayload(asset_path("banner3.jpg")),
+        PhotoPayload(asset_path("banner4.jpg"), caption="announcement")
+    ])
+    await measure("two photos", photos, args.users // 2, args.latency, args.workers)
+    await database.adb.close()
+
+
+def main():
+    """Point the media registry at a temporary database and run"""
+    parser = argparse.ArgumentParser(description="Broadcast engine throughput")
+    parser.add_argument("--users", type=int, default=600)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated API latency in seconds")
+    parser.add_argument("--workers", type=int, default=20)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
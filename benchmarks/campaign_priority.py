@@ -0,0 +1,103 @@
+"""
+Benchmark: /start latency while a scheduled campaign is being sent
+Runs the campaign runner in the dispatcher's event loop against a fake Bot
+API with flood control and feeds /start updates from new users at a steady
+pace meanwhile. Compares no broadcast, a broadcast whose messages queue
+together with the replies (like a script sharing the rate budget) and one
+sent at BACKGROUND priority, as the runner does.
+Usage: python -m benchmarks.campaign_priority [--users 5000] [--starts 100]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from aiogram import Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import database
+from benchmarks.fake_telegram import FloodControlSession, make_bot, text_update
+from broadcaster import Announcement, CampaignRunner, schedule_announcement
+from handlers import admin, contact, membership, menu, start, subscription
+from ratelimit import BACKGROUND, INTERACTIVE, OutboundRateLimiter
+
+
+async def measure(dp: Dispatcher, name: str, priority, first_user_id: int, args: argparse.Namespace):
+    """Feed /start updates, with a campaign running at `priority` unless it is None"""
+    session = FloodControlSession(latency=args.latency)
+    bot = make_bot(session)
+    bot.session.middleware(OutboundRateLimiter())
+    dp["campaign_runner"] = runner = CampaignRunner(bot, storage=database.adb, poll_interval=0.2,
+                                                    priority=priority if priority is not None else BACKGROUND)
+
+    runner_task = None
+    if priority is not None:
+        await schedule_announcement(Announcement.from_dict("bench", {"text": "announcement"}),
+                                    datetime.now(timezone.utc), storage=database.adb)
+        runner_task = asyncio.create_task(runner.run())
+        # Let the broadcast reach its full pace first
+        while runner.broadcaster is None or runner.broadcaster.stats.done < 100:
+            await asyncio.sleep(0.05)
+    sent_before = runner.broadcaster.stats.sent if runner.broadcaster else 0
+
+    latencies = []
+
+    async def feed(update_id: int, user_id: int):
+        started = time.perf_counter()
+        await dp.feed_update(bot, text_update(update_id, user_id, "/start"))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    feeds = []
+    for i in range(args.starts):
+        feeds.append(asyncio.create_task(feed(first_user_id + i, first_user_id + i)))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*feeds)
+    window = time.perf_counter() - started
+    broadcast_rate = ((runner.broadcaster.stats.sent if runner.broadcaster else 0) - sent_before) / window
+
+    if runner_task is not None:
+        runner_task.cancel()
+        await asyncio.gather(runner_task, return_exceptions=True)
+    latencies.sort()
+    print(f"{name:<24}{statistics.median(latencies) * 1000:>9.0f}{latencies[int(len(latencies) * 0.95)] * 1000:>9.0f}"
+          f"{latencies[-1] * 1000:>9.0f}{broadcast_rate:>13.1f}{session.calls.get('429', 0):>7}")
+
+
+async def run(args: argparse.Namespace):
+    """Measure /start without a broadcast and next to both kinds"""
+    dp = Dispatcher(storage=MemoryStorage())
+    for module in (admin, start, subscription, contact, menu, membership):
+        dp.include_router(module.router)
+
+    print(f"{'broadcast':<24}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'broadcast/s':>13}{'429s':>7}")
+    await measure(dp, "none", None, 10_000_000, args)
+    await measure(dp, "same queue as replies", INTERACTIVE, 20_000_000, args)
+    await measure(dp, "background priority", BACKGROUND, 30_000_000, args)
+    await database.adb.close()
+
+
+def main():
+    """Seed a temporary database with the broadcast's audience and run"""
+    parser = argparse.ArgumentParser(description="/start latency during a scheduled broadcast")
+    parser.add_argument("--users", type=int, default=5000, help="Audience of the broadcast")
+    parser.add_argument("--starts", type=int, default=100, help="/start updates per measurement")
+    parser.add_argument("--rate", type=float, default=5.0, help="/start updates per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated API latency in seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        with database.adb.db.pool.writer() as conn:
+            conn.executemany("INSERT INTO users (user_id, first_name) VALUES (?, 'user')",
+                             ((user_id,) for user_id in range(1, args.users + 1)))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
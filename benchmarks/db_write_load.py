@@ -0,0 +1,120 @@
+"""
+Benchmark: update throughput while the database is under write load
+Compares calling Database directly from the event loop with awaiting AsyncDatabase
+Usage: python -m benchmarks.db_write_load [--seconds 10] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from config import config
+from database import Database, AsyncDatabase, DatabaseExecutor
+
+
+def write_load(db_path: str, stop: threading.Event, rows_per_commit: int):
+    """Keep the database busy with large write transactions"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    next_id = 10_000_000
+    while not stop.is_set():
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id, first_name) VALUES (?, ?)",
+            [(next_id + i, "load") for i in range(rows_per_commit)]
+        )
+        conn.commit()
+        next_id += rows_per_commit
+    conn.close()
+
+
+async def db_update(call, user_id: int):
+    """The database part of a /start update for a new subscribed user"""
+    if not await call("get_user", user_id):
+        await call("add_user", user_id, None, "bench", None, None)
+    await call("update_user_subscription", user_id, True)
+    await call("get_user", user_id)
+
+
+async def run_mode(mode: str, db_path: str, seconds: float, concurrency: int, rows_per_commit: int) -> dict:
+    """Serve simulated updates for a fixed time and collect throughput numbers"""
+    database = Database(db_path)
+    executor = DatabaseExecutor(workers=config.DB_EXECUTOR_WORKERS, max_queue=concurrency * 4)
+    adb = AsyncDatabase(database, executor)
+
+    if mode == "sync":
+        async def call(name, *args):
+            return getattr(database, name)(*args)
+    else:
+        async def call(name, *args):
+            return await getattr(adb, name)(*args)
+
+    stop = threading.Event()
+    loader = threading.Thread(target=write_load, args=(db_path, stop, rows_per_commit), daemon=True)
+    loader.start()
+
+    deadline = time.perf_counter() + seconds
+    db_updates = 0
+    light_updates = 0
+    lags = []
+    counter = iter(range(1, 10**9))
+
+    async def db_worker():
+        nonlocal db_updates
+        while time.perf_counter() < deadline:
+            await db_update(call, next(counter))
+            db_updates += 1
+
+    async def light_worker():
+        # Updates like "📚 Qo’llanma" that never touch the database
+        nonlocal light_updates
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - started - 0.01)
+            light_updates += 1
+
+    await asyncio.gather(light_worker(), *(db_worker() for _ in range(concurrency)))
+
+    stop.set()
+    loader.join()
+    await adb.close()
+
+    lags.sort()
+    return {
+        "db_updates_per_sec": db_updates / seconds,
+        "light_updates_per_sec": light_updates / seconds,
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": lags[int(len(lags) * 0.99) - 1] * 1000 if lags else 0.0,
+        "lag_max_ms": lags[-1] * 1000 if lags else 0.0,
+    }
+
+
+def main():
+    """Run both modes and print a comparison table"""
+    parser = argparse.ArgumentParser(description="Benchmark handler throughput under DB write load")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rows-per-commit", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for mode in ("sync", "async"):
+            db_path = os.path.join(tmp, f"{mode}.db")
+            results[mode] = asyncio.run(
+                run_mode(mode, db_path, args.seconds, args.concurrency, args.rows_per_commit)
+            )
+
+    print(f"{'mode':<8}{'db upd/s':>12}{'light upd/s':>14}{'lag p50 ms':>13}{'lag p99 ms':>13}{'lag max ms':>13}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<8}{r['db_updates_per_sec']:>12.1f}{r['light_updates_per_sec']:>14.1f}"
+            f"{r['lag_p50_ms']:>13.1f}{r['lag_p99_ms']:>13.1f}{r['lag_max_ms']:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
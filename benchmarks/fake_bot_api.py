@@ -0,0 +1,143 @@
+"""
+Local HTTP fake of the Telegram Bot API for transport benchmarks
+Unlike FakeSession this runs a real aiohttp server, so the bot's HTTP
+session, long polling and webhook deliveries are all exercised. Every
+response and webhook delivery is delayed by a simulated network round trip.
+"""
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench bot", "username": "bench_bot"}
+
+
+class FakeBotAPI:
+    """
+    Minimal Bot API server
+
+    Updates are queued with inject(); they are handed out through getUpdates
+    or pushed to a webhook URL, whichever the benchmark uses. Every
+    sendMessage/sendPhoto reply is matched to the update for the same chat to
+    measure end-to-end latency.
+    """
+
+    def __init__(self, rtt: float = 0.05):
+        self.rtt = rtt
+        self.updates: "asyncio.Queue[dict]" = asyncio.Queue()
+        self.injected: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.replied = asyncio.Event()
+        self.expected = 0
+        self.get_updates_calls = 0
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    # Updates
+
+    def inject(self, user_id: int, text: str):
+        """Queue an incoming private text message"""
+        update_id = next(self._update_ids)
+        self.injected[user_id] = time.perf_counter()
+        self.updates.put_nowait({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "text": text,
+            },
+        })
+
+    async def deliver_webhook(self, url: str, secret: str, connections: int):
+        """Push queued updates to a webhook like Telegram: `connections` requests at a time"""
+        async with aiohttp.ClientSession() as session:
+            async def worker():
+                while True:
+                    update = await self.updates.get()
+                    await asyncio.sleep(self.rtt / 2)
+                    async with session.post(
+                        url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}
+                    ) as response:
+                        await response.read()
+                    await asyncio.sleep(self.rtt / 2)
+
+            workers = [asyncio.create_task(worker()) for _ in range(connections)]
+            try:
+                await asyncio.Event().wait()
+            finally:
+                for task in workers:
+                    task.cancel()
+
+    # Bot API methods
+
+    async def _get_updates(self, params: dict) -> list:
+        self.get_updates_calls += 1
+        timeout = float(params.get("timeout", 0))
+        try:
+            first = await asyncio.wait_for(self.updates.get(), timeout or 0.001)
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while len(batch) < 100 and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    def _sent_message(self, params: dict) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        started = self.injected.pop(chat_id, None)
+        if started is not None:
+            self.latencies.append(time.perf_counter() - started)
+            if len(self.latencies) >= self.expected:
+                self.replied.set()
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == "getupdates":
+            # The long poll itself is free; only the answer pays the round trip
+            result = await self._get_updates(params)
+        elif method == "getme":
+            result = BOT_USER
+        elif method in ("sendmessage", "sendphoto"):
+            result = self._sent_message(params)
+        elif method == "getchatmember":
+            user_id = int(params.get("user_id", 0))
+            result = {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": "user"}}
+        else:
+            result = True
+
+        await asyncio.sleep(self.rtt)
+        return web.json_response({"ok": True, "result": result})
+
+    # Server
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving and return the base URL"""
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
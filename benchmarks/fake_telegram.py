@@ -0,0 +1,166 @@
+"""
+In-process fake of the Telegram Bot API for benchmarks
+FakeSession plugs into aiogram's Bot and answers every method locally
+"""
+import asyncio
+import itertools
+import time
+from collections import deque
+from datetime import datetime
+from typing import AsyncGenerator, Deque, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetChatMember, GetMe, SendMediaGroup, TelegramMethod
+from aiogram.types import (
+    CallbackQuery, Chat, ChatMemberLeft, ChatMemberMember, ChatMemberUpdated, InputFile, Message,
+    PhotoSize, Update, User
+)
+
+BOT_USER = User(id=1, is_bot=True, first_name="Bench bot", username="bench_bot")
+
+
+class FakeSession(BaseSession):
+    """Bot session that never touches the network"""
+
+    def __init__(self, latency: float = 0.0, subscribed: bool = True):
+        super().__init__()
+        self.latency = latency
+        self.subscribed = subscribed
+        self.calls: Dict[str, int] = {}
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        name = type(method).__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        files = [getattr(method, "photo", None)] + [item.media for item in getattr(method, "media", None) or []]
+        uploads = sum(1 for file in files if isinstance(file, InputFile))
+        if uploads:
+            self.calls["upload"] = self.calls.get("upload", 0) + uploads
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if isinstance(method, GetMe):
+            return BOT_USER
+        if isinstance(method, GetChatMember):
+            user = User(id=method.user_id, is_bot=False, first_name="user")
+            if self.subscribed:
+                return ChatMemberMember(user=user)
+            return ChatMemberLeft(user=user)
+        if isinstance(method, SendMediaGroup):
+            return [self._message(method.chat_id) for _ in method.media]
+        if method.__returning__ is Message:
+            return self._message(getattr(method, "chat_id", 0))
+        return True
+
+    def _message(self, chat_id) -> Message:
+        message_id = next(self._message_ids)
+        return Message(
+            message_id=message_id,
+            date=datetime.now(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"),
+            photo=[PhotoSize(file_id=f"fake-file-id-{message_id}", file_unique_id="fake", width=1, height=1)],
+        )
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+
+class FloodControlSession(FakeSession):
+    """
+    FakeSession that answers like Telegram's flood control
+
+    Message sends over `global_limit` per second for the bot or `chat_limit`
+    per second for one chat are rejected with RetryAfter (counted in
+    `calls["429"]`).
+    """
+
+    def __init__(self, latency: float = 0.0, global_limit: int = 30, chat_limit: int = 3):
+        super().__init__(latency=latency)
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self._sent: Deque[float] = deque()
+        self._sent_to: Dict[int, Deque[float]] = {}
+
+    @staticmethod
+    def _over(window: Deque[float], now: float, limit: int) -> bool:
+        while window and window[0] <= now - 1.0:
+            window.popleft()
+        return len(window) >= limit
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None and type(method).__name__.startswith(("Send", "Copy", "Forward")):
+            now = time.monotonic()
+            per_chat = self._sent_to.setdefault(chat_id, deque())
+            # An album counts as one message per item
+            messages = len(getattr(method, "media", None) or [None])
+            if (self._over(self._sent, now, max(self.global_limit - messages + 1, 1))
+                    or self._over(per_chat, now, max(self.chat_limit - messages + 1, 1))):
+                self.calls["429"] = self.calls.get("429", 0) + 1
+                raise TelegramRetryAfter(method=method, message="Too Many Requests: retry after 1", retry_after=1)
+            self._sent.extend([now] * messages)
+            per_chat.extend([now] * messages)
+        return await super().make_request(bot, method, timeout)
+
+
+def make_bot(session: FakeSession) -> Bot:
+    """Create a Bot that talks to the fake session"""
+    return Bot(token="42:FAKE", session=session)
+
+
+def text_update(update_id: int, user_id: int, text: str) -> Update:
+    """Build an incoming private text message update"""
+    user = User(id=user_id, is_bot=False, first_name=f"user{user_id}")
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=user,
+            text=text,
+        ),
+    )
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> Update:
+    """Build an inline button press on a message the bot sent earlier"""
+    user = User(id=user_id, is_bot=False, first_name=f"user{user_id}")
+    return Update(
+        update_id=update_id,
+        callback_query=CallbackQuery(
+            id=str(update_id),
+            from_user=user,
+            chat_instance=str(user_id),
+            data=data,
+            message=Message(
+                message_id=update_id,
+                date=datetime.now(),
+                chat=Chat(id=user_id, type="private"),
+                from_user=BOT_USER,
+                text="...",
+            ),
+        ),
+    )
+
+
+def chat_member_update(update_id: int, user_id: int, channel: Chat, joined: bool) -> Update:
+    """Build a chat_member update for a user joining or leaving a channel"""
+    user = User(id=user_id, is_bot=False, first_name=f"user{user_id}")
+    left, member = ChatMemberLeft(user=user), ChatMemberMember(user=user)
+    return Update(
+        update_id=update_id,
+        chat_member=ChatMemberUpdated(
+            chat=channel,
+            from_user=user,
+            date=datetime.now(),
+            old_chat_member=left if joined else member,
+            new_chat_member=member if joined else left,
+        ),
+    )
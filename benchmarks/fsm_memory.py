@@ -0,0 +1,83 @@
+"""
+Benchmark: FSM storage memory and database calls as users accumulate
+Every user goes through the onboarding states the bot uses (/start sets
+"waiting_for_contact", sharing the contact clears it); a share of them never
+finish. Compares aiogram's MemoryStorage with the tiered storage.
+Usage: python -m benchmarks.fsm_memory [--users 50000] [--abandon 0.3]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import database
+from benchmarks.handler_round_trips import CountingExecutor
+from fsm import TieredFSMStorage
+
+
+async def onboard(storage, users: int, abandon: float) -> float:
+    """Run every user through onboarding; returns elapsed seconds"""
+    started = time.perf_counter()
+    for user_id in range(1, users + 1):
+        key = StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+        # The FSM middleware reads the state of every update
+        await storage.get_state(key)
+        await storage.set_state(key, "waiting_for_contact")
+        if user_id % 100 >= abandon * 100:
+            await storage.get_state(key)
+            await storage.set_state(key, None)
+            await storage.set_data(key, {})
+    return time.perf_counter() - started
+
+
+async def measure(name: str, storage, users: int, abandon: float, counting: CountingExecutor):
+    """Print memory held by the storage after onboarding `users` users"""
+    counting.calls = 0
+    tracemalloc.start()
+    elapsed = await onboard(storage, users, abandon)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<16}{users:>8}{current / 1024 / 1024:>12.1f}{counting.calls / users:>17.2f}{users / elapsed:>12.0f}")
+
+
+async def run(args: argparse.Namespace):
+    """Compare both storages for growing numbers of users"""
+    counting = CountingExecutor(database.adb.executor)
+    database.adb.executor = counting
+
+    print(f"{'storage':<16}{'users':>8}{'memory MiB':>12}{'db calls/user':>17}{'users/s':>12}")
+    for users in (args.users // 10, args.users):
+        await measure("MemoryStorage", MemoryStorage(), users, args.abandon, counting)
+        tiered = TieredFSMStorage(database.adb, max_entries=args.cache_entries)
+        await measure("tiered", tiered, users, args.abandon, counting)
+
+        # A restart keeps unfinished onboarding (user 100 abandons it)
+        restarted = TieredFSMStorage(database.adb, max_entries=args.cache_entries)
+        key = StorageKey(bot_id=42, chat_id=100, user_id=100)
+        print(f"{'':<16}after a restart user 100 is in state {await restarted.get_state(key)!r}")
+        with database.adb.db.pool.writer() as conn:
+            conn.execute("DELETE FROM fsm_states")
+
+    await database.adb.close()
+
+
+def main():
+    """Point the storage at a temporary database and run the comparison"""
+    parser = argparse.ArgumentParser(description="FSM storage memory use")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--abandon", type=float, default=0.3, help="Share of users who never share a contact")
+    parser.add_argument("--cache-entries", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
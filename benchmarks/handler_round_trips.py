@@ -0,0 +1,105 @@
+"""
+Benchmark: database round trips and throughput per handler
+Feeds updates through the real routers with a fake Bot API and counts how
+many database calls, get_chat_member requests and photo uploads each update costs
+Usage: python -m benchmarks.handler_round_trips [--users 2000]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from aiogram import Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat
+
+import database
+import utils
+from benchmarks.fake_telegram import FakeSession, callback_update, chat_member_update, make_bot, text_update
+from config import config
+from handlers import admin, contact, membership, menu, start, subscription
+
+SCENARIOS = [
+    ("/start (new user)", "/start"),
+    ("/start (returning)", "/start"),
+    ("⭐ Mening ballarim", "⭐ Mening ballarim"),
+    ("👥 Shaxsiy havolam", "👥 Shaxsiy havolam"),
+    ("Bajarildi ✅", "callback:check_subscription"),
+    ("channel join", "member:join"),
+    ("/start (tracked member)", "/start"),
+]
+
+
+class CountingExecutor:
+    """Wraps the database executor and counts submitted calls"""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.calls = 0
+
+    async def submit(self, func, *args, **kwargs):
+        self.calls += 1
+        return await self.executor.submit(func, *args, **kwargs)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+async def run(users: int):
+    """Run every scenario for a batch of users and print per-update costs"""
+    counting = CountingExecutor(database.adb.executor)
+    database.adb.executor = counting
+
+    dp = Dispatcher(storage=MemoryStorage())
+    for module in (admin, start, subscription, contact, menu, membership):
+        dp.include_router(module.router)
+    session = FakeSession()
+    bot = make_bot(session)
+    channel = Chat(id=-100, type="channel", username=str(config.CHANNEL_ID).lstrip("@"))
+
+    print(f"{'scenario':<24}{'db calls/update':>17}{'api calls/update':>18}{'uploads':>9}{'updates/s':>12}")
+    update_id = 0
+    for name, text in SCENARIOS:
+        counting.calls = 0
+        session.calls.clear()
+        started = time.perf_counter()
+        for user_id in range(1_000_000, 1_000_000 + users):
+            update_id += 1
+            if text.startswith("callback:"):
+                update = callback_update(update_id, user_id, text.split(":", 1)[1])
+            elif text.startswith("member:"):
+                update = chat_member_update(update_id, user_id, channel, joined=text == "member:join")
+            else:
+                update = text_update(update_id, user_id, text)
+            await dp.feed_update(bot, update)
+        elapsed = time.perf_counter() - started
+        api_calls = session.calls.get("GetChatMember", 0)
+        uploads = session.calls.get("upload", 0)
+        print(f"{name:<24}{counting.calls / users:>17.1f}{api_calls / users:>18.1f}{uploads:>9}{users / elapsed:>12.0f}")
+
+        if name == "/start (new user)":
+            # Give every user a phone so the next scenarios hit the main menu path
+            with database.adb.db.pool.writer() as conn:
+                conn.execute("UPDATE users SET phone_number = '+998000000000'")
+            database.adb.db.user_cache.clear()
+        elif name == "channel join":
+            # Forget cached API answers: the next /start must use local state
+            utils.subscription_cache.clear()
+
+    await database.adb.close()
+
+
+def main():
+    """Point the bot at a temporary database and run the scenarios"""
+    parser = argparse.ArgumentParser(description="Count DB round trips per handler")
+    parser.add_argument("--users", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args.users))
+
+
+if __name__ == "__main__":
+    main()
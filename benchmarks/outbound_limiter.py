@@ -0,0 +1,79 @@
+"""
+Benchmark: broadcast pacing against simulated flood control
+Sends one message per user through a fake Bot API that rejects anything
+over 30 messages/s (and 3/s per chat) with RetryAfter, comparing the old
+fixed batches, unpaced concurrent sends and the shared outbound limiter.
+Usage: python -m benchmarks.outbound_limiter [--users 300] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot
+
+from benchmarks.fake_telegram import FloodControlSession, make_bot
+from ratelimit import OutboundRateLimiter
+
+
+async def send(bot: Bot, user_id: int) -> bool:
+    """Send one message, reporting failure instead of raising"""
+    try:
+        await bot.send_message(chat_id=user_id, text="announcement")
+        return True
+    except Exception:
+        return False
+
+
+async def legacy_batches(bot: Bot, user_ids):
+    """The scripts' old scheme: 20 messages 0.05s apart, then 5s rest"""
+    results = []
+    for i in range(0, len(user_ids), 20):
+        for user_id in user_ids[i:i + 20]:
+            results.append(await send(bot, user_id))
+            await asyncio.sleep(0.05)
+        if i + 20 < len(user_ids):
+            await asyncio.sleep(5)
+    return results
+
+
+async def concurrent(bot: Bot, user_ids):
+    """Everything at once, relying on the session to pace it (or not)"""
+    return await asyncio.gather(*(send(bot, user_id) for user_id in user_ids))
+
+
+async def measure(name: str, strategy, users: int, latency: float, limiter: bool):
+    """Run one strategy and print throughput, failures and 429s"""
+    session = FloodControlSession(latency=latency)
+    bot = make_bot(session)
+    if limiter:
+        bot.session.middleware(OutboundRateLimiter())
+    user_ids = list(range(1, users + 1))
+
+    started = time.perf_counter()
+    results = await strategy(bot, user_ids)
+    elapsed = time.perf_counter() - started
+    delivered = sum(results)
+    print(f"{name:<22}{users:>7}{delivered:>11}{elapsed:>10.1f}{delivered / elapsed:>12.1f}"
+          f"{session.calls.get('429', 0):>7}")
+
+
+async def run(args: argparse.Namespace):
+    """Compare the strategies"""
+    print(f"{'strategy':<22}{'users':>7}{'delivered':>11}{'seconds':>10}{'messages/s':>12}{'429s':>7}")
+    # The old scheme is slow; a few batches are enough to see its rate
+    await measure("20/batch + 5s rest", legacy_batches, min(args.users, 60), args.latency, False)
+    await measure("unpaced gather", concurrent, args.users, args.latency, False)
+    await measure("outbound limiter", concurrent, args.users, args.latency, True)
+
+
+def main():
+    """Parse arguments and run the comparison"""
+    parser = argparse.ArgumentParser(description="Compare broadcast pacing strategies")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated API latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
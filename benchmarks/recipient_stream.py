@@ -0,0 +1,93 @@
+"""
+Benchmark: loading every recipient up front vs streaming them from a cursor
+Broadcasts to growing numbers of fake users, once from a list read with
+get_all_user_ids() (the old way) and once from iter_recipients(), and
+prints the peak memory of the run and how long the first message took.
+Usage: python -m benchmarks.recipient_stream [--users 100000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+import database
+from benchmarks.fake_telegram import FakeSession, make_bot
+from broadcaster import Broadcaster, TextPayload, iter_recipients
+
+
+class FirstMessageSession(FakeSession):
+    """FakeSession that notes when the first message went out"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency=latency)
+        self.first_at = None
+
+    async def make_request(self, bot, method, timeout=None):
+        if self.first_at is None:
+            self.first_at = time.perf_counter()
+        return await super().make_request(bot, method, timeout)
+
+
+async def loaded(payload: TextPayload, args: argparse.Namespace):
+    """Read every user ID, then send"""
+    user_ids = await database.adb.get_all_user_ids(deliverable_only=True)
+    return user_ids, None
+
+
+async def streamed(payload: TextPayload, args: argparse.Namespace):
+    """Open a campaign and send while its cursor hands out pages"""
+    campaign_id = await database.adb.create_campaign(payload.describe(), payload.fingerprint())
+    total = (await database.adb.get_campaign(campaign_id))['total']
+    return iter_recipients(database.adb, campaign_id, page_size=args.page_size), total
+
+
+async def measure(name: str, recipients, users: int, args: argparse.Namespace):
+    """Broadcast to everyone and print peak memory and time to the first message"""
+    session = FirstMessageSession(latency=args.latency)
+    payload = TextPayload(f"announcement {name} {users}")
+    tracemalloc.start()
+    started = time.perf_counter()
+    user_ids, total = await recipients(payload, args)
+    stats = await Broadcaster(make_bot(session), payload, workers=args.workers).run(user_ids, total=total)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    first = (session.first_at - started) * 1000
+    print(f"{name:<10}{users:>9}{stats.sent:>9}{peak / 1024 / 1024:>10.1f}{first:>16.1f}{elapsed:>10.1f}")
+
+
+async def run(args: argparse.Namespace):
+    """Compare both ways for growing numbers of users"""
+    print(f"{'source':<10}{'users':>9}{'sent':>9}{'peak MiB':>10}{'first msg ms':>16}{'seconds':>10}")
+    seeded = 0
+    for users in (args.users // 10, args.users):
+        with database.adb.db.pool.writer() as conn:
+            conn.executemany("INSERT INTO users (user_id, first_name) VALUES (?, 'user')",
+                             ((user_id,) for user_id in range(seeded + 1, users + 1)))
+        seeded = users
+        await measure("list", loaded, users, args)
+        await measure("cursor", streamed, users, args)
+
+    await database.adb.close()
+
+
+def main():
+    """Point the broadcaster at a temporary database and run"""
+    parser = argparse.ArgumentParser(description="Recipient list vs streaming cursor")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated API latency in seconds")
+    parser.add_argument("--workers", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
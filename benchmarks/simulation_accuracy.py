@@ -0,0 +1,43 @@
+"""
+Benchmark: --simulate's virtual clock against real time
+Runs the same simulated broadcast (same fake Bot API, same seed) twice, on
+the virtual-clock event loop and on a normal one that really waits, and
+compares the predicted duration with the measured one.
+Usage: python -m benchmarks.simulation_accuracy [--users 1500]
+"""
+import argparse
+import asyncio
+import time
+
+from broadcaster import TextPayload, simulation
+
+
+def measure(name: str, loop_factory, users: int, args: argparse.Namespace):
+    """Simulate one broadcast and print its duration and outcome"""
+    model = simulation.SimulationModel(latency=args.latency, seed=1)
+    started = time.perf_counter()
+    report = simulation.simulate_broadcast(TextPayload("announcement"), list(range(1, users + 1)), model=model,
+                                           loop_factory=loop_factory)
+    took = time.perf_counter() - started
+    first = report.passes[0].stats
+    duration = sum(simulated.stats.elapsed for simulated in report.passes)
+    print(f"{name:<12}{users:>7}{duration:>11.1f}{first.sent:>7}{first.unreachable:>13}{first.failed:>8}"
+          f"{report.passes[0].flood_waits:>7}{took:>10.1f}")
+
+
+def main():
+    """Run the broadcast on both loops"""
+    parser = argparse.ArgumentParser(description="Virtual clock vs real time")
+    parser.add_argument("--users", type=int, default=1500)
+    parser.add_argument("--latency", type=float, default=0.1, help="Mean simulated API latency in seconds")
+    args = parser.parse_args()
+
+    print(f"{'clock':<12}{'users':>7}{'predicted':>11}{'sent':>7}{'unreachable':>13}{'failed':>8}"
+          f"{'429s':>7}{'took s':>10}")
+    for name, loop_factory in (("virtual", simulation.VirtualClockEventLoop),
+                               ("real time", asyncio.SelectorEventLoop)):
+        measure(name, loop_factory, args.users, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: suppression of unreachable recipients
+A share of fake users has blocked the bot, deleted their account or never
+existed. Runs two campaigns in a row: the first finds and suppresses them,
+the second skips them. Then times the recipient query with and without the
+partial index on deliverable users, and shows /start unsuppressing a user.
+Usage: python -m benchmarks.suppression [--users 20000] [--dead 0.2]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+import database
+from benchmarks.fake_telegram import FakeSession, make_bot
+from broadcaster import Broadcaster, DeliveryJournal, TextPayload, iter_recipients
+
+# Telegram's answers for unreachable chats, by user_id % 3
+FAILURES = (
+    (TelegramForbiddenError, "Forbidden: bot was blocked by the user"),
+    (TelegramForbiddenError, "Forbidden: user is deactivated"),
+    (TelegramBadRequest, "Bad Request: chat not found"),
+)
+
+
+class DeadChatsSession(FakeSession):
+    """FakeSession where users in the first `dead` share of every 100 IDs can't be reached"""
+
+    def __init__(self, dead: float):
+        super().__init__()
+        self.dead = dead
+
+    async def make_request(self, bot, method, timeout=None):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None and chat_id % 100 < self.dead * 100:
+            self.calls["rejected"] = self.calls.get("rejected", 0) + 1
+            error, message = FAILURES[chat_id % 3]
+            raise error(method=method, message=message)
+        return await super().make_request(bot, method, timeout)
+
+
+async def campaign(number: int, args: argparse.Namespace):
+    """Run one broadcast to everyone deliverable and print what it cost"""
+    session = DeadChatsSession(args.dead)
+    payload = TextPayload(f"announcement {number}")
+    campaign_id = await database.adb.create_campaign(payload.describe(), payload.fingerprint())
+    recipients = (await database.adb.get_campaign(campaign_id))['total']
+    async with DeliveryJournal(database.adb, campaign_id) as journal:
+        stats = await Broadcaster(make_bot(session), payload, journal=journal).run(
+            iter_recipients(database.adb, campaign_id), total=recipients)
+    calls = session.calls.get("SendMessage", 0) + session.calls.get("rejected", 0)
+    print(f"campaign {number:<4}{recipients:>12}{calls:>11}{stats.sent:>8}{stats.unreachable:>13}"
+          f"{calls / 30 / 60:>16.1f}")
+
+
+RECIPIENTS_SQL = "SELECT user_id FROM users WHERE delivery_status IS NULL ORDER BY user_id"
+
+
+def time_query(repeat: int = 20) -> float:
+    """Milliseconds per full read of the deliverable recipients"""
+    with database.adb.db.pool.reader() as conn:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(RECIPIENTS_SQL).fetchall()
+        return (time.perf_counter() - started) / repeat * 1000
+
+
+async def run(args: argparse.Namespace):
+    """Two campaigns, then the query with and without its index"""
+    with database.adb.db.pool.writer() as conn:
+        conn.executemany("INSERT INTO users (user_id, first_name) VALUES (?, 'user')",
+                         ((user_id,) for user_id in range(1, args.users + 1)))
+
+    print(f"{'':<13}{'recipients':>12}{'API calls':>11}{'sent':>8}{'unreachable':>13}{'min at 30/s':>16}")
+    await campaign(1, args)
+    await campaign(2, args)
+
+    with database.adb.db.pool.reader() as conn:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {RECIPIENTS_SQL}").fetchall()
+    print(f"\nrecipient query plan: {plan[0][-1]}")
+    indexed = time_query()
+    with database.adb.db.pool.writer() as conn:
+        conn.execute("DROP INDEX idx_users_deliverable")
+    print(f"recipient query: {indexed:.1f} ms with idx_users_deliverable, {time_query():.1f} ms without")
+
+    # The first unreachable user comes back and sends /start
+    await database.adb.unsuppress_user(1)
+    print(f"after /start from user 1: {len(await database.adb.get_all_user_ids(deliverable_only=True))} deliverable users")
+    await database.adb.close()
+
+
+def main():
+    """Point the broadcaster at a temporary database and run"""
+    parser = argparse.ArgumentParser(description="Suppression of unreachable recipients")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--dead", type=float, default=0.2, help="Share of unreachable users")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: per-user serialization of concurrent updates
+Feeds updates concurrently (as polling and webhook mode do) through the real
+routers, with and without UserEventIsolation:
+- every new user sends /start twice at once through two different referral
+  links; only one referrer may be credited
+- many users tap "⭐ Mening ballarim" at once against a slow fake API, to show
+  that different users still run in parallel
+Usage: python -m benchmarks.user_serialization [--users 500] [--latency 0.02]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from aiogram import Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import database
+from benchmarks.fake_telegram import FakeSession, make_bot, text_update
+from handlers import admin, contact, membership, menu, start, subscription
+from isolation import UserEventIsolation
+
+REFERRERS = (10, 20)
+
+
+def make_dispatcher(isolation) -> Dispatcher:
+    """Dispatcher with the bot's routers (routers can only be attached once)"""
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=isolation)
+    for module in (admin, start, subscription, contact, menu, membership):
+        module.router._parent_router = None
+        dp.include_router(module.router)
+    return dp
+
+
+async def double_start(dp: Dispatcher, first_user_id: int, users: int, latency: float) -> int:
+    """Send two /start ref links per new user at once; returns referrals credited"""
+    bot = make_bot(FakeSession(latency=latency))
+    before = await database.adb.get_total_referrals()
+    updates = []
+    for i, user_id in enumerate(range(first_user_id, first_user_id + users)):
+        for j, referrer_id in enumerate(REFERRERS):
+            updates.append(text_update(2 * i + j + 1, user_id, f"/start {referrer_id}"))
+    await asyncio.gather(*(dp.feed_update(bot, update) for update in updates))
+    return await database.adb.get_total_referrals() - before
+
+
+async def parallel_menu(dp: Dispatcher, first_user_id: int, users: int, latency: float) -> float:
+    """Every user taps the points button at once; returns updates/s"""
+    bot = make_bot(FakeSession(latency=latency))
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        dp.feed_update(bot, text_update(i + 1, user_id, "⭐ Mening ballarim"))
+        for i, user_id in enumerate(range(first_user_id, first_user_id + users))
+    ))
+    return users / (time.perf_counter() - started)
+
+
+async def run(args: argparse.Namespace):
+    """Run both scenarios with and without isolation"""
+    for referrer_id in REFERRERS:
+        await database.adb.add_user(referrer_id, first_name=f"referrer{referrer_id}")
+
+    print(f"{'isolation':<22}{'users':>7}{'referrals credited':>20}{'menu updates/s':>16}{'locks left':>12}")
+    for i, (name, isolation) in enumerate((("none", None), ("UserEventIsolation", UserEventIsolation(args.concurrency)))):
+        dp = make_dispatcher(isolation)
+        first_user_id = 1_000_000 * (i + 1)
+        credited = await double_start(dp, first_user_id, args.users, args.latency)
+        rate = await parallel_menu(dp, first_user_id, args.users, args.latency)
+        locks = len(isolation.locks) if isolation else 0
+        print(f"{name:<22}{args.users:>7}{credited:>20}{rate:>16.0f}{locks:>12}")
+
+    await database.adb.close()
+
+
+def main():
+    """Point the bot at a temporary database and run the comparison"""
+    parser = argparse.ArgumentParser(description="Concurrent updates with and without per-user locks")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated API latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark: update throughput and end-to-end latency, polling vs webhook
+Runs the real routers against a local fake Bot API over HTTP. Updates are
+injected at a fixed rate; latency is measured from injection until the
+bot's reply reaches the fake API. Every API response and webhook delivery
+pays the simulated round trip. The fake API and the bot share one process,
+so past a few hundred updates/s both modes are CPU-bound and the numbers
+say more about this machine than about the transport.
+Usage: python -m benchmarks.webhook_vs_polling [--updates 2000] [--rate 250] [--rtt 0.05]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import List
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiohttp import web
+
+import database
+from benchmarks.fake_bot_api import FakeBotAPI
+from handlers import admin, contact, membership, menu, start, subscription
+from webhook import build_app
+
+TOKEN = "42:benchmark"
+TEXT = "⭐ Mening ballarim"
+WEBHOOK_PATH = "/webhook"
+SECRET = "benchmark-secret"
+
+
+def make_dispatcher() -> Dispatcher:
+    """Dispatcher with the bot's routers (routers can only be attached once)"""
+    dp = Dispatcher(storage=MemoryStorage())
+    for module in (admin, start, subscription, contact, menu, membership):
+        module.router._parent_router = None
+        dp.include_router(module.router)
+    return dp
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def inject(api: FakeBotAPI, first_user_id: int, updates: int, rate: float):
+    """Queue updates from distinct users at a steady rate"""
+    started = time.perf_counter()
+    for i in range(updates):
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        api.inject(first_user_id + i, TEXT)
+
+
+async def run_mode(mode: str, first_user_id: int, args: argparse.Namespace) -> dict:
+    """Serve one batch of updates in the given mode and collect measurements"""
+    api = FakeBotAPI(rtt=args.rtt)
+    api.expected = args.updates
+    base_url = await api.start()
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+    dp = make_dispatcher()
+
+    background = []
+    runner = None
+    if mode == "polling":
+        background.append(asyncio.create_task(
+            dp.start_polling(bot, handle_signals=False, close_bot_session=False, polling_timeout=10)
+        ))
+    else:
+        runner = web.AppRunner(build_app(dp, bot, WEBHOOK_PATH, SECRET, args.concurrency))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}{WEBHOOK_PATH}"
+        background.append(asyncio.create_task(api.deliver_webhook(url, SECRET, args.max_connections)))
+
+    started = time.perf_counter()
+    await inject(api, first_user_id, args.updates, args.rate)
+    try:
+        await asyncio.wait_for(api.replied.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+    # Let the last handlers receive their sendMessage responses before shutting down
+    await asyncio.sleep(args.rtt * 2)
+
+    if mode == "polling":
+        await dp.stop_polling()
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    if runner:
+        await runner.cleanup()
+    await bot.session.close()
+    await api.stop()
+
+    latencies = api.latencies or [float("nan")]
+    return {
+        "mode": mode,
+        "handled": len(api.latencies),
+        "throughput": len(api.latencies) / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "get_updates": api.get_updates_calls,
+    }
+
+
+async def run(args: argparse.Namespace):
+    """Run both modes and print a comparison table"""
+    print(f"{args.updates} updates at {args.rate:g}/s, simulated RTT {args.rtt * 1000:.0f} ms")
+    print(f"{'mode':<10}{'handled':>9}{'updates/s':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'getUpdates':>12}")
+    for i, mode in enumerate(("polling", "webhook")):
+        result = await run_mode(mode, 2_000_000 + i * args.updates, args)
+        print(
+            f"{result['mode']:<10}{result['handled']:>9}{result['throughput']:>11.0f}"
+            f"{result['p50']:>9.1f}{result['p95']:>9.1f}{result['p99']:>9.1f}{result['get_updates']:>12}"
+        )
+    await database.adb.close()
+
+
+def main():
+    """Point the bot at a temporary database and compare both modes"""
+    parser = argparse.ArgumentParser(description="Compare polling and webhook delivery")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=250, help="Injected updates per second")
+    parser.add_argument("--rtt", type=float, default=0.05, help="Simulated network round trip in seconds")
+    parser.add_argument("--concurrency", type=int, default=100, help="Webhook updates handled at once")
+    parser.add_argument("--max-connections", type=int, default=40, help="Parallel webhook deliveries")
+    parser.add_argument("--timeout", type=float, default=60, help="Give up waiting for replies after this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.adb.db = database.Database(os.path.join(tmp, "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
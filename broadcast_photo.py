@@ -1,21 +1,16 @@
 """
 Broadcast photo with caption script
 Send photo with caption to all users with rate limiting
-Usage: python broadcast_photo.py <photo_path> "Your caption here"
+Usage: python broadcast_photo.py <photo_path> "Your caption here" [--simulate]
 """
 import asyncio
 import logging
 import sys
-import sqlite3
-from typing import List
 import argparse
-import os
+from typing import Optional
 
-from aiogram import Bot
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
-from aiogram.types import FSInputFile
-from config import config
+from broadcaster import PhotoPayload, run_broadcast
+from broadcaster.simulation import add_simulation_arguments, run_simulation
 
 # Configure logging
 logging.basicConfig(
@@ -29,115 +24,14 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Rate limiting settings
-MESSAGES_PER_BATCH = 20  # Send 20 messages
-REST_TIME = 5  # Rest for 5 seconds between batches
 
-
-def get_all_users() -> List[int]:
-    """Get all user IDs from database"""
+async def broadcast_photo(photo_path: str, caption: str, resume: Optional[int] = None):
+    """Broadcast photo with caption to all users (uploaded once, then sent by file_id)"""
     try:
-        conn = sqlite3.connect(config.DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT user_id FROM users")
-        rows = cursor.fetchall()
-        conn.close()
-        
-        user_ids = [row[0] for row in rows]
-        logger.info(f"Found {len(user_ids)} users in database")
-        return user_ids
-    except Exception as e:
-        logger.error(f"Error getting users from database: {e}")
-        return []
-
-
-async def send_photo_to_user(bot: Bot, user_id: int, photo: FSInputFile, caption: str) -> bool:
-    """Send photo with caption to a single user"""
-    try:
-        await bot.send_photo(chat_id=user_id, photo=photo, caption=caption)
-        logger.info(f"✓ Photo sent to user {user_id}")
-        return True
-    except Exception as e:
-        logger.warning(f"✗ Failed to send photo to user {user_id}: {e}")
-        return False
-
-
-async def broadcast_photo(photo_path: str, caption: str):
-    """Broadcast photo with caption to all users with rate limiting"""
-    # Validate photo file
-    if not os.path.exists(photo_path):
-        logger.error(f"Photo file not found: {photo_path}")
-        sys.exit(1)
-    
-    # Validate configuration
-    if config.BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
-        logger.error("Bot token not configured! Please set BOT_TOKEN in environment")
+        await run_broadcast(PhotoPayload(photo_path, caption=caption), resume=resume)
+    except FileNotFoundError as e:
+        logger.error(str(e))
         sys.exit(1)
-    
-    # Initialize bot
-    bot = Bot(
-        token=config.BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
-    
-    # Get all users
-    user_ids = get_all_users()
-    
-    if not user_ids:
-        logger.warning("No users found in database")
-        await bot.session.close()
-        return
-    
-    total_users = len(user_ids)
-    successful = 0
-    failed = 0
-    
-    logger.info(f"Starting photo broadcast to {total_users} users...")
-    logger.info(f"Photo: {photo_path}")
-    logger.info(f"Caption: {caption}")
-    logger.info(f"Rate limiting: {MESSAGES_PER_BATCH} messages per batch, {REST_TIME}s rest between batches")
-    
-    try:
-        # Process users in batches
-        for i in range(0, total_users, MESSAGES_PER_BATCH):
-            batch = user_ids[i:i + MESSAGES_PER_BATCH]
-            batch_number = (i // MESSAGES_PER_BATCH) + 1
-            total_batches = (total_users + MESSAGES_PER_BATCH - 1) // MESSAGES_PER_BATCH
-            
-            logger.info(f"\n--- Batch {batch_number}/{total_batches} ({len(batch)} users) ---")
-            
-            # Send photos to users in current batch
-            for user_id in batch:
-                # Create a new FSInputFile for each user
-                photo = FSInputFile(photo_path)
-                result = await send_photo_to_user(bot, user_id, photo, caption)
-                if result:
-                    successful += 1
-                else:
-                    failed += 1
-                
-                # Small delay between individual messages (0.05 seconds)
-                await asyncio.sleep(0.05)
-            
-            # Rest between batches (except for the last batch)
-            if i + MESSAGES_PER_BATCH < total_users:
-                logger.info(f"Resting for {REST_TIME} seconds before next batch...")
-                await asyncio.sleep(REST_TIME)
-        
-        # Print summary
-        logger.info("\n" + "="*50)
-        logger.info("BROADCAST SUMMARY")
-        logger.info("="*50)
-        logger.info(f"Total users: {total_users}")
-        logger.info(f"Successful: {successful}")
-        logger.info(f"Failed: {failed}")
-        logger.info(f"Success rate: {(successful/total_users*100):.2f}%")
-        logger.info("="*50)
-        
-    finally:
-        await bot.session.close()
-        logger.info("Bot session closed")
 
 
 def main():
@@ -149,6 +43,8 @@ def main():
 Examples:
   python broadcast_photo.py assets/banner.jpg "Check out our new feature!"
   python broadcast_photo.py path/to/image.jpg "🎉 Special announcement!"
+  python broadcast_photo.py --resume 12 assets/banner.jpg "Check out our new feature!"
+  python broadcast_photo.py --simulate assets/banner.jpg "Check out our new feature!"
         """
     )
     
@@ -162,14 +58,29 @@ Examples:
         help='Caption text for the photo'
     )
     
+    parser.add_argument(
+        '--resume',
+        type=int,
+        metavar='CAMPAIGN_ID',
+        help='Continue an interrupted campaign (same content) with the users it has not reached'
+    )
+    
+    add_simulation_arguments(parser)
+    
     args = parser.parse_args()
     
+    if args.simulate:
+        run_simulation(PhotoPayload(args.photo, caption=args.caption), args)
+        return
+    
     # Confirm broadcast
     print("\n" + "="*50)
     print("PHOTO BROADCAST CONFIRMATION")
     print("="*50)
     print(f"Photo: {args.photo}")
     print(f"Caption: {args.caption}")
+    if args.resume:
+        print(f"Resuming campaign #{args.resume}")
     print("="*50)
     
     confirmation = input("\nAre you sure you want to send this photo to all users? (yes/no): ")
@@ -182,7 +93,7 @@ Examples:
     
     # Run broadcast
     try:
-        asyncio.run(broadcast_photo(args.photo, args.caption))
+        asyncio.run(broadcast_photo(args.photo, args.caption, args.resume))
     except KeyboardInterrupt:
         logger.info("\nBroadcast interrupted by user")
     except Exception as e:
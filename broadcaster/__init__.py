@@ -0,0 +1,31 @@
+"""
+Broadcast engine
+Sends one payload (text, photo, photo sequence or album, with optional
+inline keyboard) to every user through a pool of worker coroutines paced by
+the shared outbound limiter. Every broadcast is a campaign whose per-recipient
+outcomes are journaled, so an interrupted one can be resumed. The broadcast
+scripts in the project root are presets on top of run_broadcast();
+announcements can also be defined as JSON files (see announcements.py) and
+scheduled to be sent by the bot itself (see scheduler.py).
+"""
+from .announcements import Announcement, list_announcements, load_announcement
+from .engine import Broadcaster, BroadcastStats, log_summary, run_broadcast, start_campaign
+from .journal import (
+    BLOCKED, CHAT_NOT_FOUND, DEACTIVATED, FAILED, PENDING, PERMANENT_FAILURES, SENT, DeliveryJournal,
+    classify_failure
+)
+from .payloads import MediaGroupPayload, Payload, PhotoPayload, PhotoSequence, TextPayload
+from .recipients import iter_recipients
+from .scheduler import (
+    CANCELLED, FINISHED, PAUSED, RUNNING, SCHEDULED, CampaignRunner, campaign_payload, schedule_announcement
+)
+
+__all__ = [
+    'Broadcaster', 'BroadcastStats', 'log_summary', 'run_broadcast', 'start_campaign', 'iter_recipients',
+    'BLOCKED', 'CHAT_NOT_FOUND', 'DEACTIVATED', 'FAILED', 'PENDING', 'PERMANENT_FAILURES', 'SENT',
+    'DeliveryJournal', 'classify_failure',
+    'Payload', 'PhotoPayload', 'PhotoSequence', 'MediaGroupPayload', 'TextPayload',
+    'Announcement', 'list_announcements', 'load_announcement',
+    'CANCELLED', 'FINISHED', 'PAUSED', 'RUNNING', 'SCHEDULED', 'CampaignRunner', 'campaign_payload',
+    'schedule_announcement'
+]
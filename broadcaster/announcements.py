@@ -0,0 +1,90 @@
+"""
+Announcements defined as data
+Each JSON file in the announcements folder describes one broadcast: a title
+for the confirmation prompt, up to ten images, a caption or text and
+optional buttons. Several images are sent as one album (the buttons follow
+in a short message of their own), a single image as a photo and no image as
+a text message. Images are uploaded once and then sent by cached file_id.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from typing import List
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from media import BASE_DIR
+
+from .payloads import MediaGroupPayload, Payload, PhotoPayload, PhotoSequence, TextPayload
+
+ANNOUNCEMENTS_DIR = os.path.join(BASE_DIR, "announcements")
+
+
+@dataclass
+class Announcement:
+    """A named announcement, the payload it sends and the definition it was built from"""
+
+    name: str
+    title: str
+    payload: Payload
+    data: dict = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict) -> "Announcement":
+        """
+        Build an announcement from its JSON definition
+
+        Keys: "title", "photos" (paths relative to the project), "caption"
+        (or "text" when there are no photos), "buttons" (rows of
+        {"text", "url"} or {"text", "callback_data"}) and "button_text",
+        the message that carries the buttons under an album. "album": false
+        sends several photos one by one instead, the last one with the
+        caption and buttons.
+        """
+        photos = [path if os.path.isabs(path) else os.path.join(BASE_DIR, path) for path in data.get("photos", [])]
+        caption = data.get("caption") or data.get("text")
+        buttons = data.get("buttons")
+        reply_markup = None
+        if buttons:
+            reply_markup = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(**button) for button in row] for row in buttons
+            ])
+
+        if len(photos) > 1 and not data.get("album", True):
+            payload = PhotoSequence([PhotoPayload(path) for path in photos[:-1]]
+                                    + [PhotoPayload(photos[-1], caption=caption, reply_markup=reply_markup)])
+        elif len(photos) > 1:
+            extra = {"button_text": data["button_text"]} if data.get("button_text") else {}
+            payload = MediaGroupPayload(photos, caption=caption, reply_markup=reply_markup, **extra)
+        elif photos:
+            payload = PhotoPayload(photos[0], caption=caption, reply_markup=reply_markup)
+        elif caption:
+            payload = TextPayload(caption, reply_markup=reply_markup)
+        else:
+            raise ValueError(f"Announcement {name} has neither photos nor text")
+        return cls(name=name, title=data.get("title", name), payload=payload, data=data)
+
+
+def announcement_path(name: str) -> str:
+    """Path of an announcement given by name (e.g. "houses") or as a path to a JSON file"""
+    if name.endswith(".json") or os.sep in name:
+        return name
+    return os.path.join(ANNOUNCEMENTS_DIR, f"{name}.json")
+
+
+def load_announcement(name: str) -> Announcement:
+    """Read an announcement definition; raises FileNotFoundError or ValueError"""
+    path = announcement_path(name)
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path} is not valid JSON: {e}") from e
+    return Announcement.from_dict(os.path.splitext(os.path.basename(path))[0], data)
+
+
+def list_announcements() -> List[str]:
+    """Names of the announcements in the announcements folder"""
+    if not os.path.isdir(ANNOUNCEMENTS_DIR):
+        return []
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(ANNOUNCEMENTS_DIR) if name.endswith(".json"))
@@ -0,0 +1,287 @@
+"""
+Worker pool that delivers a payload to many users
+"""
+import asyncio
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Iterable, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+
+from config import config
+from database import adb
+from ratelimit import OutboundRateLimiter, limit_outbound, outbound_limiter
+from storage import Storage
+
+from .journal import FAILED, PERMANENT_FAILURES, SENT, DeliveryJournal, classify_failure
+from .payloads import Payload
+from .recipients import iter_recipients
+
+logger = logging.getLogger(__name__)
+
+# Seconds the sends in flight get to finish (and be journaled) when a
+# broadcast is interrupted
+STOP_GRACE = 5.0
+
+
+def clock() -> float:
+    """Time of the running event loop (virtual in a simulation), else time.monotonic()"""
+    try:
+        return asyncio.get_running_loop().time()
+    except RuntimeError:
+        return time.monotonic()
+
+
+@dataclass
+class BroadcastStats:
+    """Counters of a running or finished broadcast"""
+
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    unreachable: int = 0
+    started_at: float = field(default_factory=clock)
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.unreachable
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or clock()) - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """Recipients handled per second so far"""
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+
+class Broadcaster:
+    """
+    Deliver one payload to a list of users
+
+    A fixed pool of worker coroutines takes user IDs from a short queue, so
+    at most `workers` sends are in flight. How fast they go is decided by
+    the bot session's outbound limiter (`limiter`, used here only to report
+    the current rate), not by the broadcaster. Progress is logged every
+    `progress_interval` seconds. With a `journal`, the outcome of every
+    delivery is recorded there.
+    """
+
+    def __init__(self, bot: Bot, payload: Payload, workers: int = config.BROADCAST_WORKERS,
+                 progress_interval: float = 1.0, limiter: OutboundRateLimiter = outbound_limiter,
+                 journal: Optional[DeliveryJournal] = None):
+        self.bot = bot
+        self.payload = payload
+        self.workers = workers
+        self.limiter = limiter
+        self.journal = journal
+        self.progress_interval = progress_interval
+        self.stats = BroadcastStats()
+        self._stopping = False
+
+    async def deliver(self, user_id: int) -> str:
+        """Send the payload to one user and journal the outcome; returns the delivery status"""
+        message_id = error = None
+        try:
+            messages = await self.payload.send(self.bot, user_id)
+            message_id = messages[-1].message_id if messages else None
+            status = SENT
+            logger.debug(f"✓ Sent to user {user_id}")
+        except Exception as e:
+            status, error = classify_failure(e), str(e)
+            if status == FAILED:
+                logger.warning(f"✗ Failed to send to user {user_id}: {e}")
+            else:
+                logger.info(f"✗ User {user_id} is unreachable ({status}), suppressing: {e}")
+
+        if self.journal is not None:
+            self.journal.record(user_id, status, message_id, error)
+        return status
+
+    async def _worker(self, queue: "asyncio.Queue[Optional[int]]"):
+        while True:
+            user_id = await queue.get()
+            if user_id is None or self._stopping:
+                return
+            status = await self.deliver(user_id)
+            if status == SENT:
+                self.stats.sent += 1
+            elif status in PERMANENT_FAILURES:
+                self.stats.unreachable += 1
+            else:
+                self.stats.failed += 1
+
+    async def _report_progress(self):
+        previous = 0
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self.log_progress(previous)
+            previous = self.stats.done
+
+    def log_progress(self, previous: int = 0):
+        """Log one progress line"""
+        stats = self.stats
+        current_rate = (stats.done - previous) / self.progress_interval
+        remaining = stats.total - stats.done
+        eta = f", ETA {remaining / stats.rate:.0f}s" if stats.rate and remaining > 0 else ""
+        total = f"/{stats.total}" if stats.total else ""
+        logger.info(
+            f"Progress: {stats.done}{total} ({stats.sent} sent, {stats.failed} failed, "
+            f"{stats.unreachable} unreachable), "
+            f"{current_rate:.1f}/s now, {stats.rate:.1f}/s average, "
+            f"limit {self.limiter.global_rate:.0f} messages/s{eta}"
+        )
+
+    async def run(self, user_ids: Union[Iterable[int], AsyncIterable[int]],
+                  total: Optional[int] = None) -> BroadcastStats:
+        """
+        Send to every user and return the final counters
+
+        `user_ids` may be an async iterator such as iter_recipients(), which
+        is consumed only as fast as the workers take users. `total` is used
+        for progress reports; it defaults to len(user_ids) when there is one.
+        """
+        if total is None:
+            total = len(user_ids) if hasattr(user_ids, "__len__") else 0
+        self.stats = BroadcastStats(total=total)
+        self._stopping = False
+        queue: "asyncio.Queue[Optional[int]]" = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._report_progress())
+
+        try:
+            if isinstance(user_ids, AsyncIterable):
+                async for user_id in user_ids:
+                    await queue.put(user_id)
+            else:
+                for user_id in user_ids:
+                    await queue.put(user_id)
+            for _ in workers:
+                await queue.put(None)
+            # Unlike gather(), wait() leaves the workers running if we are cancelled
+            await asyncio.wait(workers)
+            self.stats.total = self.stats.done
+        except asyncio.CancelledError:
+            # Take no new users, but let the sends already made finish so
+            # their outcome is known
+            self._stopping = True
+            while not queue.empty():
+                queue.get_nowait()
+            for _ in workers:
+                queue.put_nowait(None)
+            await asyncio.wait(workers, timeout=STOP_GRACE)
+            raise
+        finally:
+            for task in workers:
+                task.cancel()
+            reporter.cancel()
+            self.stats.finished_at = clock()
+        return self.stats
+
+
+def log_summary(stats: BroadcastStats):
+    """Log the final counters of a broadcast"""
+    logger.info("=" * 50)
+    logger.info("BROADCAST SUMMARY")
+    logger.info("=" * 50)
+    logger.info(f"Total users: {stats.total}")
+    logger.info(f"Successful: {stats.sent}")
+    logger.info(f"Failed: {stats.failed}")
+    logger.info(f"Unreachable (now suppressed): {stats.unreachable}")
+    if stats.total:
+        logger.info(f"Success rate: {stats.sent / stats.total * 100:.2f}%")
+    logger.info(f"Duration: {stats.elapsed:.1f}s ({stats.rate:.1f} users/s)")
+    logger.info("=" * 50)
+
+
+async def start_campaign(payload: Payload, resume: Optional[int] = None,
+                         storage: Storage = adb) -> Tuple[Optional[int], int]:
+    """
+    Create a campaign for every deliverable user, or reopen one to resume it
+
+    Returns:
+        (campaign ID, estimated number of recipients left); no campaign ID
+        if it can't be created or resumed
+    """
+    if resume is None:
+        campaign_id = await storage.create_campaign(payload.describe(), payload.fingerprint())
+        campaign = await storage.get_campaign(campaign_id) if campaign_id is not None else None
+        if campaign is None:
+            logger.error("Could not create the campaign")
+            return None, 0
+        logger.info(f"Campaign #{campaign_id} created for {campaign['total']} users")
+        return campaign_id, campaign['total']
+
+    campaign = await storage.get_campaign(resume)
+    if campaign is None:
+        logger.error(f"Campaign #{resume} not found")
+        return None, 0
+    if campaign['fingerprint'] != payload.fingerprint():
+        logger.error(f"Campaign #{resume} was started with a different payload: {campaign['description']}")
+        return None, 0
+
+    deliveries = campaign['deliveries']
+    sent = deliveries.get(SENT, 0)
+    unreachable = sum(deliveries.get(status, 0) for status in PERMANENT_FAILURES)
+    logger.info(
+        f"Resuming campaign #{resume}: {sent} sent, {unreachable} unreachable, "
+        f"continuing after user {campaign['last_user_id']}"
+    )
+    return resume, max(campaign['total'] - sent - unreachable, 0)
+
+
+async def run_broadcast(payload: Payload, workers: int = config.BROADCAST_WORKERS,
+                        resume: Optional[int] = None) -> BroadcastStats:
+    """
+    Send a payload to every user with a rate-limited bot
+
+    Every broadcast is a campaign with a delivery journal; recipients are
+    streamed from the database page by page. Pass the ID of an interrupted
+    campaign as `resume` to send only to the users it has not reached yet
+    (pending ones, those that failed, and everyone past its cursor). Opens
+    the bot session, sends, logs a summary and closes the bot and the
+    storage backend.
+    """
+    if config.BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
+        logger.error("Bot token not configured! Please set BOT_TOKEN in environment")
+        sys.exit(1)
+    payload.validate()
+
+    bot = limit_outbound(Bot(
+        token=config.BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    ))
+    try:
+        campaign_id, remaining = await start_campaign(payload, resume)
+        if campaign_id is None:
+            return BroadcastStats()
+        if resume is None and not remaining:
+            logger.warning("No users found in database")
+            await adb.finish_campaign(campaign_id)
+            return BroadcastStats()
+
+        logger.info(f"Starting broadcast to ~{remaining} users: {payload.describe()}")
+        logger.info(f"Rate limit: {config.OUTBOUND_GLOBAL_RATE:g} messages/s, {workers} workers")
+        try:
+            async with DeliveryJournal(adb, campaign_id) as journal:
+                broadcaster = Broadcaster(bot, payload, workers=workers, journal=journal)
+                stats = await broadcaster.run(iter_recipients(adb, campaign_id), total=remaining)
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            logger.warning(f"Campaign #{campaign_id} stopped; continue it with --resume {campaign_id}")
+            raise
+
+        await adb.finish_campaign(campaign_id)
+        log_summary(stats)
+        if stats.failed:
+            logger.info(f"Retry the failed deliveries with --resume {campaign_id}")
+        return stats
+    finally:
+        await bot.session.close()
+        await adb.close()
+        logger.info("Bot session closed")
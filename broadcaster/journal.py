@@ -0,0 +1,119 @@
+"""
+Per-recipient delivery journal of a broadcast campaign
+"""
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+
+from config import config
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Delivery statuses
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+DEACTIVATED = "deactivated"
+CHAT_NOT_FOUND = "chat_not_found"
+
+# Failures that will repeat on every send: the user is suppressed
+# (users.delivery_status) until they /start the bot again
+PERMANENT_FAILURES = (BLOCKED, DEACTIVATED, CHAT_NOT_FOUND)
+
+
+def classify_failure(error: Exception) -> str:
+    """Delivery status for an exception raised by a send; FAILED means worth retrying"""
+    message = str(error).lower()
+    if isinstance(error, TelegramForbiddenError):
+        # "user is deactivated" or "bot was blocked by the user" (and other
+        # refusals such as "bot can't initiate conversation with a user")
+        return DEACTIVATED if "deactivated" in message else BLOCKED
+    if isinstance(error, (TelegramBadRequest, TelegramNotFound)) and (
+            "chat not found" in message or "peer_id_invalid" in message):
+        return CHAT_NOT_FOUND
+    return FAILED
+
+
+class DeliveryJournal:
+    """
+    Buffered writer of delivery outcomes
+
+    Workers call record(), which only appends to a list; a single writer task
+    stores the list in one transaction once batch_size outcomes are waiting
+    or flush_interval seconds have passed, so sending never waits for the
+    database. Users with a permanent failure are suppressed in the same
+    flush. Whatever is still buffered is written on close().
+    """
+
+    def __init__(self, storage: Storage, campaign_id: int, batch_size: int = config.JOURNAL_BATCH_SIZE,
+                 flush_interval: float = config.JOURNAL_FLUSH_INTERVAL):
+        self.storage = storage
+        self.campaign_id = campaign_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.flushes = 0
+        self.suppressed = 0
+        self._buffer: List[Tuple[int, str, Optional[int], Optional[str]]] = []
+        self._full = asyncio.Event()
+        self._closing = False
+        self._writer: Optional[asyncio.Task] = None
+
+    def record(self, user_id: int, status: str, message_id: Optional[int] = None, error: Optional[str] = None):
+        """Queue the outcome of one delivery"""
+        self._buffer.append((user_id, status, message_id, error))
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    async def flush(self):
+        """Write the buffered outcomes; on failure they are kept for the next try"""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        if not await self.storage.record_deliveries(self.campaign_id, batch):
+            self._buffer[:0] = batch
+            return
+        self.written += len(batch)
+        self.flushes += 1
+
+        unreachable = [(user_id, status) for user_id, status, _, _ in batch if status in PERMANENT_FAILURES]
+        if unreachable and await self.storage.suppress_users(unreachable) > 0:
+            self.suppressed += len(unreachable)
+
+    async def _write_periodically(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    def start(self):
+        """Start the writer task"""
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_periodically())
+
+    async def close(self):
+        """Stop the writer task and write what is left"""
+        # The writer is woken rather than cancelled, so a batch is never
+        # abandoned halfway through its transaction
+        self._closing = True
+        self._full.set()
+        if self._writer is not None:
+            await self._writer
+            self._writer = None
+        await self.flush()
+        if self._buffer:
+            logger.error(f"Campaign #{self.campaign_id}: {len(self._buffer)} delivery outcomes could not be saved")
+
+    async def __aenter__(self) -> "DeliveryJournal":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
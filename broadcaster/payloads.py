@@ -0,0 +1,126 @@
+"""
+What a broadcast sends to each recipient
+"""
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from media import send_media_group, send_photo
+
+
+def excerpt(text: str, length: int = 50) -> str:
+    """Start of a text on one line, for describe()"""
+    return " ".join(text.split())[:length]
+
+
+class Payload(ABC):
+    """Content sent to every recipient of a broadcast"""
+
+    @abstractmethod
+    async def send(self, bot: Bot, chat_id: int) -> List[Message]:
+        """Deliver the payload to one chat and return the sent messages"""
+
+    def validate(self):
+        """Raise if the payload can't be sent (e.g. a missing image file)"""
+
+    @abstractmethod
+    def describe(self) -> str:
+        """One-line summary for logs and confirmation prompts"""
+
+    def fingerprint(self) -> str:
+        """Short hash of the content, so a campaign is only resumed with the same payload"""
+        return hashlib.sha256(repr(self).encode()).hexdigest()[:16]
+
+
+@dataclass
+class TextPayload(Payload):
+    """A text message, optionally with an inline keyboard"""
+
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+
+    async def send(self, bot: Bot, chat_id: int) -> List[Message]:
+        return [await bot.send_message(chat_id=chat_id, text=self.text, reply_markup=self.reply_markup)]
+
+    def describe(self) -> str:
+        return f"text: {excerpt(self.text)}"
+
+
+@dataclass
+class PhotoPayload(Payload):
+    """A local image with optional caption and keyboard, uploaded once and then sent by file_id"""
+
+    path: str
+    caption: Optional[str] = None
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+
+    async def send(self, bot: Bot, chat_id: int) -> List[Message]:
+        return [await send_photo(bot, chat_id, self.path, caption=self.caption, reply_markup=self.reply_markup)]
+
+    def validate(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Photo file not found: {self.path}")
+
+    def describe(self) -> str:
+        caption = f", caption: {excerpt(self.caption)}" if self.caption else ""
+        return f"photo {self.path}{caption}"
+
+
+@dataclass
+class PhotoSequence(Payload):
+    """Several photos sent one after another to each recipient"""
+
+    photos: List[PhotoPayload] = field(default_factory=list)
+
+    async def send(self, bot: Bot, chat_id: int) -> List[Message]:
+        messages = []
+        for photo in self.photos:
+            messages.extend(await photo.send(bot, chat_id))
+        return messages
+
+    def validate(self):
+        for photo in self.photos:
+            photo.validate()
+
+    def describe(self) -> str:
+        return "; ".join(photo.describe() for photo in self.photos)
+
+
+@dataclass
+class MediaGroupPayload(Payload):
+    """
+    Local images sent as one album, uploaded once and then sent by file_id
+
+    Albums can't carry an inline keyboard, so with a `reply_markup` a short
+    follow-up message (`button_text`) holds the keyboard.
+    """
+
+    paths: List[str] = field(default_factory=list)
+    caption: Optional[str] = None
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+    button_text: str = "👇"
+
+    async def send(self, bot: Bot, chat_id: int) -> List[Message]:
+        messages = await send_media_group(bot, chat_id, self.paths, caption=self.caption)
+        if self.reply_markup is not None:
+            messages.append(await bot.send_message(chat_id=chat_id, text=self.button_text,
+                                                   reply_markup=self.reply_markup))
+        return messages
+
+    def validate(self):
+        if not 2 <= len(self.paths) <= 10:
+            raise ValueError(f"An album needs 2 to 10 photos, got {len(self.paths)}")
+        for path in self.paths:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Photo file not found: {path}")
+        if self.caption and len(self.caption) > 1024:
+            raise ValueError(f"Album caption is {len(self.caption)} characters, Telegram allows 1024")
+
+    def describe(self) -> str:
+        caption = f", caption: {excerpt(self.caption)}" if self.caption else ""
+        return f"album {', '.join(self.paths)}{caption}"
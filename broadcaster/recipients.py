@@ -0,0 +1,41 @@
+"""
+Recipients of a campaign, streamed from the storage backend
+"""
+from typing import AsyncIterator
+
+from config import config
+from storage import Storage
+
+
+async def iter_recipients(storage: Storage, campaign_id: int,
+                          page_size: int = config.BROADCAST_PAGE_SIZE) -> AsyncIterator[int]:
+    """
+    Yield the user IDs a campaign still has to send to, one page at a time
+
+    First the journaled recipients that are pending or failed (left over
+    from an interrupted run), then fresh users claimed past the campaign's
+    cursor. Only one page is held at a time, so memory does not grow with
+    the audience and the first send waits for one small query only.
+
+    Raises:
+        RuntimeError: If a page can't be read; the campaign stays resumable
+    """
+    after_user_id = 0
+    while True:
+        page = await storage.get_campaign_recipients(campaign_id, after_user_id, page_size)
+        if page is None:
+            raise RuntimeError(f"Could not read the recipients of campaign #{campaign_id}")
+        if not page:
+            break
+        for user_id in page:
+            yield user_id
+        after_user_id = page[-1]
+
+    while True:
+        page = await storage.claim_campaign_recipients(campaign_id, page_size)
+        if page is None:
+            raise RuntimeError(f"Could not read the recipients of campaign #{campaign_id}")
+        if not page:
+            return
+        for user_id in page:
+            yield user_id
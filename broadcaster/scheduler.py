@@ -0,0 +1,191 @@
+"""
+Scheduled campaigns, run inside the bot's process
+The admin schedules an announcement (or a text) with /schedule; the runner
+started by main.py claims the campaign once it is due and broadcasts it
+through the bot's own session at BACKGROUND priority, so replies to users
+always go out first. Pausing or cancelling stops the broadcast; a paused
+campaign continues from its cursor when started again, and one cut off by a
+restart is picked up again when the bot is back.
+"""
+import asyncio
+import html
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+
+from aiogram import Bot
+
+from config import config
+from database import adb
+from ratelimit import BACKGROUND, outbound_priority
+from storage import Storage
+
+from .announcements import Announcement
+from .engine import Broadcaster, BroadcastStats, log_summary, start_campaign
+from .journal import DeliveryJournal
+from .payloads import Payload
+from .recipients import iter_recipients
+
+logger = logging.getLogger(__name__)
+
+# Campaign statuses
+SCHEDULED = "scheduled"
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+FINISHED = "finished"
+
+# Seconds between progress lines of a scheduled broadcast in the bot's log
+PROGRESS_INTERVAL = 60.0
+
+
+def campaign_payload(campaign: dict) -> Payload:
+    """Rebuild a scheduled campaign's payload; raises ValueError or FileNotFoundError"""
+    if not campaign.get('payload'):
+        raise ValueError(f"Campaign #{campaign['campaign_id']} was sent by a script and has no stored payload")
+    announcement = Announcement.from_dict(f"campaign-{campaign['campaign_id']}", json.loads(campaign['payload']))
+    announcement.payload.validate()
+    return announcement.payload
+
+
+async def schedule_announcement(announcement: Announcement, scheduled_at: datetime,
+                                storage: Storage = adb) -> Optional[int]:
+    """
+    Store an announcement as a campaign that starts at scheduled_at
+
+    Raises:
+        FileNotFoundError, ValueError: If the announcement can't be sent
+
+    Returns:
+        The campaign ID, or None if it could not be stored
+    """
+    payload = announcement.payload
+    payload.validate()
+    return await storage.schedule_campaign(payload.describe(), payload.fingerprint(),
+                                           json.dumps(announcement.data, ensure_ascii=False), scheduled_at)
+
+
+class CampaignRunner:
+    """
+    Background task that executes scheduled campaigns one at a time
+
+    Every poll_interval seconds, or right away after wake(), it claims the
+    campaign due first and broadcasts it with a delivery journal. While one
+    runs, its status is re-read on every poll: once it was paused or
+    cancelled, the broadcast stops and the sends in flight are journaled.
+    The admin gets a message when a campaign starts and ends. The
+    broadcast's messages are sent with `priority` (see ratelimit.py).
+    """
+
+    def __init__(self, bot: Bot, storage: Storage = adb, poll_interval: float = config.CAMPAIGN_POLL_INTERVAL,
+                 workers: int = config.BROADCAST_WORKERS, priority: int = BACKGROUND):
+        self.bot = bot
+        self.storage = storage
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self.priority = priority
+        self.campaign_id: Optional[int] = None
+        self.broadcaster: Optional[Broadcaster] = None
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        """Look at the schedule now instead of at the next poll (e.g. after an admin command)"""
+        self._wakeup.set()
+
+    async def _wait(self, task: Optional[asyncio.Task] = None):
+        """Sleep until the next poll, a wake() or the end of `task`"""
+        waiter = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            await asyncio.wait([waiter, task] if task else [waiter], timeout=self.poll_interval,
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        self._wakeup.clear()
+
+    async def _notify(self, text: str):
+        """Tell the admin; failures are only logged"""
+        if not config.ADMIN_USER_ID:
+            return
+        try:
+            await self.bot.send_message(config.ADMIN_USER_ID, text)
+        except Exception as e:
+            logger.warning(f"Could not notify the admin: {e}")
+
+    async def run(self):
+        """Execute due campaigns until cancelled"""
+        # Campaigns still running were cut off by a restart; scripts' campaigns have no payload
+        for campaign in await self.storage.get_campaigns([RUNNING], limit=100):
+            if campaign['payload'] and await self.storage.set_campaign_status(
+                    campaign['campaign_id'], SCHEDULED, [RUNNING]):
+                logger.info(f"Campaign #{campaign['campaign_id']} was interrupted, it will be resumed")
+
+        logger.info(f"Campaign runner started (polling every {self.poll_interval:g}s)")
+        while True:
+            campaign = await self.storage.claim_due_campaign()
+            if campaign is None:
+                await self._wait()
+            else:
+                await self.execute(campaign)
+
+    async def execute(self, campaign: dict) -> Optional[BroadcastStats]:
+        """Broadcast a claimed campaign until it is done, paused or cancelled"""
+        campaign_id = campaign['campaign_id']
+        self.campaign_id = campaign_id
+        await self._notify(f"▶️ Kampaniya #{campaign_id} boshlandi: {html.escape(campaign['description'])}")
+        task = asyncio.create_task(self._broadcast(campaign))
+        try:
+            while not task.done():
+                await self._wait(task)
+                if task.done():
+                    break
+                current = await self.storage.get_campaign(campaign_id)
+                if current is not None and current['status'] != RUNNING:
+                    logger.info(f"Campaign #{campaign_id} is {current['status']}, stopping its broadcast")
+                    task.cancel()
+                    await asyncio.wait([task])
+        except asyncio.CancelledError:
+            # The bot is stopping: let the sends in flight be journaled and
+            # leave the campaign running, so it is resumed after the restart
+            task.cancel()
+            await asyncio.wait([task])
+            raise
+        finally:
+            self.campaign_id = None
+            self.broadcaster = None
+
+        if task.cancelled():
+            return None
+        error = task.exception()
+        if error is not None:
+            logger.error(f"Campaign #{campaign_id} failed: {error}")
+            await self.storage.set_campaign_status(campaign_id, PAUSED, [RUNNING])
+            await self._notify(f"⚠️ Kampaniya #{campaign_id} to'xtatildi: {html.escape(str(error))}")
+            return None
+
+        stats = task.result()
+        await self._notify(
+            f"✅ Kampaniya #{campaign_id} tugadi: {stats.sent} ta yuborildi, {stats.failed} ta xato, "
+            f"{stats.unreachable} ta yetib bormadi ({stats.elapsed:.0f}s)"
+        )
+        return stats
+
+    async def _broadcast(self, campaign: dict) -> BroadcastStats:
+        """Send the campaign's payload to the recipients it has not reached yet"""
+        # This task and the workers it starts send behind the handlers' replies
+        outbound_priority.set(self.priority)
+        payload = campaign_payload(campaign)
+        campaign_id, remaining = await start_campaign(payload, resume=campaign['campaign_id'], storage=self.storage)
+        if campaign_id is None:
+            raise ValueError(f"Campaign #{campaign['campaign_id']} does not match its stored payload")
+
+        logger.info(f"Running campaign #{campaign_id} for ~{remaining} users: {payload.describe()}")
+        async with DeliveryJournal(self.storage, campaign_id) as journal:
+            self.broadcaster = Broadcaster(self.bot, payload, workers=self.workers,
+                                           progress_interval=PROGRESS_INTERVAL, journal=journal)
+            stats = await self.broadcaster.run(iter_recipients(self.storage, campaign_id), total=remaining)
+
+        # Not finish_campaign(): a pause or cancel that came in at the very end stands
+        await self.storage.set_campaign_status(campaign_id, FINISHED, [RUNNING])
+        log_summary(stats)
+        return stats
@@ -0,0 +1,441 @@
+"""
+Broadcast duration planner
+Runs a broadcast through the real engine (worker pool, outbound limiter with
+its retries, delivery journal, recipient cursor and --resume) against a fake
+Bot API on an event loop with a virtual clock, so a campaign that would take
+hours is predicted in seconds and nothing is sent. The audience is read from
+the real storage; campaigns and journal rows are written to a throwaway
+SQLite copy.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import logging
+import os
+import random
+import selectors
+import sys
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Deque, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import SendMediaGroup, TelegramMethod
+from aiogram.types import Chat, Message, PhotoSize
+
+import database
+from config import config
+from media import media
+from ratelimit import OutboundRateLimiter
+from storage import Storage
+
+from .engine import Broadcaster, BroadcastStats, start_campaign
+from .journal import DeliveryJournal
+from .payloads import Payload
+from .recipients import iter_recipients
+
+logger = logging.getLogger(__name__)
+
+# Rows of the throughput table
+CURVE_ROWS = 10
+
+
+class _SkippingSelector(selectors.DefaultSelector):
+    """Selector that skips the loop's clock ahead instead of sleeping"""
+
+    loop: "VirtualClockEventLoop"
+
+    def select(self, timeout=None):
+        if timeout is None or timeout <= 0 or self.loop.busy():
+            return super().select(timeout)
+        events = super().select(0)
+        if not events:
+            self.loop.skip(timeout)
+        return events
+
+
+class VirtualClockEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose clock jumps to the next timer whenever nothing is ready
+
+    Sleeps, timeouts and call_later() take no real time, so code paced by
+    asyncio.sleep() runs as fast as the CPU allows while seeing the times it
+    would see for real. While `busy()` is true (e.g. a database job is
+    running on a thread) the loop waits and its clock runs in real time.
+    """
+
+    def __init__(self):
+        selector = _SkippingSelector()
+        selector.loop = self
+        super().__init__(selector)
+        self.skipped = 0.0
+        self.busy = lambda: False
+
+    def time(self) -> float:
+        return super().time() + self.skipped
+
+    def skip(self, seconds: float):
+        """Move the clock forward"""
+        self.skipped += seconds
+
+
+class _TrackedExecutor(database.DatabaseExecutor):
+    """DatabaseExecutor that counts the jobs in flight"""
+
+    in_flight = 0
+
+    async def submit(self, func, *args, **kwargs):
+        self.in_flight += 1
+        try:
+            return await super().submit(func, *args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+@dataclass
+class SimulationModel:
+    """How the fake Bot API behaves"""
+
+    latency: float = config.SIMULATE_LATENCY
+    blocked: float = config.SIMULATE_BLOCKED
+    errors: float = config.SIMULATE_ERRORS
+    flood: float = config.SIMULATE_FLOOD
+    rate_limit: float = config.SIMULATE_RATE_LIMIT
+    seed: int = 0
+
+
+class SimulatedSession(BaseSession):
+    """
+    Bot session that answers like Telegram without touching the network
+
+    Latency is gamma-distributed around the model's mean. Users in `blocked`
+    get "bot was blocked by the user". Messages over `rate_limit` per second
+    (album items count one each) and a random share of calls get a 429;
+    another random share fails with a server error.
+    """
+
+    def __init__(self, model: SimulationModel, blocked: Set[int]):
+        super().__init__()
+        self.model = model
+        self.blocked = blocked
+        self.rng = random.Random(model.seed)
+        self.calls = 0
+        self.flood_waits = 0
+        self.errors = 0
+        self._sent: Deque[float] = deque()
+        self._message_ids = itertools.count(1)
+
+    def _over_limit(self, messages: int) -> bool:
+        now = asyncio.get_running_loop().time()
+        while self._sent and self._sent[0] <= now - 1.0:
+            self._sent.popleft()
+        if len(self._sent) + messages > max(self.model.rate_limit, messages):
+            return True
+        self._sent.extend([now] * messages)
+        return False
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        self.calls += 1
+        # Telegram sees the request half way through the round trip
+        latency = self.rng.gammavariate(4, self.model.latency / 4) if self.model.latency else 0.0
+        await asyncio.sleep(latency / 2)
+        try:
+            return self._answer(method)
+        finally:
+            await asyncio.sleep(latency / 2)
+
+    def _answer(self, method: TelegramMethod):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not type(method).__name__.startswith(("Send", "Copy", "Forward")):
+            return True
+        messages = len(method.media) if isinstance(method, SendMediaGroup) else 1
+        if self.rng.random() < self.model.flood or self._over_limit(messages):
+            self.flood_waits += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests: retry after 1", retry_after=1)
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+        if self.rng.random() < self.model.errors:
+            self.errors += 1
+            raise TelegramServerError(method=method, message="Bad Gateway")
+
+        if isinstance(method, SendMediaGroup):
+            return [self._message(chat_id) for _ in method.media]
+        return self._message(chat_id)
+
+    def _message(self, chat_id: int) -> Message:
+        message_id = next(self._message_ids)
+        return Message(
+            message_id=message_id,
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            photo=[PhotoSize(file_id=f"simulated-{message_id}", file_unique_id="simulated", width=1, height=1)],
+        )
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True):
+        yield b""
+
+
+@dataclass
+class SimulatedPass:
+    """One run over the campaign: the first one or a --resume"""
+
+    stats: BroadcastStats
+    calls: int
+    flood_waits: int
+    # (seconds since the start, recipients done) once per simulated second
+    curve: List[Tuple[float, int]] = field(default_factory=list)
+
+
+@dataclass
+class SimulationReport:
+    """Predicted outcome of a broadcast"""
+
+    recipients: int
+    workers: int
+    model: SimulationModel
+    passes: List[SimulatedPass] = field(default_factory=list)
+    simulated_in: float = 0.0
+
+
+async def read_audience(storage: Storage, payload: Payload, resume: Optional[int] = None,
+                        page_size: int = config.BROADCAST_PAGE_SIZE) -> Optional[List[int]]:
+    """
+    User IDs a broadcast (or the resume of campaign `resume`) would send to
+
+    Only reads from `storage`; closing it is up to the caller. Returns None
+    if the campaign to resume can't be used.
+    """
+    if resume is None:
+        return await storage.get_all_user_ids(deliverable_only=True)
+
+    campaign_id, _ = await start_campaign(payload, resume, storage=storage)
+    if campaign_id is None:
+        return None
+    user_ids: List[int] = []
+    after = 0
+    while True:
+        page = await storage.get_campaign_recipients(resume, after, page_size)
+        if page is None:
+            raise RuntimeError(f"Could not read the recipients of campaign #{resume}")
+        if not page:
+            break
+        user_ids.extend(page)
+        after = page[-1]
+    after = (await storage.get_campaign(resume))['last_user_id']
+    while True:
+        page = await storage.get_user_ids_page(after, page_size, deliverable_only=True)
+        if not page:
+            break
+        user_ids.extend(page)
+        after = page[-1]
+    return user_ids
+
+
+async def _simulate_pass(storage: Storage, payload: Payload, campaign_id: int, total: int, workers: int,
+                         model: SimulationModel, blocked: Set[int]) -> SimulatedPass:
+    """Run the campaign's remaining recipients through the engine once"""
+    session = SimulatedSession(model, blocked)
+    bot = Bot(token="42:SIMULATED", session=session)
+    limiter = OutboundRateLimiter(
+        global_rate=config.OUTBOUND_GLOBAL_RATE,
+        global_burst=config.OUTBOUND_GLOBAL_BURST,
+        chat_rate=config.OUTBOUND_CHAT_RATE,
+        chat_burst=config.OUTBOUND_CHAT_BURST,
+        group_rate=config.OUTBOUND_GROUP_RATE
+    )
+    bot.session.middleware(limiter)
+    broadcaster = Broadcaster(bot, payload, workers=workers, progress_interval=3600, limiter=limiter)
+
+    curve: List[Tuple[float, int]] = []
+
+    async def sample():
+        while True:
+            curve.append((broadcaster.stats.elapsed, broadcaster.stats.done))
+            await asyncio.sleep(1)
+
+    async with DeliveryJournal(storage, campaign_id) as journal:
+        broadcaster.journal = journal
+        sampler = asyncio.create_task(sample())
+        try:
+            stats = await broadcaster.run(iter_recipients(storage, campaign_id), total=total)
+        finally:
+            sampler.cancel()
+    curve.append((stats.elapsed, stats.done))
+    return SimulatedPass(stats=stats, calls=session.calls, flood_waits=session.flood_waits, curve=curve)
+
+
+async def _simulate(storage: Storage, payload: Payload, report: SimulationReport, blocked: Set[int]):
+    """First pass, then one --resume if anything failed"""
+    loop = asyncio.get_running_loop()
+    if isinstance(loop, VirtualClockEventLoop):
+        loop.busy = lambda: storage.executor.in_flight > 0
+
+    campaign_id, remaining = await start_campaign(payload, storage=storage)
+    if campaign_id is None:
+        raise RuntimeError("Could not create the simulated campaign")
+    first = await _simulate_pass(storage, payload, campaign_id, remaining, report.workers, report.model, blocked)
+    report.passes.append(first)
+    if first.stats.failed:
+        _, remaining = await start_campaign(payload, campaign_id, storage=storage)
+        report.passes.append(
+            await _simulate_pass(storage, payload, campaign_id, remaining, report.workers, report.model, blocked)
+        )
+
+
+def simulate_broadcast(payload: Payload, audience: List[int], workers: int = config.BROADCAST_WORKERS,
+                       model: Optional[SimulationModel] = None,
+                       loop_factory: Callable[[], asyncio.AbstractEventLoop] = VirtualClockEventLoop
+                       ) -> SimulationReport:
+    """
+    Predict how a broadcast to `audience` would go, without sending anything
+
+    Copies the audience (see read_audience) into a temporary SQLite database
+    and broadcasts to it on a VirtualClockEventLoop (or the loop
+    `loop_factory` makes) through a SimulatedSession.
+    """
+    model = model or SimulationModel()
+    payload.validate()
+
+    rng = random.Random(model.seed)
+    blocked = set(rng.sample(audience, round(len(audience) * model.blocked)))
+    report = SimulationReport(recipients=len(audience), workers=workers, model=model)
+    started = time.perf_counter()
+    previous_storage = media.storage
+    with tempfile.TemporaryDirectory() as tmp:
+        sandbox = database.Database(os.path.join(tmp, "simulation.db"))
+        with sandbox.pool.writer() as conn:
+            conn.executemany("INSERT INTO users (user_id) VALUES (?)", ((user_id,) for user_id in audience))
+        storage = database.AsyncDatabase(sandbox, executor=_TrackedExecutor(
+            workers=config.DB_EXECUTOR_WORKERS,
+            max_queue=config.DB_EXECUTOR_QUEUE_SIZE
+        ))
+        # Uploads made in the simulation must not reach the real media cache
+        media.storage = storage
+        # Thousands of simulated failures would drown the report
+        logging.disable(logging.WARNING)
+        loop = loop_factory()
+        try:
+            loop.run_until_complete(_simulate(storage, payload, report, blocked))
+        finally:
+            # What asyncio.run() does on exit, for a loop it did not create
+            try:
+                pending = asyncio.all_tasks(loop)
+                if pending:
+                    for task in pending:
+                        task.cancel()
+                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                loop.close()
+            logging.disable(logging.NOTSET)
+            media.storage = previous_storage
+            storage.executor.shutdown()
+            sandbox.close()
+    report.simulated_in = time.perf_counter() - started
+    return report
+
+
+def format_duration(seconds: float) -> str:
+    """1h 02m 03s style"""
+    seconds = round(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m {seconds:02d}s"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+def print_report(report: SimulationReport):
+    """Print the predicted duration, throughput curve and failures"""
+    model = report.model
+    print("\n" + "=" * 60)
+    print("BROADCAST SIMULATION (nothing was sent)")
+    print("=" * 60)
+    print(f"Recipients: {report.recipients}, {report.workers} workers, "
+          f"limit {config.OUTBOUND_GLOBAL_RATE:g} messages/s")
+    print(f"Assumed: {model.latency * 1000:.0f} ms latency, {model.blocked:.1%} blocked, "
+          f"{model.errors:.2%} errors, {model.flood:.2%} extra 429s, Telegram limit {model.rate_limit:g}/s")
+
+    for number, simulated in enumerate(report.passes):
+        stats = simulated.stats
+        print("\n" + ("Broadcast" if number == 0 else "Then --resume (retries the failed)"))
+        print(f"  Duration: {format_duration(stats.elapsed)} ({stats.rate:.1f} users/s)")
+        print(f"  Sent {stats.sent}, unreachable {stats.unreachable}, failed {stats.failed}; "
+              f"{simulated.calls} API calls, {simulated.flood_waits} answered with 429")
+
+        if number == 0 and stats.elapsed >= 1:
+            print(f"\n  {'elapsed':>10}{'done':>10}{'users/s':>10}")
+            times = [t for t, _ in simulated.curve]
+            previous_t, previous_done = 0.0, 0
+            for row in range(1, CURVE_ROWS + 1):
+                target = stats.elapsed * row / CURVE_ROWS
+                t, done = simulated.curve[min(bisect.bisect_left(times, target), len(times) - 1)]
+                rate = (done - previous_done) / (t - previous_t) if t > previous_t else 0.0
+                print(f"  {format_duration(t):>10}{done:>10}{rate:>10.1f}")
+                previous_t, previous_done = t, done
+
+    total = sum(simulated.stats.elapsed for simulated in report.passes)
+    print(f"\nPredicted duration: {format_duration(total)}; "
+          f"expected failures: {report.passes[-1].stats.failed if report.passes else 0} "
+          f"(+{sum(p.stats.unreachable for p in report.passes)} unreachable)")
+    print(f"Simulated in {report.simulated_in:.1f}s")
+    print("=" * 60)
+
+
+def add_simulation_arguments(parser: argparse.ArgumentParser):
+    """Add --simulate and the fake API's knobs to a broadcast script's arguments"""
+    group = parser.add_argument_group("simulation")
+    group.add_argument('--simulate', action='store_true',
+                       help='Predict duration and failures with a fake Telegram; nothing is sent')
+    group.add_argument('--sim-latency', type=float, default=config.SIMULATE_LATENCY, metavar='SECONDS',
+                       help='Mean API latency (default: %(default)s)')
+    group.add_argument('--sim-blocked', type=float, default=config.SIMULATE_BLOCKED, metavar='SHARE',
+                       help='Share of users who blocked the bot (default: %(default)s)')
+    group.add_argument('--sim-errors', type=float, default=config.SIMULATE_ERRORS, metavar='SHARE',
+                       help='Share of calls failing with a transient error (default: %(default)s)')
+    group.add_argument('--sim-flood', type=float, default=config.SIMULATE_FLOOD, metavar='SHARE',
+                       help='Share of calls answered with 429 regardless of rate (default: %(default)s)')
+    group.add_argument('--sim-rate-limit', type=float, default=config.SIMULATE_RATE_LIMIT, metavar='PER_SECOND',
+                       help="Messages per second Telegram accepts (default: %(default)s)")
+
+
+async def read_script_audience(payload: Payload, resume: Optional[int]) -> Optional[List[int]]:
+    """Read a script's audience from the bot's storage, then close it like run_broadcast() does"""
+    try:
+        return await read_audience(database.adb, payload, resume)
+    finally:
+        await database.adb.close()
+
+
+def run_simulation(payload: Payload, args: argparse.Namespace, workers: int = config.BROADCAST_WORKERS):
+    """Simulate a script's broadcast from its parsed arguments and print the report"""
+    model = SimulationModel(
+        latency=args.sim_latency,
+        blocked=args.sim_blocked,
+        errors=args.sim_errors,
+        flood=args.sim_flood,
+        rate_limit=args.sim_rate_limit
+    )
+    print("\nSimulating the broadcast, nothing will be sent...")
+    try:
+        payload.validate()
+        audience = asyncio.run(read_script_audience(payload, getattr(args, 'resume', None)))
+        if audience is None:
+            return
+        report = simulate_broadcast(payload, audience, workers=workers, model=model)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+    print_report(report)
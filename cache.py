@@ -0,0 +1,138 @@
+"""
+Bounded in-memory cache with LRU + TTL eviction
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+def estimate_size(value: Any) -> int:
+    """Rough memory footprint of a cached value in bytes (one level deep)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(sys.getsizeof(item) for item in value)
+    elif is_dataclass(value):
+        size += sum(sys.getsizeof(getattr(value, f.name)) for f in fields(value))
+    return size
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with per-entry expiry and a memory ceiling
+
+    Entries are evicted when they expire, when there are more than
+    max_entries of them, or when their estimated total size exceeds
+    max_bytes - whichever comes first. Hit/miss/eviction counters are kept
+    for monitoring.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 16 * 1024 * 1024,
+                 ttl: float = 300.0, sizeof: Callable[[Any], int] = estimate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def generation(self) -> int:
+        """
+        Counter bumped by every invalidation
+
+        Read it before loading a value from the source and pass it to set():
+        if an invalidation happened in between, the possibly stale value is
+        not cached.
+        """
+        return self._generation
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a cached value, counting the hit or miss"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at, _ = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None,
+            generation: Optional[int] = None):
+        """
+        Store a value
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Lifetime in seconds (defaults to the cache's ttl)
+            generation: Value of `generation` read before loading the value
+        """
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._data:
+                self._remove(key)
+            expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, *keys: Hashable):
+        """Drop keys from the cache"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key in self._data:
+                    self._remove(key)
+
+    def clear(self):
+        """Drop everything"""
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: Hashable):
+        """Delete one entry; caller holds _lock"""
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        """Counters and current footprint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,243 @@
+"""
+Storage conformance check
+Runs the same scenario against every storage backend and reports any
+difference from the expected behaviour.
+Usage:
+    python check_storage.py                 # SQLite (temporary file)
+    python check_storage.py postgres        # PostgreSQL at DATABASE_URL
+
+Point DATABASE_URL at an empty scratch database: the check creates users
+and referrals and expects to be the only data there. tests/test_storage.py
+runs it for both backends under pytest.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from config import config
+from storage import Storage
+
+
+class Checker:
+    """Collects failed expectations instead of stopping at the first one"""
+
+    def __init__(self):
+        self.failures = []
+        self.passed = 0
+
+    def expect(self, name: str, actual, expected):
+        if actual == expected:
+            self.passed += 1
+            print(f"  ✅ {name}")
+        else:
+            self.failures.append(name)
+            print(f"  ❌ {name}: expected {expected!r}, got {actual!r}")
+
+
+async def run_checks(store: Storage) -> Checker:
+    """Exercise every Storage method and compare the results"""
+    check = Checker()
+
+    # Users
+    check.expect("add_user", await store.add_user(101, "alice", "Alice", None), True)
+    await store.add_user(102, "bob", "Bob", "B", referrer_id=101)
+    await store.add_user(103, None, "Carol", None, referrer_id=101)
+    await store.add_user(104, None, "Dave", None, referrer_id=102)
+    await store.add_user(101, "changed", "Changed", None)
+
+    user = await store.get_user(101)
+    check.expect("get_user keeps first insert", user and user['first_name'], "Alice")
+    check.expect("get_user missing", await store.get_user(999), None)
+    check.expect("get_all_user_ids", await store.get_all_user_ids(), [101, 102, 103, 104])
+
+    check.expect("update_user_subscription", await store.update_user_subscription(101, True), True)
+    check.expect("update_phone_number", await store.update_phone_number(101, "+998900000001"), True)
+    profile = await store.get_profile(101)
+    check.expect("get_profile", profile is not None, True)
+    if profile:
+        check.expect("profile is_subscribed", profile.is_subscribed, True)
+        check.expect("profile has_phone", profile.has_phone, True)
+        check.expect("profile created_at is str", isinstance(profile.created_at, str), True)
+    check.expect("get_profile missing", await store.get_profile(999), None)
+
+    # Referrals
+    check.expect("add_referral", await store.add_referral(101, 102), True)
+    check.expect("add_referral duplicate", await store.add_referral(101, 102), False)
+    await store.add_referral(101, 103)
+    await store.add_referral(102, 104)
+
+    check.expect("get_referral_count", await store.get_referral_count(101), 2)
+    check.expect("get_user_points", await store.get_user_points(101), 2 * config.POINTS_PER_REFERRAL)
+    referrals = await store.get_user_referrals(101)
+    check.expect("get_user_referrals", sorted(r['user_id'] for r in referrals), [102, 103])
+    check.expect("verify_referral_counts", await store.verify_referral_counts(), [])
+
+    # Membership events
+    joined = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+    check.expect("record_membership", await store.record_membership(104, True, joined), True)
+    check.expect("record_membership stale event",
+                 await store.record_membership(104, False, joined - timedelta(hours=1)), False)
+    profile = await store.get_profile(104)
+    check.expect("membership fields", profile and (profile.is_subscribed, profile.joined_at, profile.membership_known),
+                 (True, "2026-01-01 12:00:00", True))
+    check.expect("record_membership unknown user", await store.record_membership(999, True, joined), False)
+    await store.record_membership(104, False, joined + timedelta(hours=1))
+    check.expect("revoke_referral", await store.revoke_referral(104), [102])
+    check.expect("revoke_referral credit", await store.get_referral_count(102), 0)
+    await store.add_referral(102, 104)
+
+    # Media
+    check.expect("get_media_file_id missing", await store.get_media_file_id("assets/a.jpg", "h1"), None)
+    await store.save_media_file_id("assets/a.jpg", "h1", "id-1")
+    check.expect("save_media_file_id", await store.get_media_file_id("assets/a.jpg", "h1"), "id-1")
+    await store.save_media_file_id("assets/a.jpg", "h2", "id-2")
+    check.expect("save_media_file_id replaces old content", await store.get_media_file_id("assets/a.jpg", "h1"), None)
+    await store.delete_media_file_id("assets/a.jpg", "h2")
+    check.expect("delete_media_file_id", await store.get_media_file_id("assets/a.jpg", "h2"), None)
+
+    # FSM
+    check.expect("get_fsm_record missing", await store.get_fsm_record("fsm:1:5:5:default", 3600), None)
+    await store.save_fsm_record("fsm:1:5:5:default", "waiting_for_contact", '{"a": 1}')
+    check.expect("save_fsm_record", await store.get_fsm_record("fsm:1:5:5:default", 3600),
+                 {'state': "waiting_for_contact", 'data': '{"a": 1}'})
+    await store.save_fsm_record("fsm:1:5:5:default", None, '{"a": 2}')
+    check.expect("save_fsm_record overwrites", await store.get_fsm_record("fsm:1:5:5:default", 3600),
+                 {'state': None, 'data': '{"a": 2}'})
+    check.expect("get_fsm_record expired", await store.get_fsm_record("fsm:1:5:5:default", -60), None)
+    check.expect("purge_fsm_records keeps fresh", await store.purge_fsm_records(3600), 0)
+    check.expect("purge_fsm_records", await store.purge_fsm_records(-60), 1)
+    await store.save_fsm_record("fsm:1:6:6:default", "waiting_for_contact", "{}")
+    await store.delete_fsm_record("fsm:1:6:6:default")
+    check.expect("delete_fsm_record", await store.get_fsm_record("fsm:1:6:6:default", 3600), None)
+
+    # Campaigns
+    campaign_id = await store.create_campaign("text: hello", "f1")
+    check.expect("create_campaign", campaign_id is not None, True)
+    check.expect("get_campaign missing", await store.get_campaign(-1), None)
+    check.expect("claim_campaign_recipients", await store.claim_campaign_recipients(campaign_id, 3), [101, 102, 103])
+    check.expect("campaign recipients", await store.get_campaign_recipients(campaign_id), [101, 102, 103])
+    check.expect("campaign recipients page", await store.get_campaign_recipients(campaign_id, 101, 1), [102])
+    await store.record_deliveries(campaign_id, [(101, "sent", 7, None), (102, "blocked", None, "Forbidden"),
+                                                (103, "failed", None, "timeout")])
+    campaign = await store.get_campaign(campaign_id)
+    check.expect("get_campaign", campaign and (campaign['fingerprint'], campaign['status'], campaign['total'],
+                                               campaign['last_user_id'], campaign['deliveries']),
+                 ("f1", "running", 4, 103, {"sent": 1, "blocked": 1, "failed": 1}))
+    check.expect("recipients left after deliveries", await store.get_campaign_recipients(campaign_id), [103])
+    check.expect("claim_campaign_recipients continues", await store.claim_campaign_recipients(campaign_id, 3), [104])
+    check.expect("claim_campaign_recipients at the end", await store.claim_campaign_recipients(campaign_id, 3), [])
+    await store.finish_campaign(campaign_id)
+    check.expect("finish_campaign", (await store.get_campaign(campaign_id))['status'], "finished")
+
+    # Scheduled campaigns
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    later_id = await store.schedule_campaign("text: later", "f2", '{"text": "later"}', now + timedelta(hours=1))
+    due_id = await store.schedule_campaign("text: now", "f3", '{"text": "now"}', now - timedelta(minutes=1))
+    check.expect("schedule_campaign", (await store.get_campaign(later_id) or {}).get('status'), "scheduled")
+    due = await store.claim_due_campaign()
+    check.expect("claim_due_campaign", due and (due['campaign_id'], due['status'], due['total'], due['payload'],
+                                                due['scheduled_at']),
+                 (due_id, "running", 4, '{"text": "now"}', (now - timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')))
+    check.expect("claim_due_campaign nothing due", await store.claim_due_campaign(), None)
+    check.expect("get_campaigns", [c['campaign_id'] for c in await store.get_campaigns()], [due_id, later_id, campaign_id])
+    check.expect("get_campaigns by status",
+                 [(c['campaign_id'], c['deliveries']) for c in await store.get_campaigns(["finished", "cancelled"])],
+                 [(campaign_id, {"sent": 1, "blocked": 1, "failed": 1, "pending": 1})])
+    check.expect("set_campaign_status", await store.set_campaign_status(due_id, "paused", ["running"]), True)
+    check.expect("set_campaign_status unexpected", await store.set_campaign_status(due_id, "cancelled", ["running"]),
+                 False)
+    await store.set_campaign_status(later_id, "scheduled", ["scheduled", "paused"], scheduled_at=now)
+    check.expect("set_campaign_status reschedules", (await store.claim_due_campaign() or {}).get('campaign_id'), later_id)
+    await store.set_campaign_status(later_id, "cancelled", ["running"])
+    cancelled = await store.get_campaign(later_id)
+    check.expect("cancelled campaign", (cancelled['status'], cancelled['finished_at'] is not None), ("cancelled", True))
+
+    # Suppression
+    check.expect("suppress_users", await store.suppress_users([(103, "blocked"), (999, "deactivated")]), 1)
+    profile = await store.get_profile(103)
+    check.expect("suppressed profile", profile and (profile.delivery_status, profile.delivery_status_at is not None),
+                 ("blocked", True))
+    check.expect("get_all_user_ids deliverable", await store.get_all_user_ids(deliverable_only=True), [101, 102, 104])
+    check.expect("get_user_ids_page deliverable", await store.get_user_ids_page(101, 10, deliverable_only=True), [102, 104])
+    check.expect("get_user_ids_page referred deliverable",
+                 await store.get_user_ids_page(0, 10, referred_only=True, deliverable_only=True), [102, 104])
+    await store.unsuppress_user(103)
+    profile = await store.get_profile(103)
+    check.expect("unsuppress_user", profile and (profile.delivery_status, profile.suppressed), (None, False))
+
+    # Sweeps
+    check.expect("get_user_ids_page", await store.get_user_ids_page(101, 2), [102, 103])
+    check.expect("get_user_ids_page referred", await store.get_user_ids_page(0, 10, referred_only=True), [102, 103, 104])
+    check.expect("get_sweep_checkpoint missing", await store.get_sweep_checkpoint("check"), None)
+    check.expect("save_subscription_sweep", await store.save_subscription_sweep("check", [(102, False), (103, False)], 103), 0)
+    check.expect("save_subscription_sweep changes", await store.save_subscription_sweep("check", [(104, True)], 104), 1)
+    checkpoint = await store.get_sweep_checkpoint("check")
+    check.expect("sweep checkpoint", checkpoint and (checkpoint['last_user_id'], checkpoint['checked'], checkpoint['changed']),
+                 (104, 3, 1))
+    await store.save_subscription_sweep("check", [(104, False)], 104)
+    check.expect("reset_sweep_checkpoint", await store.reset_sweep_checkpoint("check"), True)
+    check.expect("checkpoint after reset", await store.get_sweep_checkpoint("check"), None)
+
+    # Leaderboard
+    page = await store.get_leaderboard_page(0, 10)
+    check.expect("leaderboard order", [(r['user_id'], r['rank'], r['referral_count']) for r in page],
+                 [(101, 1, 2), (102, 2, 1)])
+    check.expect("leaderboard offset", [r['user_id'] for r in await store.get_leaderboard_page(1, 10)], [102])
+    check.expect("get_top_referrers", [r['user_id'] for r in await store.get_top_referrers(1)], [101])
+    check.expect("get_rank", await store.get_rank(102), 2)
+    check.expect("get_rank without referrals", await store.get_rank(103), None)
+    profile = await store.get_profile(101)
+    check.expect("profile rank", profile and profile.rank, 1)
+    check.expect("get_users_with_referrals",
+                 [r['user_id'] for r in await store.get_users_with_referrals()], [101, 102])
+
+    # Statistics
+    check.expect("get_total_users", await store.get_total_users(), 4)
+    check.expect("get_total_referrals", await store.get_total_referrals(), 3)
+    check.expect("get_subscribed_users_count", await store.get_subscribed_users_count(), 1)
+    check.expect("get_users_with_phone_count", await store.get_users_with_phone_count(), 1)
+    snapshot = await store.get_stats_snapshot(top=1)
+    check.expect("get_stats_snapshot counters",
+                 [snapshot[k] for k in ('total_users', 'subscribed_users', 'users_with_phone', 'total_referrals')],
+                 [4, 1, 1, 3])
+    check.expect("get_stats_snapshot top", [(r['user_id'], r['rank']) for r in snapshot['top_referrers']], [(101, 1)])
+    check.expect("cache_stats keys", sorted(store.cache_stats()),
+                 ['bytes', 'entries', 'evictions', 'hit_rate', 'hits', 'misses'])
+
+    return check
+
+
+async def main():
+    backend = sys.argv[1] if len(sys.argv) > 1 else "sqlite"
+    print(f"Checking {backend} storage")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if backend == "sqlite":
+            from database import AsyncDatabase, Database
+            store = AsyncDatabase(Database(os.path.join(tmp, "check.db")))
+        elif backend == "postgres":
+            from storage.postgres import PostgresStorage
+            store = PostgresStorage(config.DATABASE_URL)
+            try:
+                await store._get_pool()
+            except Exception as e:
+                print(f"Cannot connect to {config.DATABASE_URL!r}: {e}")
+                return 2
+        else:
+            print(f"Unknown backend: {backend}")
+            return 2
+
+        try:
+            check = await run_checks(store)
+        finally:
+            await store.close()
+
+    print()
+    print(f"{check.passed} passed, {len(check.failures)} failed")
+    return 1 if check.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
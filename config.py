@@ -20,9 +20,107 @@ class Config:
         # Channel link for users to subscribe
         self.CHANNEL_LINK: str = os.getenv("CHANNEL_LINK", "https://t.me/your_channel")
         
+        # How updates arrive: "polling" (long-poll getUpdates) or "webhook"
+        # (Telegram POSTs them to the embedded aiohttp server)
+        self.BOT_MODE: str = os.getenv("BOT_MODE", "polling")
+        
+        # Webhook mode: public HTTPS base URL Telegram calls, local listen
+        # address, shared secret checked on every request (derived from the
+        # bot token if empty), Telegram's parallel connections, the number
+        # of updates handled at once and the number accepted but not finished
+        # before new ones are refused (Telegram delivers those again later)
+        self.WEBHOOK_BASE_URL: str = os.getenv("WEBHOOK_BASE_URL", "")
+        self.WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+        self.WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+        self.WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+        self.WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+        self.WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+        self.WEBHOOK_CONCURRENCY: int = int(os.getenv("WEBHOOK_CONCURRENCY", "100"))
+        self.WEBHOOK_BACKLOG: int = int(os.getenv("WEBHOOK_BACKLOG", "1000"))
+        
+        # Storage backend: "sqlite" (single host) or "postgres" (shared by
+        # several bot and broadcast processes)
+        self.STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "sqlite")
+        
         # Database file path
         self.DATABASE_PATH: str = "bot_database.db"
         
+        # PostgreSQL connection (STORAGE_BACKEND=postgres)
+        self.DATABASE_URL: str = os.getenv("DATABASE_URL", "postgresql://localhost/referral_bot")
+        self.PG_POOL_MIN_SIZE: int = int(os.getenv("PG_POOL_MIN_SIZE", "2"))
+        self.PG_POOL_MAX_SIZE: int = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+        
+        # Threads that run database calls off the event loop, and how many
+        # calls may wait for them before handlers are made to wait
+        self.DB_EXECUTOR_WORKERS: int = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+        self.DB_EXECUTOR_QUEUE_SIZE: int = int(os.getenv("DB_EXECUTOR_QUEUE_SIZE", "1000"))
+        
+        # SQLite connection pool (WAL mode: many readers, one writer)
+        self.DB_POOL_READERS: int = int(os.getenv("DB_POOL_READERS", "4"))
+        self.DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+        self.DB_CACHE_SIZE: int = int(os.getenv("DB_CACHE_SIZE", "-16000"))  # negative = KiB
+        self.DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", "268435456"))
+        self.DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+        
+        # Write-behind buffer for add_user / subscription / phone updates:
+        # flushed when this many users have pending changes or every N seconds
+        self.WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "500"))
+        self.WRITE_BEHIND_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+        
+        # Read-through cache for users rows (LRU + TTL, bounded by count and memory)
+        self.USER_CACHE_MAX_ENTRIES: int = int(os.getenv("USER_CACHE_MAX_ENTRIES", "50000"))
+        self.USER_CACHE_MAX_BYTES: int = int(os.getenv("USER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "300"))
+        
+        # Cached channel membership checks: members are re-checked after the
+        # positive TTL, non-members sooner so a fresh join is noticed quickly
+        self.SUBSCRIPTION_CACHE_TTL: float = float(os.getenv("SUBSCRIPTION_CACHE_TTL", "600"))
+        self.SUBSCRIPTION_CACHE_NEGATIVE_TTL: float = float(os.getenv("SUBSCRIPTION_CACHE_NEGATIVE_TTL", "30"))
+        self.SUBSCRIPTION_CACHE_MAX_ENTRIES: int = int(os.getenv("SUBSCRIPTION_CACHE_MAX_ENTRIES", "100000"))
+        
+        # Concurrent sends of a broadcast (the outbound limiter sets the pace)
+        self.BROADCAST_WORKERS: int = int(os.getenv("BROADCAST_WORKERS", "20"))
+        # Recipients read from the database at a time
+        self.BROADCAST_PAGE_SIZE: int = int(os.getenv("BROADCAST_PAGE_SIZE", "1000"))
+        # Delivery journal: outcomes written per batch, or after the interval (seconds)
+        self.JOURNAL_BATCH_SIZE: int = int(os.getenv("JOURNAL_BATCH_SIZE", "500"))
+        self.JOURNAL_FLUSH_INTERVAL: float = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "1"))
+        # Campaigns scheduled with /schedule run inside the bot; the runner
+        # looks for due ones every N seconds. Enable it on one instance only
+        self.CAMPAIGN_RUNNER: bool = os.getenv("CAMPAIGN_RUNNER", "true").lower() in ("1", "true", "yes")
+        self.CAMPAIGN_POLL_INTERVAL: float = float(os.getenv("CAMPAIGN_POLL_INTERVAL", "30"))
+        # Broadcast --simulate: the fake Bot API's mean latency (seconds), the
+        # share of users who blocked the bot, of calls failing with a transient
+        # error and of calls answered with 429 on top of its messages/s limit
+        self.SIMULATE_LATENCY: float = float(os.getenv("SIMULATE_LATENCY", "0.1"))
+        self.SIMULATE_BLOCKED: float = float(os.getenv("SIMULATE_BLOCKED", "0.03"))
+        self.SIMULATE_ERRORS: float = float(os.getenv("SIMULATE_ERRORS", "0.001"))
+        self.SIMULATE_FLOOD: float = float(os.getenv("SIMULATE_FLOOD", "0.001"))
+        self.SIMULATE_RATE_LIMIT: float = float(os.getenv("SIMULATE_RATE_LIMIT", "30"))
+        
+        # Updates handled at once (each user's updates still run one at a time)
+        self.UPDATE_CONCURRENCY: int = int(os.getenv("UPDATE_CONCURRENCY", "100"))
+        
+        # Outgoing message limits shared by the bot and the broadcast scripts:
+        # messages per second for the whole bot, per private chat (with a
+        # burst for multi-message replies) and per group
+        self.OUTBOUND_GLOBAL_RATE: float = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+        self.OUTBOUND_GLOBAL_BURST: float = float(os.getenv("OUTBOUND_GLOBAL_BURST", "1"))
+        self.OUTBOUND_CHAT_RATE: float = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+        self.OUTBOUND_CHAT_BURST: float = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+        self.OUTBOUND_GROUP_RATE: float = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+        
+        # FSM states (e.g. "waiting for contact") live in the database; the
+        # most recently used ones are also kept in a bounded in-memory tier.
+        # States not touched for FSM_STATE_TTL seconds count as abandoned
+        self.FSM_CACHE_MAX_ENTRIES: int = int(os.getenv("FSM_CACHE_MAX_ENTRIES", "10000"))
+        self.FSM_CACHE_TTL: float = float(os.getenv("FSM_CACHE_TTL", "600"))
+        self.FSM_STATE_TTL: float = float(os.getenv("FSM_STATE_TTL", str(7 * 24 * 3600)))
+        
+        # Take back the referrer's points when an invited user leaves the
+        # channel (seen through chat_member updates)
+        self.REVOKE_REFERRAL_ON_LEAVE: bool = os.getenv("REVOKE_REFERRAL_ON_LEAVE", "false").lower() in ("1", "true", "yes")
+        
         # Bot username (without @)
         self.BOT_USERNAME: str = os.getenv("BOT_USERNAME", "your_bot_username")
         
@@ -1,184 +1,1069 @@
 """
 Database operations module
+SQLite storage backend: Database is the blocking implementation and
+AsyncDatabase exposes it to the event loop through the Storage interface.
 """
+import asyncio
+import atexit
+import queue
 import sqlite3
 import logging
-from typing import Optional, List, Tuple
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, Optional, List, Sequence, Tuple
 from config import config
+from migrations import run_migrations
+from leaderboard import Leaderboard
+from cache import LRUCache
+from storage.base import Storage, UserProfile, empty_stats_snapshot
 
 logger = logging.getLogger(__name__)
 
 
+class ConnectionPool:
+    """Pool of long-lived SQLite connections
+    
+    The database runs in WAL mode, so any number of readers can work next to
+    the single writer. Reader connections are handed out from a queue, while
+    all writes go through one connection guarded by a lock.
+    """
+    
+    def __init__(self, db_path: str, readers: int = 4, synchronous: str = "NORMAL",
+                 cache_size: int = -16000, mmap_size: int = 268435456,
+                 busy_timeout: int = 5000):
+        self.db_path = db_path
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self._closed = False
+        
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        self._write_lock = threading.Lock()
+        
+        self._readers: queue.Queue = queue.Queue()
+        self._all_readers = []
+        for _ in range(readers):
+            conn = self._connect()
+            self._all_readers.append(conn)
+            self._readers.put(conn)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the tuned pragmas applied"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        return conn
+    
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read connection"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+    
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Hold the write connection; commits on success, rolls back on error"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        with self._write_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+    
+    def close(self):
+        """Checkpoint the WAL and close every connection"""
+        if self._closed:
+            return
+        with self._write_lock:
+            self._closed = True
+            try:
+                self._writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                logger.warning(f"WAL checkpoint on shutdown failed: {e}")
+            self._writer.close()
+        for conn in self._all_readers:
+            conn.close()
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces hot-path user writes and flushes them in batched transactions
+    
+    add_user, update_user_subscription and update_phone_number only record the
+    change here. Changes for the same user are merged, and everything pending is
+    written in one transaction once max_pending users are waiting or every
+    flush_interval seconds, so a burst of sign-ups costs one fsync per batch
+    instead of one per write. Pending changes stay visible to readers of this
+    process (see overlay) until they are committed.
+    """
+    
+    # Columns that may be written through the buffer
+    FIELDS = ('is_subscribed', 'phone_number')
+    
+    def __init__(self, pool: ConnectionPool, max_pending: int = 500, flush_interval: float = 0.5):
+        self.pool = pool
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[int, dict] = {}
+        self._flushing: Dict[int, dict] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        """Flush on the time trigger until closed"""
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+    
+    def _entry(self, user_id: int) -> dict:
+        """Get (or start) the pending change set for a user; caller holds _lock"""
+        entry = self._pending.get(user_id)
+        if entry is None:
+            entry = self._pending[user_id] = {'insert': None, 'fields': {}}
+        return entry
+    
+    def add_user(self, user_id: int, username: Optional[str], first_name: Optional[str],
+                 last_name: Optional[str], referrer_id: Optional[int]):
+        """Queue an INSERT OR IGNORE for a new user"""
+        with self._lock:
+            entry = self._entry(user_id)
+            if entry['insert'] is None:
+                entry['insert'] = (username, first_name, last_name, referrer_id)
+            size = len(self._pending)
+        
+        if size >= self.max_pending:
+            self.flush()
+    
+    def set_field(self, user_id: int, field: str, value: Any):
+        """Queue an update of one user column, replacing any earlier pending value"""
+        if field not in self.FIELDS:
+            raise ValueError(f"Field {field} is not buffered")
+        
+        with self._lock:
+            self._entry(user_id)['fields'][field] = value
+            size = len(self._pending)
+        
+        if size >= self.max_pending:
+            self.flush()
+    
+    def has_pending(self, *user_ids: int) -> bool:
+        """Whether any of the users has changes that are not committed yet"""
+        with self._lock:
+            return any(uid in self._pending or uid in self._flushing for uid in user_ids)
+    
+    def snapshot(self, user_id: int) -> Optional[dict]:
+        """
+        Get the uncommitted changes for a user
+        
+        Take the snapshot before reading the row from disk: entries are only
+        dropped after their transaction commits, so the row read afterwards
+        either already contains them or the snapshot does.
+        """
+        with self._lock:
+            flushing = self._flushing.get(user_id)
+            pending = self._pending.get(user_id)
+            if flushing is None and pending is None:
+                return None
+            
+            merged = {'insert': None, 'fields': {}}
+            for entry in (flushing, pending):
+                if entry:
+                    merged['insert'] = merged['insert'] or entry['insert']
+                    merged['fields'].update(entry['fields'])
+            return merged
+    
+    @staticmethod
+    def overlay(user_id: int, row: Optional[dict], changes: Optional[dict]) -> Optional[dict]:
+        """Apply a snapshot from snapshot() on top of a users row read from disk"""
+        if not changes:
+            return row
+        
+        if row is None:
+            if changes['insert'] is None:
+                return None
+            username, first_name, last_name, referrer_id = changes['insert']
+            row = {
+                'user_id': user_id,
+                'username': username,
+                'first_name': first_name,
+                'last_name': last_name,
+                'phone_number': None,
+                'referrer_id': referrer_id,
+                'points': 0,
+                'referral_count': 0,
+                'is_subscribed': 0,
+                'created_at': None,
+                'joined_at': None,
+                'left_at': None,
+                'membership_updated_at': None,
+                'delivery_status': None,
+                'delivery_status_at': None
+            }
+        
+        row.update(changes['fields'])
+        return row
+    
+    def flush(self) -> int:
+        """
+        Write everything pending in one transaction
+        
+        Returns:
+            Number of users whose changes were written
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+            
+            try:
+                with self.pool.writer() as conn:
+                    conn.executemany("""
+                        INSERT OR IGNORE INTO users (user_id, username, first_name, last_name, referrer_id)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, [
+                        (user_id, *entry['insert'])
+                        for user_id, entry in batch.items() if entry['insert']
+                    ])
+                    
+                    for field in self.FIELDS:
+                        # "IS NOT" skips rows that already hold the value
+                        conn.executemany(
+                            f"UPDATE users SET {field} = ? WHERE user_id = ? AND {field} IS NOT ?",
+                            [
+                                (entry['fields'][field], user_id, entry['fields'][field])
+                                for user_id, entry in batch.items() if field in entry['fields']
+                            ]
+                        )
+            except Exception as e:
+                logger.error(f"Error flushing {len(batch)} buffered user writes: {e}")
+                with self._lock:
+                    # Put the batch back under anything queued meanwhile
+                    for user_id, entry in batch.items():
+                        newer = self._pending.get(user_id)
+                        if newer:
+                            entry['insert'] = entry['insert'] or newer['insert']
+                            entry['fields'].update(newer['fields'])
+                        self._pending[user_id] = entry
+                    self._flushing = {}
+                return 0
+            
+            with self._lock:
+                self._flushing = {}
+            return len(batch)
+    
+    def close(self):
+        """Stop the timer thread and flush whatever is still pending"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+
 class Database:
     """Database manager class"""
     
     def __init__(self, db_path: str = config.DATABASE_PATH):
         self.db_path = db_path
+        self.pool = ConnectionPool(
+            db_path,
+            readers=config.DB_POOL_READERS,
+            synchronous=config.DB_SYNCHRONOUS,
+            cache_size=config.DB_CACHE_SIZE,
+            mmap_size=config.DB_MMAP_SIZE,
+            busy_timeout=config.DB_BUSY_TIMEOUT_MS
+        )
         self.init_db()
-    
-    def get_connection(self) -> sqlite3.Connection:
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        self.buffer = WriteBehindBuffer(
+            self.pool,
+            max_pending=config.WRITE_BEHIND_MAX_PENDING,
+            flush_interval=config.WRITE_BEHIND_FLUSH_INTERVAL
+        )
+        # Scripts that never call close() still get their writes flushed
+        atexit.register(self.close)
+        
+        # Read-through cache of users rows; every write to a user invalidates it
+        self.user_cache = LRUCache(
+            max_entries=config.USER_CACHE_MAX_ENTRIES,
+            max_bytes=config.USER_CACHE_MAX_BYTES,
+            ttl=config.USER_CACHE_TTL
+        )
+        
+        # Loaded on first use; add_referral keeps it current afterwards
+        self._leaderboard: Optional[Leaderboard] = None
+        self._leaderboard_lock = threading.RLock()
     
     def init_db(self):
-        """Initialize database tables"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                phone_number TEXT,
-                referrer_id INTEGER,
-                points INTEGER DEFAULT 0,
-                is_subscribed INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (referrer_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # Referrals table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS referrals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                referrer_id INTEGER NOT NULL,
-                referred_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (referrer_id) REFERENCES users(user_id),
-                FOREIGN KEY (referred_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
-        logger.info("Database initialized successfully")
+        """Initialize database tables and apply pending migrations"""
+        with self.pool.writer() as conn:
+            version = run_migrations(conn)
+        
+        logger.info(f"Database initialized successfully (schema version {version})")
+    
+    @property
+    def leaderboard(self) -> Leaderboard:
+        """In-memory referral ranking, loaded from users.referral_count once"""
+        if self._leaderboard is None:
+            with self._leaderboard_lock:
+                if self._leaderboard is None:
+                    with self.pool.reader() as conn:
+                        rows = conn.execute(
+                            "SELECT user_id, referral_count FROM users WHERE referral_count > 0"
+                        ).fetchall()
+                    self._leaderboard = Leaderboard((row[0], row[1]) for row in rows)
+                    logger.info(f"Leaderboard loaded with {len(self._leaderboard)} referrers")
+        return self._leaderboard
+    
+    def close(self):
+        """Flush buffered writes and close all pooled connections"""
+        self.buffer.close()
+        self.pool.close()
     
     def add_user(self, user_id: int, username: Optional[str] = None, 
                  first_name: Optional[str] = None, last_name: Optional[str] = None,
                  referrer_id: Optional[int] = None) -> bool:
-        """Add new user to database"""
+        """Add new user to database (written by the next buffer flush)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT OR IGNORE INTO users (user_id, username, first_name, last_name, referrer_id)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, username, first_name, last_name, referrer_id))
-            
-            conn.commit()
-            conn.close()
+            self.buffer.add_user(user_id, username, first_name, last_name, referrer_id)
+            self.user_cache.invalidate(user_id)
             return True
         except Exception as e:
             logger.error(f"Error adding user: {e}")
             return False
     
+    def _user_row(self, user_id: int) -> Optional[dict]:
+        """Users row with buffered changes applied, served from the cache when possible"""
+        row = self.user_cache.get(user_id)
+        if row is not None:
+            return row
+        
+        generation = self.user_cache.generation
+        changes = self.buffer.snapshot(user_id)
+        with self.pool.reader() as conn:
+            row = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        
+        row = self.buffer.overlay(user_id, dict(row) if row else None, changes)
+        if row is not None:
+            self.user_cache.set(user_id, row, generation=generation)
+        return row
+    
     def get_user(self, user_id: int) -> Optional[dict]:
         """Get user by ID"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-            row = cursor.fetchone()
-            conn.close()
-            
-            if row:
-                return dict(row)
-            return None
+            row = self._user_row(user_id)
+            return dict(row) if row else None
         except Exception as e:
             logger.error(f"Error getting user: {e}")
             return None
     
+    def get_profile(self, user_id: int) -> Optional[UserProfile]:
+        """Get user fields, points, referral count and flags in one query"""
+        try:
+            row = self._user_row(user_id)
+            return UserProfile.from_row(row, self.leaderboard.rank_of(user_id)) if row else None
+        except Exception as e:
+            logger.error(f"Error getting profile: {e}")
+            return None
+    
     def update_user_subscription(self, user_id: int, is_subscribed: bool) -> bool:
-        """Update user subscription status"""
+        """Update user subscription status (written by the next buffer flush)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE users SET is_subscribed = ? WHERE user_id = ?
-            """, (1 if is_subscribed else 0, user_id))
-            
-            conn.commit()
-            conn.close()
+            self.buffer.set_field(user_id, 'is_subscribed', 1 if is_subscribed else 0)
+            self.user_cache.invalidate(user_id)
             return True
         except Exception as e:
             logger.error(f"Error updating subscription: {e}")
             return False
     
     def update_phone_number(self, user_id: int, phone_number: str) -> bool:
-        """Update user phone number"""
+        """Update user phone number (written by the next buffer flush)"""
+        try:
+            self.buffer.set_field(user_id, 'phone_number', phone_number)
+            self.user_cache.invalidate(user_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating phone number: {e}")
+            return False
+    
+    def get_all_user_ids(self, deliverable_only: bool = False) -> List[int]:
+        """
+        Get the IDs of every user
+        
+        Args:
+            deliverable_only: Leave out users with a delivery_status (blocked
+                the bot, deleted their account, ...)
+        """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            self.buffer.flush()
+            with self.pool.reader() as conn:
+                if deliverable_only:
+                    rows = conn.execute(
+                        "SELECT user_id FROM users WHERE delivery_status IS NULL ORDER BY user_id"
+                    ).fetchall()
+                else:
+                    rows = conn.execute("SELECT user_id FROM users ORDER BY user_id").fetchall()
+            return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting user IDs: {e}")
+            return []
+    
+    def get_user_ids_page(self, after_user_id: int = 0, limit: int = 1000,
+                          referred_only: bool = False, deliverable_only: bool = False) -> List[int]:
+        """
+        Get the next user IDs in ascending order (keyset pagination)
+        
+        Args:
+            after_user_id: Return IDs greater than this one
+            limit: Maximum number of IDs
+            referred_only: Only users who were credited as someone's referral
+            deliverable_only: Leave out users with a delivery_status
+        """
+        try:
+            self.buffer.flush()
+            with self.pool.reader() as conn:
+                if referred_only:
+                    deliverable = """
+                        AND referred_id IN (SELECT user_id FROM users WHERE delivery_status IS NULL)
+                    """ if deliverable_only else ""
+                    rows = conn.execute(f"""
+                        SELECT DISTINCT referred_id FROM referrals
+                        WHERE referred_id > ? {deliverable}
+                        ORDER BY referred_id
+                        LIMIT ?
+                    """, (after_user_id, limit)).fetchall()
+                else:
+                    deliverable = "AND delivery_status IS NULL" if deliverable_only else ""
+                    rows = conn.execute(f"""
+                        SELECT user_id FROM users
+                        WHERE user_id > ? {deliverable}
+                        ORDER BY user_id
+                        LIMIT ?
+                    """, (after_user_id, limit)).fetchall()
+            return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting user IDs page: {e}")
+            return []
+    
+    def suppress_users(self, results: List[Tuple[int, str]]) -> int:
+        """
+        Stop broadcasting to users that can't be reached
+        
+        Args:
+            results: (user_id, delivery_status) pairs, e.g. (42, 'blocked')
             
-            cursor.execute("""
-                UPDATE users SET phone_number = ? WHERE user_id = ?
-            """, (phone_number, user_id))
+        Returns:
+            Number of users updated (-1 on error)
+        """
+        if not results:
+            return 0
+        try:
+            user_ids = [user_id for user_id, _ in results]
+            # A buffered insert must land first, or the update finds no row
+            if self.buffer.has_pending(*user_ids):
+                self.buffer.flush()
             
-            conn.commit()
-            conn.close()
+            with self.pool.writer() as conn:
+                updated = conn.executemany("""
+                    UPDATE users SET delivery_status = ?, delivery_status_at = CURRENT_TIMESTAMP
+                    WHERE user_id = ?
+                """, [(status, user_id) for user_id, status in results]).rowcount
+            
+            self.user_cache.invalidate(*user_ids)
+            return updated
+        except Exception as e:
+            logger.error(f"Error suppressing users: {e}")
+            return -1
+    
+    def unsuppress_user(self, user_id: int) -> bool:
+        """Include a user in broadcasts again (they wrote to the bot, so it can reach them)"""
+        try:
+            with self.pool.writer() as conn:
+                conn.execute("""
+                    UPDATE users SET delivery_status = NULL, delivery_status_at = NULL
+                    WHERE user_id = ? AND delivery_status IS NOT NULL
+                """, (user_id,))
+            self.user_cache.invalidate(user_id)
             return True
         except Exception as e:
-            logger.error(f"Error updating phone number: {e}")
+            logger.error(f"Error unsuppressing user: {e}")
+            return False
+    
+    def get_sweep_checkpoint(self, name: str) -> Optional[dict]:
+        """Get the progress saved by a sweep (last_user_id, checked, changed)"""
+        try:
+            with self.pool.reader() as conn:
+                row = conn.execute(
+                    "SELECT * FROM sweep_checkpoints WHERE name = ?", (name,)
+                ).fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting sweep checkpoint: {e}")
+            return None
+    
+    def reset_sweep_checkpoint(self, name: str) -> bool:
+        """Forget a sweep's progress so the next run starts from the beginning"""
+        try:
+            with self.pool.writer() as conn:
+                conn.execute("DELETE FROM sweep_checkpoints WHERE name = ?", (name,))
+            return True
+        except Exception as e:
+            logger.error(f"Error resetting sweep checkpoint: {e}")
+            return False
+    
+    def save_subscription_sweep(self, name: str, results: List[Tuple[int, bool]],
+                                last_user_id: int) -> int:
+        """
+        Store a batch of re-checked subscription states and advance the checkpoint
+        
+        Both happen in one transaction, so a resumed sweep never skips users
+        whose results were lost.
+        
+        Args:
+            name: Checkpoint name
+            results: (user_id, is_subscribed) pairs from get_chat_member
+            last_user_id: Highest user ID covered by this batch
+            
+        Returns:
+            Number of users whose is_subscribed changed
+        """
+        try:
+            user_ids = [user_id for user_id, _ in results]
+            # Older buffered values for these users must not land afterwards
+            if self.buffer.has_pending(*user_ids):
+                self.buffer.flush()
+            
+            with self.pool.writer() as conn:
+                # rowcount of executemany is the sum over all rows (triggers excluded)
+                changed = conn.executemany(
+                    "UPDATE users SET is_subscribed = ? WHERE user_id = ? AND is_subscribed IS NOT ?",
+                    [(int(subscribed), user_id, int(subscribed)) for user_id, subscribed in results]
+                ).rowcount
+                conn.execute("""
+                    INSERT INTO sweep_checkpoints (name, last_user_id, checked, changed, updated_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(name) DO UPDATE SET
+                        last_user_id = excluded.last_user_id,
+                        checked = checked + excluded.checked,
+                        changed = changed + excluded.changed,
+                        updated_at = excluded.updated_at
+                """, (name, last_user_id, len(results), changed))
+            
+            self.user_cache.invalidate(*user_ids)
+            return changed
+        except Exception as e:
+            logger.error(f"Error saving subscription sweep: {e}")
+            return -1
+    
+    def record_membership(self, user_id: int, is_subscribed: bool, changed_at: datetime) -> bool:
+        """
+        Apply a channel join or leave seen in a chat_member update
+        
+        Events dated before the last one applied are ignored, so a late or
+        replayed update never overwrites a newer state.
+        
+        Returns:
+            True if the user exists and the event was applied
+        """
+        try:
+            # A buffered is_subscribed from an older API check must not land after this
+            if self.buffer.has_pending(user_id):
+                self.buffer.flush()
+            
+            stamp = changed_at.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            with self.pool.writer() as conn:
+                cursor = conn.execute("""
+                    UPDATE users
+                    SET is_subscribed = ?,
+                        joined_at = CASE WHEN ? THEN ? ELSE joined_at END,
+                        left_at = CASE WHEN ? THEN left_at ELSE ? END,
+                        membership_updated_at = ?
+                    WHERE user_id = ?
+                      AND (membership_updated_at IS NULL OR membership_updated_at <= ?)
+                """, (
+                    1 if is_subscribed else 0,
+                    is_subscribed, stamp,
+                    is_subscribed, stamp,
+                    stamp, user_id, stamp
+                ))
+            
+            self.user_cache.invalidate(user_id)
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error recording membership: {e}")
             return False
     
     def add_referral(self, referrer_id: int, referred_id: int) -> bool:
         """Add referral and update points"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            # The referrer row must be on disk before its counters are bumped
+            if self.buffer.has_pending(referrer_id, referred_id):
+                self.buffer.flush()
             
-            # Check if referral already exists
-            cursor.execute("""
-                SELECT id FROM referrals WHERE referrer_id = ? AND referred_id = ?
-            """, (referrer_id, referred_id))
+            # Held across commit and leaderboard update so a concurrent first
+            # load of the leaderboard can't count this referral twice
+            with self._leaderboard_lock:
+                with self.pool.writer() as conn:
+                    # The UNIQUE (referrer_id, referred_id) index makes this a no-op
+                    # for a referral that already exists
+                    cursor = conn.execute("""
+                        INSERT OR IGNORE INTO referrals (referrer_id, referred_id)
+                        VALUES (?, ?)
+                    """, (referrer_id, referred_id))
+                    
+                    if cursor.rowcount == 0:
+                        return False
+                    
+                    # Update referrer points and referral count in the same transaction
+                    conn.execute("""
+                        UPDATE users
+                        SET points = points + ?, referral_count = referral_count + 1
+                        WHERE user_id = ?
+                    """, (config.POINTS_PER_REFERRAL, referrer_id))
+                
+                self.user_cache.invalidate(referrer_id)
+                if self._leaderboard is not None:
+                    self._leaderboard.increment(referrer_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error adding referral: {e}")
+            return False
+    
+    def revoke_referral(self, referred_id: int) -> List[int]:
+        """
+        Delete the referrals of a user and take back the referrers' credit
+        
+        Returns:
+            IDs of the referrers whose credit was revoked
+        """
+        try:
+            with self._leaderboard_lock:
+                with self.pool.writer() as conn:
+                    rows = conn.execute(
+                        "SELECT referrer_id FROM referrals WHERE referred_id = ?", (referred_id,)
+                    ).fetchall()
+                    referrer_ids = [row[0] for row in rows]
+                    if not referrer_ids:
+                        return []
+                    
+                    conn.execute("DELETE FROM referrals WHERE referred_id = ?", (referred_id,))
+                    conn.executemany("""
+                        UPDATE users
+                        SET points = MAX(points - ?, 0), referral_count = MAX(referral_count - 1, 0)
+                        WHERE user_id = ?
+                    """, [(config.POINTS_PER_REFERRAL, referrer_id) for referrer_id in referrer_ids])
+                
+                self.user_cache.invalidate(*referrer_ids)
+                if self._leaderboard is not None:
+                    for referrer_id in referrer_ids:
+                        self._leaderboard.increment(referrer_id, -1)
+            return referrer_ids
+        except Exception as e:
+            logger.error(f"Error revoking referral: {e}")
+            return []
+    
+    def get_media_file_id(self, path: str, sha256: str) -> Optional[str]:
+        """Get the Telegram file_id stored for a media file with this content"""
+        try:
+            with self.pool.reader() as conn:
+                row = conn.execute(
+                    "SELECT file_id FROM media_cache WHERE path = ? AND sha256 = ?", (path, sha256)
+                ).fetchone()
+            return row['file_id'] if row else None
+        except Exception as e:
+            logger.error(f"Error getting media file_id: {e}")
+            return None
+    
+    def save_media_file_id(self, path: str, sha256: str, file_id: str) -> bool:
+        """Store the file_id of an upload, replacing ids of older versions of the file"""
+        try:
+            with self.pool.writer() as conn:
+                conn.execute("DELETE FROM media_cache WHERE path = ? AND sha256 != ?", (path, sha256))
+                conn.execute("""
+                    INSERT OR REPLACE INTO media_cache (path, sha256, file_id, uploaded_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                """, (path, sha256, file_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error saving media file_id: {e}")
+            return False
+    
+    def delete_media_file_id(self, path: str, sha256: str) -> bool:
+        """Forget a file_id that Telegram no longer accepts"""
+        try:
+            with self.pool.writer() as conn:
+                conn.execute("DELETE FROM media_cache WHERE path = ? AND sha256 = ?", (path, sha256))
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting media file_id: {e}")
+            return False
+    
+    def get_fsm_record(self, key: str, max_age: float) -> Optional[dict]:
+        """Get the FSM state and JSON data saved under a key, unless older than max_age seconds"""
+        try:
+            with self.pool.reader() as conn:
+                row = conn.execute("""
+                    SELECT state, data FROM fsm_states
+                    WHERE key = ? AND updated_at >= datetime('now', ?)
+                """, (key, f"{-int(max_age)} seconds")).fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting FSM record: {e}")
+            return None
+    
+    def save_fsm_record(self, key: str, state: Optional[str], data: str) -> bool:
+        """Store the FSM state and JSON data for a key"""
+        try:
+            with self.pool.writer() as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                """, (key, state, data))
+            return True
+        except Exception as e:
+            logger.error(f"Error saving FSM record: {e}")
+            return False
+    
+    def delete_fsm_record(self, key: str) -> bool:
+        """Forget the FSM state and data for a key"""
+        try:
+            with self.pool.writer() as conn:
+                conn.execute("DELETE FROM fsm_states WHERE key = ?", (key,))
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting FSM record: {e}")
+            return False
+    
+    def purge_fsm_records(self, max_age: float) -> int:
+        """Delete FSM records not touched for max_age seconds; returns how many"""
+        try:
+            with self.pool.writer() as conn:
+                cursor = conn.execute(
+                    "DELETE FROM fsm_states WHERE updated_at < datetime('now', ?)",
+                    (f"{-int(max_age)} seconds",)
+                )
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error purging FSM records: {e}")
+            return 0
+    
+    def create_campaign(self, description: str, fingerprint: str) -> Optional[int]:
+        """
+        Start a broadcast campaign to every deliverable user
+        
+        Recipients are handed out later, a page at a time, by
+        claim_campaign_recipients; the campaign only records how many there
+        are now (for progress reports).
+        
+        Args:
+            description: Human-readable summary of the payload
+            fingerprint: Hash of the payload, checked when the campaign is resumed
             
-            if cursor.fetchone():
-                conn.close()
-                return False
+        Returns:
+            The new campaign ID, or None on error
+        """
+        try:
+            self.buffer.flush()
+            with self.pool.writer() as conn:
+                return conn.execute("""
+                    INSERT INTO campaigns (description, fingerprint, total)
+                    VALUES (?, ?, (SELECT COUNT(*) FROM users WHERE delivery_status IS NULL))
+                """, (description, fingerprint)).lastrowid
+        except Exception as e:
+            logger.error(f"Error creating campaign: {e}")
+            return None
+    
+    def get_campaign(self, campaign_id: int) -> Optional[dict]:
+        """Get a campaign with the number of recipients in each delivery status"""
+        try:
+            with self.pool.reader() as conn:
+                row = conn.execute(
+                    "SELECT * FROM campaigns WHERE campaign_id = ?", (campaign_id,)
+                ).fetchone()
+                if not row:
+                    return None
+                counts = conn.execute("""
+                    SELECT status, COUNT(*) AS count FROM campaign_deliveries
+                    WHERE campaign_id = ? GROUP BY status
+                """, (campaign_id,)).fetchall()
             
-            # Add referral
-            cursor.execute("""
-                INSERT INTO referrals (referrer_id, referred_id)
-                VALUES (?, ?)
-            """, (referrer_id, referred_id))
+            campaign = dict(row)
+            campaign['deliveries'] = {r['status']: r['count'] for r in counts}
+            return campaign
+        except Exception as e:
+            logger.error(f"Error getting campaign: {e}")
+            return None
+    
+    def get_campaigns(self, statuses: Optional[Sequence[str]] = None, limit: int = 10) -> List[dict]:
+        """Get the latest campaigns, newest first, with their delivery counts"""
+        try:
+            with self.pool.reader() as conn:
+                if statuses:
+                    rows = conn.execute(f"""
+                        SELECT * FROM campaigns WHERE status IN ({', '.join('?' * len(statuses))})
+                        ORDER BY campaign_id DESC LIMIT ?
+                    """, (*statuses, limit)).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT * FROM campaigns ORDER BY campaign_id DESC LIMIT ?", (limit,)
+                    ).fetchall()
+                campaigns = [dict(row) for row in rows]
+                if not campaigns:
+                    return []
+                
+                counts = conn.execute(f"""
+                    SELECT campaign_id, status, COUNT(*) AS count FROM campaign_deliveries
+                    WHERE campaign_id IN ({', '.join('?' * len(campaigns))})
+                    GROUP BY campaign_id, status
+                """, [campaign['campaign_id'] for campaign in campaigns]).fetchall()
             
-            # Update referrer points
-            cursor.execute("""
-                UPDATE users SET points = points + ? WHERE user_id = ?
-            """, (config.POINTS_PER_REFERRAL, referrer_id))
+            deliveries: Dict[int, dict] = {campaign['campaign_id']: {} for campaign in campaigns}
+            for r in counts:
+                deliveries[r['campaign_id']][r['status']] = r['count']
+            for campaign in campaigns:
+                campaign['deliveries'] = deliveries[campaign['campaign_id']]
+            return campaigns
+        except Exception as e:
+            logger.error(f"Error getting campaigns: {e}")
+            return []
+    
+    def schedule_campaign(self, description: str, fingerprint: str, payload: str,
+                          scheduled_at: datetime) -> Optional[int]:
+        """
+        Store a campaign for the campaign runner to start at scheduled_at
+        
+        Args:
+            description: Human-readable summary of the payload
+            fingerprint: Hash of the payload, checked whenever the campaign (re)starts
+            payload: Announcement definition (JSON) the runner rebuilds the payload from
+            scheduled_at: When to start
             
-            conn.commit()
-            conn.close()
+        Returns:
+            The new campaign ID, or None on error
+        """
+        try:
+            stamp = scheduled_at.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            with self.pool.writer() as conn:
+                return conn.execute("""
+                    INSERT INTO campaigns (description, fingerprint, status, payload, scheduled_at)
+                    VALUES (?, ?, 'scheduled', ?, ?)
+                """, (description, fingerprint, payload, stamp)).lastrowid
+        except Exception as e:
+            logger.error(f"Error scheduling campaign: {e}")
+            return None
+    
+    def claim_due_campaign(self) -> Optional[dict]:
+        """
+        Mark the scheduled campaign that is due first as running and return it
+        
+        The audience is counted when the campaign first starts (its cursor is
+        still at the beginning), so users who joined since it was scheduled
+        are included in the progress reports.
+        
+        Returns:
+            The campaign like get_campaign, or None if none is due or on error
+        """
+        try:
+            self.buffer.flush()
+            with self.pool.writer() as conn:
+                # Lock first, so two runners never start the same campaign
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("""
+                    SELECT campaign_id FROM campaigns
+                    WHERE status = 'scheduled' AND scheduled_at <= CURRENT_TIMESTAMP
+                    ORDER BY scheduled_at, campaign_id
+                    LIMIT 1
+                """).fetchone()
+                if row is None:
+                    return None
+                conn.execute("""
+                    UPDATE campaigns
+                    SET status = 'running', finished_at = NULL,
+                        total = CASE WHEN last_user_id = 0
+                                     THEN (SELECT COUNT(*) FROM users WHERE delivery_status IS NULL)
+                                     ELSE total END
+                    WHERE campaign_id = ?
+                """, (row[0],))
+            return self.get_campaign(row[0])
+        except Exception as e:
+            logger.error(f"Error claiming due campaign: {e}")
+            return None
+    
+    def set_campaign_status(self, campaign_id: int, status: str, expected: Sequence[str],
+                            scheduled_at: Optional[datetime] = None) -> bool:
+        """
+        Move a campaign to status if it is in one of the expected statuses
+        
+        Checking and changing in one statement makes the transitions safe
+        against the runner finishing or claiming the campaign meanwhile.
+        
+        Returns:
+            True if the campaign was found in an expected status and changed
+        """
+        try:
+            stamp = scheduled_at.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S') if scheduled_at else None
+            with self.pool.writer() as conn:
+                cursor = conn.execute(f"""
+                    UPDATE campaigns
+                    SET status = ?,
+                        finished_at = CASE WHEN ? IN ('finished', 'cancelled') THEN CURRENT_TIMESTAMP END,
+                        scheduled_at = COALESCE(?, scheduled_at)
+                    WHERE campaign_id = ? AND status IN ({', '.join('?' * len(expected))})
+                """, (status, status, stamp, campaign_id, *expected))
+            return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error setting campaign status: {e}")
+            return False
+    
+    def claim_campaign_recipients(self, campaign_id: int, limit: int = 1000) -> Optional[List[int]]:
+        """
+        Hand out the next page of a campaign's recipients (keyset pagination)
+        
+        Reads deliverable users after the campaign's cursor, journals the
+        ones it hasn't seen yet as pending and moves the cursor past them,
+        all in one transaction. The cursor is the resume checkpoint: users
+        before it are in the journal, users after it have not been touched.
+        
+        Returns:
+            User IDs in ascending order (empty once every user was handed
+            out), or None on error
+        """
+        try:
+            self.buffer.flush()
+            with self.pool.writer() as conn:
+                # Lock before reading the cursor, so two processes resuming the
+                # same campaign get different pages
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT last_user_id FROM campaigns WHERE campaign_id = ?", (campaign_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+                after_user_id = row[0]
+                
+                while True:
+                    page = [r[0] for r in conn.execute("""
+                        SELECT user_id FROM users
+                        WHERE user_id > ? AND delivery_status IS NULL
+                        ORDER BY user_id
+                        LIMIT ?
+                    """, (after_user_id, limit))]
+                    if not page:
+                        return []
+                    after_user_id = page[-1]
+                    
+                    # Only campaigns journaled before the cursor existed have rows here
+                    known = {r[0] for r in conn.execute("""
+                        SELECT user_id FROM campaign_deliveries
+                        WHERE campaign_id = ? AND user_id BETWEEN ? AND ?
+                    """, (campaign_id, page[0], page[-1]))}
+                    user_ids = [user_id for user_id in page if user_id not in known]
+                    conn.executemany(
+                        "INSERT INTO campaign_deliveries (campaign_id, user_id) VALUES (?, ?)",
+                        [(campaign_id, user_id) for user_id in user_ids]
+                    )
+                    conn.execute(
+                        "UPDATE campaigns SET last_user_id = ? WHERE campaign_id = ?",
+                        (after_user_id, campaign_id)
+                    )
+                    if user_ids:
+                        return user_ids
+        except Exception as e:
+            logger.error(f"Error claiming campaign recipients: {e}")
+            return None
+    
+    def get_campaign_recipients(self, campaign_id: int, after_user_id: int = 0,
+                                limit: int = 1000) -> Optional[List[int]]:
+        """
+        Get the next journaled recipients that are still pending or failed (keyset pagination)
+        
+        Returns:
+            User IDs after after_user_id in ascending order, or None on error
+        """
+        try:
+            with self.pool.reader() as conn:
+                # Users suppressed since the campaign started are skipped too
+                rows = conn.execute("""
+                    SELECT d.user_id FROM campaign_deliveries d
+                    JOIN users u ON u.user_id = d.user_id AND u.delivery_status IS NULL
+                    WHERE d.campaign_id = ? AND d.user_id > ? AND d.status IN ('pending', 'failed')
+                    ORDER BY d.user_id
+                    LIMIT ?
+                """, (campaign_id, after_user_id, limit)).fetchall()
+            return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting campaign recipients: {e}")
+            return None
+    
+    def record_deliveries(self, campaign_id: int,
+                          results: List[Tuple[int, str, Optional[int], Optional[str]]]) -> bool:
+        """
+        Store a batch of delivery outcomes in one transaction
+        
+        Args:
+            campaign_id: Campaign the deliveries belong to
+            results: (user_id, status, message_id, error) tuples
+        """
+        try:
+            with self.pool.writer() as conn:
+                conn.executemany("""
+                    UPDATE campaign_deliveries
+                    SET status = ?, message_id = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE campaign_id = ? AND user_id = ?
+                """, [(status, message_id, error, campaign_id, user_id)
+                      for user_id, status, message_id, error in results])
             return True
         except Exception as e:
-            logger.error(f"Error adding referral: {e}")
+            logger.error(f"Error recording deliveries: {e}")
+            return False
+    
+    def finish_campaign(self, campaign_id: int) -> bool:
+        """Mark a campaign as finished"""
+        try:
+            with self.pool.writer() as conn:
+                conn.execute("""
+                    UPDATE campaigns SET status = 'finished', finished_at = CURRENT_TIMESTAMP
+                    WHERE campaign_id = ?
+                """, (campaign_id,))
+            return True
+        except Exception as e:
+            logger.error(f"Error finishing campaign: {e}")
             return False
     
     def get_user_referrals(self, user_id: int) -> List[dict]:
         """Get all referrals for a user"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT u.user_id, u.username, u.first_name, r.created_at
-                FROM referrals r
-                JOIN users u ON r.referred_id = u.user_id
-                WHERE r.referrer_id = ?
-                ORDER BY r.created_at DESC
-            """, (user_id,))
-            
-            rows = cursor.fetchall()
-            conn.close()
+            with self.pool.reader() as conn:
+                rows = conn.execute("""
+                    SELECT u.user_id, u.username, u.first_name, r.created_at
+                    FROM referrals r
+                    JOIN users u ON r.referred_id = u.user_id
+                    WHERE r.referrer_id = ?
+                    ORDER BY r.created_at DESC
+                """, (user_id,)).fetchall()
             
             return [dict(row) for row in rows]
         except Exception as e:
@@ -190,35 +1075,71 @@ class Database:
         user = self.get_user(user_id)
         return user['points'] if user else 0
     
+    def _count(self, query: str, params: tuple = ()) -> int:
+        """Run a COUNT(*) AS count query on a read connection"""
+        with self.pool.reader() as conn:
+            result = conn.execute(query, params).fetchone()
+        return result['count'] if result else 0
+    
     def get_referral_count(self, user_id: int) -> int:
         """Get count of user's referrals"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT COUNT(*) as count FROM referrals WHERE referrer_id = ?
-            """, (user_id,))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            return result['count'] if result else 0
+            with self.pool.reader() as conn:
+                row = conn.execute(
+                    "SELECT referral_count FROM users WHERE user_id = ?", (user_id,)
+                ).fetchone()
+            return row['referral_count'] if row else 0
         except Exception as e:
             logger.error(f"Error getting referral count: {e}")
             return 0
     
+    def verify_referral_counts(self, repair: bool = False) -> List[dict]:
+        """
+        Compare users.referral_count with the referrals table
+        
+        Args:
+            repair: Overwrite wrong counters with the recomputed value
+            
+        Returns:
+            List of mismatches as dicts with user_id, stored and actual
+        """
+        try:
+            with self.pool.writer() as conn:
+                rows = conn.execute("""
+                    SELECT u.user_id, u.referral_count AS stored, COALESCE(r.cnt, 0) AS actual
+                    FROM users u
+                    LEFT JOIN (
+                        SELECT referrer_id, COUNT(*) AS cnt FROM referrals GROUP BY referrer_id
+                    ) r ON r.referrer_id = u.user_id
+                    WHERE u.referral_count != COALESCE(r.cnt, 0)
+                """).fetchall()
+                mismatches = [dict(row) for row in rows]
+                
+                if repair and mismatches:
+                    conn.executemany(
+                        "UPDATE users SET referral_count = ? WHERE user_id = ?",
+                        [(m['actual'], m['user_id']) for m in mismatches]
+                    )
+                    self.user_cache.invalidate(*(m['user_id'] for m in mismatches))
+                    if self._leaderboard is not None:
+                        for m in mismatches:
+                            self._leaderboard.set(m['user_id'], m['actual'])
+            
+            if mismatches:
+                logger.warning(
+                    f"Found {len(mismatches)} wrong referral counters"
+                    + (" (repaired)" if repair else "")
+                )
+            return mismatches
+        except Exception as e:
+            logger.error(f"Error verifying referral counts: {e}")
+            return []
+    
     def get_total_users(self) -> int:
         """Get total number of users"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) as count FROM users")
-            result = cursor.fetchone()
-            conn.close()
-            
-            return result['count'] if result else 0
+            self.buffer.flush()
+            return self._count("SELECT total_users AS count FROM stats WHERE id = 1")
         except Exception as e:
             logger.error(f"Error getting total users: {e}")
             return 0
@@ -226,14 +1147,7 @@ class Database:
     def get_total_referrals(self) -> int:
         """Get total number of referrals"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) as count FROM referrals")
-            result = cursor.fetchone()
-            conn.close()
-            
-            return result['count'] if result else 0
+            return self._count("SELECT total_referrals AS count FROM stats WHERE id = 1")
         except Exception as e:
             logger.error(f"Error getting total referrals: {e}")
             return 0
@@ -241,14 +1155,8 @@ class Database:
     def get_subscribed_users_count(self) -> int:
         """Get count of subscribed users"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) as count FROM users WHERE is_subscribed = 1")
-            result = cursor.fetchone()
-            conn.close()
-            
-            return result['count'] if result else 0
+            self.buffer.flush()
+            return self._count("SELECT subscribed_users AS count FROM stats WHERE id = 1")
         except Exception as e:
             logger.error(f"Error getting subscribed users count: {e}")
             return 0
@@ -256,50 +1164,421 @@ class Database:
     def get_users_with_phone_count(self) -> int:
         """Get count of users who shared phone number"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) as count FROM users WHERE phone_number IS NOT NULL")
-            result = cursor.fetchone()
-            conn.close()
-            
-            return result['count'] if result else 0
+            self.buffer.flush()
+            return self._count("SELECT users_with_phone AS count FROM stats WHERE id = 1")
         except Exception as e:
             logger.error(f"Error getting users with phone count: {e}")
             return 0
     
     def get_top_referrers(self, limit: int = 10) -> List[dict]:
         """Get top referrers by referral count"""
+        return self.get_leaderboard_page(0, limit)
+    
+    def get_stats_snapshot(self, top: int = 50) -> dict:
+        """
+        Get every /stats counter and the top referrers as of one moment
+        
+        The counters come from the trigger-maintained stats row, so the cost
+        does not grow with the number of users. Both reads share one read
+        transaction and therefore see the same snapshot.
+        
+        Args:
+            top: Number of top referrers to include
+            
+        Returns:
+            Dict with total_users, subscribed_users, users_with_phone,
+            total_referrals and top_referrers (user dicts with rank)
+        """
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            self.buffer.flush()
+            with self.pool.reader() as conn:
+                conn.execute("BEGIN")
+                counters = conn.execute("""
+                    SELECT total_users, subscribed_users, users_with_phone, total_referrals
+                    FROM stats WHERE id = 1
+                """).fetchone()
+                rows = conn.execute("""
+                    SELECT user_id, username, first_name, last_name, phone_number,
+                           points, referral_count
+                    FROM users
+                    WHERE referral_count > 0
+                    ORDER BY referral_count DESC, user_id
+                    LIMIT ?
+                """, (top,)).fetchall()
             
-            cursor.execute("""
-                SELECT 
-                    u.user_id,
-                    u.username,
-                    u.first_name,
-                    u.last_name,
-                    u.phone_number,
-                    u.points,
-                    COUNT(r.id) as referral_count
-                FROM users u
-                LEFT JOIN referrals r ON u.user_id = r.referrer_id
-                GROUP BY u.user_id
-                HAVING referral_count > 0
-                ORDER BY referral_count DESC
-                LIMIT ?
-            """, (limit,))
+            snapshot = dict(counters) if counters else empty_stats_snapshot()
+            snapshot['top_referrers'] = [
+                dict(row, rank=position) for position, row in enumerate(rows, 1)
+            ]
+            return snapshot
+        except Exception as e:
+            logger.error(f"Error getting stats snapshot: {e}")
+            return empty_stats_snapshot()
+    
+    def get_leaderboard_page(self, offset: int = 0, limit: int = 10) -> List[dict]:
+        """
+        Get a slice of the referral ranking with user details
+        
+        Args:
+            offset: Number of top referrers to skip
+            limit: Maximum number of rows
             
-            rows = cursor.fetchall()
-            conn.close()
+        Returns:
+            List of user dicts with rank and referral_count, best first
+        """
+        try:
+            entries = self.leaderboard.page(offset, limit)
+            if not entries:
+                return []
+            
+            with self.pool.reader() as conn:
+                placeholders = ",".join("?" * len(entries))
+                rows = conn.execute(f"""
+                    SELECT user_id, username, first_name, last_name, phone_number, points
+                    FROM users WHERE user_id IN ({placeholders})
+                """, [user_id for user_id, _ in entries]).fetchall()
+            details = {row['user_id']: dict(row) for row in rows}
+            
+            page = []
+            for position, (user_id, count) in enumerate(entries, offset + 1):
+                row = details.get(user_id, {'user_id': user_id})
+                row['referral_count'] = count
+                row['rank'] = position
+                page.append(row)
+            return page
+        except Exception as e:
+            logger.error(f"Error getting leaderboard page: {e}")
+            return []
+    
+    def get_rank(self, user_id: int) -> Optional[int]:
+        """Get a user's 1-based leaderboard position (None without referrals)"""
+        try:
+            return self.leaderboard.rank_of(user_id)
+        except Exception as e:
+            logger.error(f"Error getting rank: {e}")
+            return None
+    
+    def get_users_with_referrals(self) -> List[dict]:
+        """Get every user who referred at least one person"""
+        try:
+            with self.pool.reader() as conn:
+                rows = conn.execute("""
+                    SELECT user_id, first_name, last_name, username,
+                           phone_number, referral_count
+                    FROM users
+                    WHERE referral_count > 0
+                    ORDER BY referral_count DESC, first_name ASC
+                """).fetchall()
             
             return [dict(row) for row in rows]
         except Exception as e:
-            logger.error(f"Error getting top referrers: {e}")
+            logger.error(f"Error getting users with referrals: {e}")
             return []
 
 
-# Create database instance
-db = Database()
+class DatabaseExecutor:
+    """Runs blocking database calls on dedicated worker threads
+    
+    Jobs go through a bounded queue. Callers inside the event loop wait for a
+    free slot instead of piling up work, so a burst of updates applies
+    backpressure rather than growing memory without limit.
+    """
+    
+    def __init__(self, workers: int = 1, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"db-executor-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def _worker(self):
+        """Execute queued jobs until a shutdown sentinel arrives"""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            func, args, kwargs, loop, future = job
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                loop.call_soon_threadsafe(self._resolve, future, None, e)
+            else:
+                loop.call_soon_threadsafe(self._resolve, future, result, None)
+    
+    def _resolve(self, future: asyncio.Future, result: Any, error: Optional[BaseException]):
+        """Free the job's queue slot and hand its result back to the awaiting coroutine"""
+        # Released here rather than by the caller: a cancelled caller's job
+        # still occupies the queue until a worker has run it
+        self._slots.release()
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    
+    async def submit(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on a database thread and await the result"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+        
+        await self._slots.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._queue.put_nowait((func, args, kwargs, loop, future))
+        except BaseException:
+            self._slots.release()
+            raise
+        return await future
+    
+    def shutdown(self):
+        """Finish queued jobs and stop the worker threads"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class AsyncDatabase(Storage):
+    """Awaitable counterpart of Database for use inside the event loop
+    
+    Every method mirrors the Database method of the same name but runs it on
+    the executor threads, so a slow write never stalls other updates.
+    """
+    
+    def __init__(self, database: Database, executor: Optional[DatabaseExecutor] = None):
+        self.db = database
+        self.executor = executor or DatabaseExecutor(
+            workers=config.DB_EXECUTOR_WORKERS,
+            max_queue=config.DB_EXECUTOR_QUEUE_SIZE
+        )
+    
+    async def add_user(self, user_id: int, username: Optional[str] = None,
+                       first_name: Optional[str] = None, last_name: Optional[str] = None,
+                       referrer_id: Optional[int] = None) -> bool:
+        """Add new user to database"""
+        return await self.executor.submit(
+            self.db.add_user, user_id, username, first_name, last_name, referrer_id
+        )
+    
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        """Get user by ID"""
+        return await self.executor.submit(self.db.get_user, user_id)
+    
+    async def get_profile(self, user_id: int) -> Optional[UserProfile]:
+        """Get user fields, points, referral count and flags in one query"""
+        return await self.executor.submit(self.db.get_profile, user_id)
+    
+    async def update_user_subscription(self, user_id: int, is_subscribed: bool) -> bool:
+        """Update user subscription status"""
+        return await self.executor.submit(self.db.update_user_subscription, user_id, is_subscribed)
+    
+    async def update_phone_number(self, user_id: int, phone_number: str) -> bool:
+        """Update user phone number"""
+        return await self.executor.submit(self.db.update_phone_number, user_id, phone_number)
+    
+    async def add_referral(self, referrer_id: int, referred_id: int) -> bool:
+        """Add referral and update points"""
+        return await self.executor.submit(self.db.add_referral, referrer_id, referred_id)
+    
+    async def get_user_ids_page(self, after_user_id: int = 0, limit: int = 1000,
+                                referred_only: bool = False, deliverable_only: bool = False) -> List[int]:
+        """Get the next user IDs in ascending order (keyset pagination)"""
+        return await self.executor.submit(
+            self.db.get_user_ids_page, after_user_id, limit, referred_only, deliverable_only
+        )
+    
+    async def suppress_users(self, results: List[Tuple[int, str]]) -> int:
+        """Stop broadcasting to users that can't be reached"""
+        return await self.executor.submit(self.db.suppress_users, results)
+    
+    async def unsuppress_user(self, user_id: int) -> bool:
+        """Include a user in broadcasts again"""
+        return await self.executor.submit(self.db.unsuppress_user, user_id)
+    
+    async def get_sweep_checkpoint(self, name: str) -> Optional[dict]:
+        """Get the progress saved by a sweep"""
+        return await self.executor.submit(self.db.get_sweep_checkpoint, name)
+    
+    async def reset_sweep_checkpoint(self, name: str) -> bool:
+        """Forget a sweep's progress"""
+        return await self.executor.submit(self.db.reset_sweep_checkpoint, name)
+    
+    async def save_subscription_sweep(self, name: str, results: List[Tuple[int, bool]],
+                                      last_user_id: int) -> int:
+        """Store a batch of re-checked subscription states and advance the checkpoint"""
+        return await self.executor.submit(self.db.save_subscription_sweep, name, results, last_user_id)
+    
+    async def record_membership(self, user_id: int, is_subscribed: bool, changed_at: datetime) -> bool:
+        """Apply a channel join or leave seen in a chat_member update"""
+        return await self.executor.submit(self.db.record_membership, user_id, is_subscribed, changed_at)
+    
+    async def revoke_referral(self, referred_id: int) -> List[int]:
+        """Delete the referrals of a user and take back the referrers' credit"""
+        return await self.executor.submit(self.db.revoke_referral, referred_id)
+    
+    async def get_user_referrals(self, user_id: int) -> List[dict]:
+        """Get all referrals for a user"""
+        return await self.executor.submit(self.db.get_user_referrals, user_id)
+    
+    async def get_media_file_id(self, path: str, sha256: str) -> Optional[str]:
+        """Get the Telegram file_id stored for a media file with this content"""
+        return await self.executor.submit(self.db.get_media_file_id, path, sha256)
+    
+    async def save_media_file_id(self, path: str, sha256: str, file_id: str) -> bool:
+        """Store the file_id of an upload"""
+        return await self.executor.submit(self.db.save_media_file_id, path, sha256, file_id)
+    
+    async def delete_media_file_id(self, path: str, sha256: str) -> bool:
+        """Forget a file_id that Telegram no longer accepts"""
+        return await self.executor.submit(self.db.delete_media_file_id, path, sha256)
+    
+    async def get_fsm_record(self, key: str, max_age: float) -> Optional[dict]:
+        """Get the FSM state and JSON data saved under a key"""
+        return await self.executor.submit(self.db.get_fsm_record, key, max_age)
+    
+    async def save_fsm_record(self, key: str, state: Optional[str], data: str) -> bool:
+        """Store the FSM state and JSON data for a key"""
+        return await self.executor.submit(self.db.save_fsm_record, key, state, data)
+    
+    async def delete_fsm_record(self, key: str) -> bool:
+        """Forget the FSM state and data for a key"""
+        return await self.executor.submit(self.db.delete_fsm_record, key)
+    
+    async def purge_fsm_records(self, max_age: float) -> int:
+        """Delete FSM records not touched for max_age seconds"""
+        return await self.executor.submit(self.db.purge_fsm_records, max_age)
+    
+    async def create_campaign(self, description: str, fingerprint: str) -> Optional[int]:
+        """Start a broadcast campaign to every deliverable user"""
+        return await self.executor.submit(self.db.create_campaign, description, fingerprint)
+    
+    async def get_campaign(self, campaign_id: int) -> Optional[dict]:
+        """Get a campaign with the number of recipients in each delivery status"""
+        return await self.executor.submit(self.db.get_campaign, campaign_id)
+    
+    async def get_campaigns(self, statuses: Optional[Sequence[str]] = None, limit: int = 10) -> List[dict]:
+        """Get the latest campaigns, newest first, with their delivery counts"""
+        return await self.executor.submit(self.db.get_campaigns, statuses, limit)
+    
+    async def schedule_campaign(self, description: str, fingerprint: str, payload: str,
+                                scheduled_at: datetime) -> Optional[int]:
+        """Store a campaign for the campaign runner to start at scheduled_at"""
+        return await self.executor.submit(self.db.schedule_campaign, description, fingerprint, payload, scheduled_at)
+    
+    async def claim_due_campaign(self) -> Optional[dict]:
+        """Mark the scheduled campaign that is due first as running and return it"""
+        return await self.executor.submit(self.db.claim_due_campaign)
+    
+    async def set_campaign_status(self, campaign_id: int, status: str, expected: Sequence[str],
+                                  scheduled_at: Optional[datetime] = None) -> bool:
+        """Move a campaign to status if it is in one of the expected statuses"""
+        return await self.executor.submit(self.db.set_campaign_status, campaign_id, status, expected, scheduled_at)
+    
+    async def claim_campaign_recipients(self, campaign_id: int, limit: int = 1000) -> Optional[List[int]]:
+        """Hand out the next page of a campaign's recipients and advance its cursor"""
+        return await self.executor.submit(self.db.claim_campaign_recipients, campaign_id, limit)
+    
+    async def get_campaign_recipients(self, campaign_id: int, after_user_id: int = 0,
+                                      limit: int = 1000) -> Optional[List[int]]:
+        """Get the next journaled recipients that are still pending or failed"""
+        return await self.executor.submit(self.db.get_campaign_recipients, campaign_id, after_user_id, limit)
+    
+    async def record_deliveries(self, campaign_id: int,
+                                results: List[Tuple[int, str, Optional[int], Optional[str]]]) -> bool:
+        """Store a batch of delivery outcomes in one transaction"""
+        return await self.executor.submit(self.db.record_deliveries, campaign_id, results)
+    
+    async def finish_campaign(self, campaign_id: int) -> bool:
+        """Mark a campaign as finished"""
+        return await self.executor.submit(self.db.finish_campaign, campaign_id)
+    
+    async def get_all_user_ids(self, deliverable_only: bool = False) -> List[int]:
+        """Get the IDs of every user"""
+        return await self.executor.submit(self.db.get_all_user_ids, deliverable_only)
+    
+    async def get_user_points(self, user_id: int) -> int:
+        """Get user points"""
+        return await self.executor.submit(self.db.get_user_points, user_id)
+    
+    async def get_referral_count(self, user_id: int) -> int:
+        """Get count of user's referrals"""
+        return await self.executor.submit(self.db.get_referral_count, user_id)
+    
+    async def verify_referral_counts(self, repair: bool = False) -> List[dict]:
+        """Compare users.referral_count with the referrals table"""
+        return await self.executor.submit(self.db.verify_referral_counts, repair)
+    
+    async def get_total_users(self) -> int:
+        """Get total number of users"""
+        return await self.executor.submit(self.db.get_total_users)
+    
+    async def get_total_referrals(self) -> int:
+        """Get total number of referrals"""
+        return await self.executor.submit(self.db.get_total_referrals)
+    
+    async def get_subscribed_users_count(self) -> int:
+        """Get count of subscribed users"""
+        return await self.executor.submit(self.db.get_subscribed_users_count)
+    
+    async def get_users_with_phone_count(self) -> int:
+        """Get count of users who shared phone number"""
+        return await self.executor.submit(self.db.get_users_with_phone_count)
+    
+    async def get_top_referrers(self, limit: int = 10) -> List[dict]:
+        """Get top referrers by referral count"""
+        return await self.executor.submit(self.db.get_top_referrers, limit)
+    
+    async def get_leaderboard_page(self, offset: int = 0, limit: int = 10) -> List[dict]:
+        """Get a slice of the referral ranking with user details"""
+        return await self.executor.submit(self.db.get_leaderboard_page, offset, limit)
+    
+    async def get_rank(self, user_id: int) -> Optional[int]:
+        """Get a user's 1-based leaderboard position (None without referrals)"""
+        return await self.executor.submit(self.db.get_rank, user_id)
+    
+    async def get_users_with_referrals(self) -> List[dict]:
+        """Get every user who referred at least one person"""
+        return await self.executor.submit(self.db.get_users_with_referrals)
+    
+    async def get_stats_snapshot(self, top: int = 50) -> dict:
+        """Get every /stats counter and the top referrers as of one moment"""
+        return await self.executor.submit(self.db.get_stats_snapshot, top)
+    
+    def cache_stats(self) -> dict:
+        """Hit/miss counters of the user row cache (no I/O, safe to call directly)"""
+        return self.db.user_cache.stats()
+    
+    async def close(self):
+        """Stop the executor threads after pending jobs finish, then close the pool"""
+        # Joining the threads and checkpointing the WAL block, so neither runs
+        # on the event loop thread
+        await asyncio.to_thread(self.executor.shutdown)
+        await asyncio.to_thread(self.db.close)
+
+
+def create_storage() -> Storage:
+    """Build the storage backend selected by config.STORAGE_BACKEND"""
+    backend = config.STORAGE_BACKEND.lower()
+    
+    if backend == "sqlite":
+        return AsyncDatabase(Database())
+    if backend == "postgres":
+        from storage.postgres import PostgresStorage
+        return PostgresStorage(
+            config.DATABASE_URL,
+            min_size=config.PG_POOL_MIN_SIZE,
+            max_size=config.PG_POOL_MAX_SIZE
+        )
+    
+    raise ValueError(f"Unknown STORAGE_BACKEND: {config.STORAGE_BACKEND}")
+
+
+# Create storage instance
+adb = create_storage()
 
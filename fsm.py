@@ -0,0 +1,113 @@
+"""
+Persistent FSM storage
+Conversation states are written through to the storage backend, so they
+survive restarts, and the most recently used ones are kept in a bounded
+LRU + TTL tier in memory. Unlike MemoryStorage, which keeps a record for every
+user it ever saw, memory stays flat however many users start the bot.
+"""
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from cache import LRUCache
+from config import config
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Expired records are purged at most this often (seconds)
+PURGE_INTERVAL = 3600
+
+# (state, data) of a key that has nothing saved; cached too, because the FSM
+# middleware reads the state of every incoming update
+EMPTY: Tuple[Optional[str], Dict[str, Any]] = (None, {})
+
+
+class TieredFSMStorage(BaseStorage):
+    """
+    aiogram FSM storage: storage backend + in-memory hot tier
+
+    Reads are answered from the hot tier when possible and loaded from the
+    backend otherwise. Writes go to the backend first; a record with no state
+    and no data is deleted rather than stored. Records not touched for
+    state_ttl seconds are treated as abandoned and purged.
+
+    With several bot instances a state changed by one instance may be seen by
+    the others only after the hot tier's ttl.
+    """
+
+    def __init__(self, storage: Storage, max_entries: int = config.FSM_CACHE_MAX_ENTRIES,
+                 ttl: float = config.FSM_CACHE_TTL, state_ttl: float = config.FSM_STATE_TTL):
+        self.storage = storage
+        self.state_ttl = state_ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.hot = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._purged_at = 0.0
+
+    async def _load(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Current (state, data) of a key; data must not be modified in place"""
+        name = self.key_builder.build(key)
+        record = self.hot.get(name)
+        if record is not None:
+            return record
+
+        generation = self.hot.generation
+        row = await self.storage.get_fsm_record(name, self.state_ttl)
+        record = (row['state'], json.loads(row['data'])) if row else EMPTY
+        self.hot.set(name, record, generation=generation)
+        return record
+
+    async def _save(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        """Write (state, data) through to the backend and the hot tier"""
+        if await self._load(key) == (state, data):
+            return
+
+        name = self.key_builder.build(key)
+        if state is None and not data:
+            await self.storage.delete_fsm_record(name)
+            self.hot.set(name, EMPTY)
+        else:
+            data = dict(data)
+            await self.storage.save_fsm_record(name, state, json.dumps(data, ensure_ascii=False))
+            self.hot.set(name, (state, data))
+
+        await self._purge_expired()
+
+    async def _purge_expired(self):
+        """Delete abandoned records from the backend, at most once per PURGE_INTERVAL"""
+        now = time.monotonic()
+        if self._purged_at and now - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        purged = await self.storage.purge_fsm_records(self.state_ttl)
+        if purged:
+            logger.info(f"Purged {purged} abandoned FSM states")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        _, data = await self._load(key)
+        await self._save(key, state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        state, _ = await self._load(key)
+        await self._save(key, state, data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(key)
+        return dict(data)
+
+    def stats(self) -> dict:
+        """Hot tier counters"""
+        return self.hot.stats()
+
+    async def close(self) -> None:
+        # The storage backend is closed by its owner
+        pass
@@ -6,6 +6,7 @@ from . import subscription
 from . import contact
 from . import menu
 from . import admin
+from . import membership
 
-__all__ = ['start', 'subscription', 'contact', 'menu', 'admin']
+__all__ = ['start', 'subscription', 'contact', 'menu', 'admin', 'membership']
 
@@ -2,14 +2,23 @@
 Admin command handlers
 """
 from aiogram import Router, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.types import Message, BufferedInputFile
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Optional
 from zoneinfo import ZoneInfo
+import html
 import io
 
-from database import db
+from broadcaster import (
+    CANCELLED, FINISHED, PAUSED, RUNNING, SCHEDULED, SENT, Announcement, CampaignRunner, list_announcements,
+    load_announcement, schedule_announcement
+)
+from database import adb
 from config import config
+from fsm import TieredFSMStorage
+from utils import subscription_cache_stats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,7 +32,7 @@ def is_admin(user_id: int) -> bool:
 
 
 @router.message(Command("stats"))
-async def cmd_stats(message: Message):
+async def cmd_stats(message: Message, fsm_storage: BaseStorage):
     """Show bot statistics (admin only) - Send as file"""
     user_id = message.from_user.id
     
@@ -35,12 +44,13 @@ async def cmd_stats(message: Message):
     
     await message.answer("📊 Statistika tayyorlanmoqda...")
     
-    # Gather statistics
-    total_users = db.get_total_users()
-    total_referrals = db.get_total_referrals()
-    subscribed_users = db.get_subscribed_users_count()
-    users_with_phone = db.get_users_with_phone_count()
-    top_referrers = db.get_top_referrers(limit=50)
+    # Gather statistics (one consistent read)
+    snapshot = await adb.get_stats_snapshot(top=50)
+    total_users = snapshot['total_users']
+    total_referrals = snapshot['total_referrals']
+    subscribed_users = snapshot['subscribed_users']
+    users_with_phone = snapshot['users_with_phone']
+    top_referrers = snapshot['top_referrers']
     
     # Build statistics text
     stats_text = "=" * 50 + "\n"
@@ -60,6 +70,24 @@ async def cmd_stats(message: Message):
         stats_text += f"📊 Obuna darajasi:                {subscription_rate:.1f}%\n"
         stats_text += f"📊 Telefon ulashish darajasi:     {phone_rate:.1f}%\n\n"
     
+    cache_stats = adb.cache_stats()
+    stats_text += "💾 KESH\n"
+    stats_text += "-" * 50 + "\n"
+    stats_text += f"Foydalanuvchi keshi:             {cache_stats['entries']} ta yozuv\n"
+    stats_text += f"Topildi / topilmadi:             {cache_stats['hits']} / {cache_stats['misses']}"
+    stats_text += f" ({cache_stats['hit_rate'] * 100:.1f}%)\n"
+    
+    subscription_stats = subscription_cache_stats()
+    stats_text += f"Obuna keshi:                     {subscription_stats['entries']} ta yozuv\n"
+    stats_text += f"Topildi / topilmadi:             {subscription_stats['hits']} / {subscription_stats['misses']}"
+    stats_text += f" ({subscription_stats['hit_rate'] * 100:.1f}%)\n"
+    stats_text += f"Telegram so'rovlari:             {subscription_stats['api_calls']}\n"
+    
+    if isinstance(fsm_storage, TieredFSMStorage):
+        fsm_stats = fsm_storage.stats()
+        stats_text += f"Holatlar keshi (FSM):            {fsm_stats['entries']} ta yozuv\n"
+    stats_text += "\n"
+    
     # Top referrers
     stats_text += "=" * 50 + "\n"
     stats_text += "🏆 TOP 50 REFERALCHILAR\n"
@@ -120,26 +148,7 @@ async def cmd_users(message: Message):
     
     # Get users with referrals
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                u.user_id,
-                u.first_name,
-                u.last_name,
-                u.username,
-                u.phone_number,
-                COUNT(r.id) as referral_count
-            FROM users u
-            INNER JOIN referrals r ON u.user_id = r.referrer_id
-            GROUP BY u.user_id, u.first_name, u.last_name, u.username, u.phone_number
-            HAVING referral_count >= 1
-            ORDER BY referral_count DESC, u.first_name ASC
-        """)
-        
-        rows = cursor.fetchall()
-        conn.close()
+        rows = await adb.get_users_with_referrals()
         
         # Build users text
         users_text = "=" * 70 + "\n"
@@ -211,6 +220,181 @@ async def cmd_users(message: Message):
         await message.answer(f"❌ Xatolik yuz berdi: {str(e)}")
 
 
+@router.message(Command("verify"))
+async def cmd_verify(message: Message):
+    """Check and repair stored referral counters (admin only)"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        await message.answer("⛔ Bu buyruq faqat administratorlar uchun.")
+        logger.warning(f"Unauthorized verify attempt by user {user_id}")
+        return
+    
+    mismatches = await adb.verify_referral_counts(repair=True)
+    
+    if not mismatches:
+        await message.answer("✅ Barcha referal hisoblagichlari to'g'ri.")
+        return
+    
+    verify_text = f"⚠️ {len(mismatches)} ta noto'g'ri hisoblagich tuzatildi:\n\n"
+    for mismatch in mismatches[:20]:
+        verify_text += f"User {mismatch['user_id']}: {mismatch['stored']} → {mismatch['actual']}\n"
+    
+    await message.answer(verify_text)
+    logger.info(f"Referral counters verified by admin {user_id}: {len(mismatches)} repaired")
+
+
+def parse_campaign_id(command: CommandObject) -> Optional[int]:
+    """Campaign ID given as the command's argument"""
+    try:
+        return int((command.args or "").strip().lstrip("#"))
+    except ValueError:
+        return None
+
+
+def format_uz_time(stamp: Optional[str]) -> str:
+    """UTC timestamp from the database as Uzbekistan time"""
+    if not stamp:
+        return "-"
+    moment = datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return moment.astimezone(ZoneInfo("Asia/Tashkent")).strftime('%Y-%m-%d %H:%M')
+
+
+@router.message(Command("schedule"))
+async def cmd_schedule(message: Message, command: CommandObject, campaign_runner: CampaignRunner):
+    """Schedule an announcement, or the replied-to text, as a campaign (admin only)"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        await message.answer("⛔ Bu buyruq faqat administratorlar uchun.")
+        logger.warning(f"Unauthorized schedule attempt by user {user_id}")
+        return
+    
+    args = (command.args or "").split()
+    reply = message.reply_to_message
+    names = list_announcements()
+    try:
+        if reply is not None and reply.text:
+            # The replied-to message is sent as it is, formatting included
+            announcement = Announcement.from_dict("text", {"text": reply.html_text})
+        elif args and args[0] in names:
+            announcement = load_announcement(args.pop(0))
+        else:
+            await message.answer(
+                "Foydalanish: /schedule &lt;e'lon&gt; [YYYY-MM-DD HH:MM]\n"
+                "yoki matnli xabarga javoban: /schedule [YYYY-MM-DD HH:MM]\n\n"
+                f"E'lonlar: {', '.join(names) or '-'}"
+            )
+            return
+    except (FileNotFoundError, ValueError) as e:
+        await message.answer(f"❌ Xatolik: {html.escape(str(e))}")
+        return
+    
+    uz_tz = ZoneInfo("Asia/Tashkent")
+    if args:
+        try:
+            scheduled_at = datetime.strptime(" ".join(args), '%Y-%m-%d %H:%M').replace(tzinfo=uz_tz)
+        except ValueError:
+            await message.answer("❌ Vaqt formati: YYYY-MM-DD HH:MM (UZT)")
+            return
+    else:
+        scheduled_at = datetime.now(uz_tz)
+    
+    try:
+        campaign_id = await schedule_announcement(announcement, scheduled_at)
+    except (FileNotFoundError, ValueError) as e:
+        await message.answer(f"❌ Xatolik: {html.escape(str(e))}")
+        return
+    if campaign_id is None:
+        await message.answer("❌ Kampaniyani saqlab bo'lmadi.")
+        return
+    
+    campaign_runner.wake()
+    await message.answer(
+        f"📅 Kampaniya #{campaign_id} rejalashtirildi: {scheduled_at.strftime('%Y-%m-%d %H:%M')} (UZT)\n"
+        f"{html.escape(announcement.payload.describe())}\n\n"
+        f"/campaign_pause {campaign_id} · /campaign_cancel {campaign_id}"
+    )
+    logger.info(f"Campaign #{campaign_id} scheduled by admin {user_id} for {scheduled_at.isoformat()}")
+
+
+@router.message(Command("campaigns"))
+async def cmd_campaigns(message: Message):
+    """Show the latest campaigns and their progress (admin only)"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        await message.answer("⛔ Bu buyruq faqat administratorlar uchun.")
+        logger.warning(f"Unauthorized campaigns access attempt by user {user_id}")
+        return
+    
+    campaigns = await adb.get_campaigns(limit=10)
+    if not campaigns:
+        await message.answer("Hozircha kampaniyalar yo'q.")
+        return
+    
+    campaigns_text = "📣 KAMPANIYALAR\n\n"
+    for campaign in campaigns:
+        sent = campaign['deliveries'].get(SENT, 0)
+        campaigns_text += f"#{campaign['campaign_id']} {campaign['status']}: {sent}/{campaign['total']} yuborildi\n"
+        if campaign['status'] == SCHEDULED:
+            campaigns_text += f"   🕐 {format_uz_time(campaign['scheduled_at'])} (UZT)\n"
+        campaigns_text += f"   {html.escape(campaign['description'][:60])}\n"
+    
+    campaigns_text += "\n/campaign_start ID · /campaign_pause ID · /campaign_cancel ID"
+    await message.answer(campaigns_text)
+
+
+async def change_campaign(message: Message, command: CommandObject, campaign_runner: CampaignRunner,
+                          status: str, expected: tuple, done_text: str):
+    """Move the campaign given as the argument to status and let the runner know (admin only)"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        await message.answer("⛔ Bu buyruq faqat administratorlar uchun.")
+        logger.warning(f"Unauthorized campaign {status} attempt by user {user_id}")
+        return
+    
+    campaign_id = parse_campaign_id(command)
+    campaign = await adb.get_campaign(campaign_id) if campaign_id is not None else None
+    if campaign is None:
+        await message.answer("❌ Kampaniya topilmadi. Ro'yxat: /campaigns")
+        return
+    if not campaign['payload']:
+        await message.answer("❌ Bu kampaniya skript orqali yuborilgan, uni skript boshqaradi (--resume).")
+        return
+    
+    scheduled_at = datetime.now(timezone.utc) if status == SCHEDULED else None
+    if not await adb.set_campaign_status(campaign_id, status, expected, scheduled_at=scheduled_at):
+        await message.answer(f"❌ Kampaniya #{campaign_id} holati: {campaign['status']}")
+        return
+    
+    campaign_runner.wake()
+    await message.answer(done_text.format(campaign_id=campaign_id))
+    logger.info(f"Campaign #{campaign_id} set to {status} by admin {user_id}")
+
+
+@router.message(Command("campaign_start"))
+async def cmd_campaign_start(message: Message, command: CommandObject, campaign_runner: CampaignRunner):
+    """Start a scheduled campaign now, continue a paused one or retry a finished one's failures"""
+    await change_campaign(message, command, campaign_runner, SCHEDULED, (SCHEDULED, PAUSED, FINISHED),
+                          "▶️ Kampaniya #{campaign_id} hozir boshlanadi.")
+
+
+@router.message(Command("campaign_pause"))
+async def cmd_campaign_pause(message: Message, command: CommandObject, campaign_runner: CampaignRunner):
+    """Pause a scheduled or running campaign; /campaign_start continues it"""
+    await change_campaign(message, command, campaign_runner, PAUSED, (SCHEDULED, RUNNING),
+                          "⏸ Kampaniya #{campaign_id} to'xtatildi. Davom ettirish: /campaign_start {campaign_id}")
+
+
+@router.message(Command("campaign_cancel"))
+async def cmd_campaign_cancel(message: Message, command: CommandObject, campaign_runner: CampaignRunner):
+    """Cancel a campaign for good"""
+    await change_campaign(message, command, campaign_runner, CANCELLED, (SCHEDULED, RUNNING, PAUSED),
+                          "🚫 Kampaniya #{campaign_id} bekor qilindi.")
+
+
 @router.message(Command("admin"))
 async def cmd_admin(message: Message):
     """Show admin commands"""
@@ -224,6 +408,10 @@ async def cmd_admin(message: Message):
         "🔧 **ADMIN BUYRUQLARI**\n\n"
         "/stats - Bot statistikasini ko'rish\n"
         "/users - Referalli foydalanuvchilar ro'yxati\n"
+        "/verify - Referal hisoblagichlarini tekshirish\n"
+        "/schedule - E'lonni rejalashtirish\n"
+        "/campaigns - Kampaniyalar ro'yxati\n"
+        "/campaign\\_start, /campaign\\_pause, /campaign\\_cancel - Kampaniyani boshqarish\n"
         "/admin - Admin buyruqlar ro'yxati\n"
     )
     
@@ -5,7 +5,7 @@ from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 
-from database import db
+from database import adb
 from keyboards import get_main_menu_keyboard
 from utils import generate_referral_link
 import logging
@@ -31,7 +31,7 @@ async def handle_contact(message: Message, state: FSMContext):
         return
     
     # Update user's phone number
-    db.update_phone_number(user_id, contact.phone_number)
+    await adb.update_phone_number(user_id, contact.phone_number)
     logger.info(f"Contact saved for user {user_id}: {contact.phone_number}")
     
     # Clear state
@@ -39,9 +39,7 @@ async def handle_contact(message: Message, state: FSMContext):
     
     # Generate referral link
     referral_link = generate_referral_link(user_id)
-    points = db.get_user_points(user_id)
-    referral_count = db.get_referral_count(user_id)
-
+    
     success_text = (
         "❓ Qanday qilib tanishlarni qo'shish va ball yig'ish mumkin?\n\n"
         "👥 Sizga berilgan shaxsiy havola orqali kanalga kirgan har bir tanishingiz = +1 ball.\n\n"
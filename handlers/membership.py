@@ -0,0 +1,49 @@
+"""
+Channel membership handler
+Keeps users.is_subscribed current from chat_member updates, so subscription
+checks can answer from local state instead of calling get_chat_member.
+The bot must be an administrator of the channel to receive these updates.
+"""
+from aiogram import Router
+from aiogram.types import Chat, ChatMemberUpdated
+
+from config import config
+from database import adb
+from utils import SUBSCRIBED_STATUSES, remember_subscription
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+
+def is_channel(chat: Chat) -> bool:
+    """Check if the chat is config.CHANNEL_ID (given as @username or numeric ID)"""
+    channel = str(config.CHANNEL_ID)
+    if channel.startswith("@"):
+        return (chat.username or "").lower() == channel[1:].lower()
+    return str(chat.id) == channel
+
+
+@router.chat_member()
+async def on_channel_member_update(event: ChatMemberUpdated):
+    """Record joins and leaves of the channel"""
+    if not is_channel(event.chat):
+        return
+    
+    user_id = event.new_chat_member.user.id
+    was_subscribed = event.old_chat_member.status in SUBSCRIBED_STATUSES
+    is_subscribed = event.new_chat_member.status in SUBSCRIBED_STATUSES
+    
+    if was_subscribed == is_subscribed:
+        # e.g. a member promoted to admin
+        return
+    
+    remember_subscription(user_id, is_subscribed)
+    applied = await adb.record_membership(user_id, is_subscribed, event.date)
+    logger.info(f"User {user_id} {'joined' if is_subscribed else 'left'} the channel")
+    
+    if applied and not is_subscribed and config.REVOKE_REFERRAL_ON_LEAVE:
+        referrer_ids = await adb.revoke_referral(user_id)
+        for referrer_id in referrer_ids:
+            logger.info(f"Referral revoked: {referrer_id} -> {user_id} (user left the channel)")
@@ -2,10 +2,13 @@
 Main menu handlers
 """
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery
+import html
 import os
 
-from database import db
+from database import adb
+from media import asset_path, send_photo
 from keyboards import get_main_menu_keyboard
 from utils import generate_referral_link
 import logging
@@ -19,9 +22,6 @@ router = Router()
 async def show_referrals(message: Message):
     """Show user's referrals"""
     user_id = message.from_user.id
-    referrals = db.get_user_referrals(user_id)
-    referral_count = len(referrals)
-    
     referral_link = generate_referral_link(user_id)
     
     text = f"""Zangiota Residence yopiq taqdimot kanaliga qo'shiling va Telfon, Muzlatgich, Televizor, Duxovka, Kir yuvish mashinasi kabi yirik sovg'alarni yutib oling! 🎁
@@ -31,13 +31,14 @@ Konkursda ishtirok etish juda oson — pastdagi havola orqali kanalga o'ting 
 Shaxsiy havolangiz: \n\n{referral_link}"""
     
     # Try to send banner image with text as caption
-    banner_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "banner.jpg")
+    banner_path = asset_path("banner.jpg")
     
     if os.path.exists(banner_path):
         try:
-            photo = FSInputFile(banner_path)
-            await message.answer_photo(
-                photo=photo,
+            await send_photo(
+                message.bot,
+                message.chat.id,
+                banner_path,
                 caption=text,
                 parse_mode="HTML"
             )
@@ -55,15 +56,17 @@ Shaxsiy havolangiz: \n\n{referral_link}"""
 async def show_points(message: Message):
     """Show user's points"""
     user_id = message.from_user.id
-    points = db.get_user_points(user_id)
-    referral_count = db.get_referral_count(user_id)
+    profile = await adb.get_profile(user_id)
+    points = profile.points if profile else 0
+    referral_count = profile.referral_count if profile else 0
+    rank_line = f"🏆 Reytingdagi o‘rningiz: {profile.rank}\n\n" if profile and profile.rank else ""
     referral_link = generate_referral_link(user_id)
     text = (
         f"""📊 Mening ballarim: {points}
 
 👥 Qo‘shilgan tanishlar soni: {referral_count}
 
-🔥 Yana biroz harakat qiling!
+{rank_line}🔥 Yana biroz harakat qiling!
 
 Linkni yaqinlaringizga yuboring, guruhlarga ulashing — har bir qo‘shilgan odam sizni g‘oliblikka bir qadam yaqinlashtiradi! 🎁🚀
 
@@ -73,6 +76,27 @@ Shaxsiy havolangiz: \n\n{referral_link}"""
     await message.answer(text, parse_mode="HTML")
 
 
+@router.message(Command("top"))
+async def show_top(message: Message):
+    """Show the top referrers and the user's own place"""
+    user_id = message.from_user.id
+    top_referrers = await adb.get_leaderboard_page(0, 10)
+    rank = await adb.get_rank(user_id)
+    
+    text = "🏆 Eng ko‘p taklif qilganlar:\n\n"
+    if top_referrers:
+        for referrer in top_referrers:
+            name = html.escape(referrer.get('first_name') or "Ishtirokchi")
+            text += f"{referrer['rank']}. {name} — {referrer['referral_count']}\n"
+    else:
+        text += "Hozircha referallar yo'q.\n"
+    
+    if rank:
+        text += f"\n📍 Sizning o‘rningiz: {rank}"
+    
+    await message.answer(text, parse_mode="HTML")
+
+
 @router.message(F.text == "📚 Qo’llanma")
 async def show_knowledge_base(message: Message):
     """Show knowledge base"""
@@ -3,11 +3,12 @@ Start command handler
 """
 from aiogram import Router, F
 from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, FSInputFile
+from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 import os
 
-from database import db
+from database import adb
+from media import asset_path, send_photo
 from keyboards import get_subscription_keyboard, get_main_menu_keyboard
 from utils import check_user_subscription, extract_referrer_id, generate_referral_link
 import logging
@@ -63,11 +64,11 @@ async def cmd_start(message: Message, state: FSMContext):
             referrer_id = None
     
     # Add user to database
-    existing_user = db.get_user(user_id)
+    profile = await adb.get_profile(user_id)
     
-    if not existing_user:
+    if not profile:
         # New user
-        db.add_user(
+        await adb.add_user(
             user_id=user_id,
             username=user.username,
             first_name=user.first_name,
@@ -78,19 +79,25 @@ async def cmd_start(message: Message, state: FSMContext):
     else:
         # Existing user - update info if needed
         logger.info(f"Existing user: {user_id}")
+        
+        # A broadcast found them unreachable, but they are talking to the bot again
+        if profile.suppressed:
+            await adb.unsuppress_user(user_id)
+            logger.info(f"User {user_id} unsuppressed (was {profile.delivery_status})")
     
     # Check subscription status
-    is_subscribed = await check_user_subscription(message.bot, user_id)
+    is_subscribed = await check_user_subscription(message.bot, user_id, profile=profile)
     
     if not is_subscribed:
         # User not subscribed - show banner with welcome message first
-        banner_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "banner.jpg")
+        banner_path = asset_path("banner.jpg")
         
         if os.path.exists(banner_path):
             try:
-                photo = FSInputFile(banner_path)
-                await message.answer_photo(
-                    photo=photo,
+                await send_photo(
+                    message.bot,
+                    message.chat.id,
+                    banner_path,
                     caption=WELCOME_TEXT
                 )
             except Exception as e:
@@ -113,17 +120,14 @@ async def cmd_start(message: Message, state: FSMContext):
             reply_markup=get_subscription_keyboard()
         )
     else:
-        # User is subscribed
-        db.update_user_subscription(user_id, True)
-        
+        # User is subscribed (check_user_subscription already stored it)
         # If user came via referral link and it's their first subscription
-        if referrer_id and not existing_user:
-            db.add_referral(referrer_id, user_id)
+        if referrer_id and not profile:
+            await adb.add_referral(referrer_id, user_id)
             logger.info(f"Referral added: {referrer_id} -> {user_id}")
         
         # Check if user has shared contact
-        user_data = db.get_user(user_id)
-        if not user_data.get('phone_number'):
+        if not (profile and profile.has_phone):
             # Need to get contact
             await state.set_state("waiting_for_contact")
             from keyboards import get_contact_keyboard
@@ -134,8 +138,8 @@ async def cmd_start(message: Message, state: FSMContext):
         else:
             # User is fully registered - show main menu
             referral_link = generate_referral_link(user_id)
-            points = db.get_user_points(user_id)
-            referral_count = db.get_referral_count(user_id)
+            points = profile.points
+            referral_count = profile.referral_count
             welcome_back_text = f"""📊 Mening ballarim: {points}
 
 👥 Qo‘shilgan tanishlar soni: {referral_count}
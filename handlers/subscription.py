@@ -5,7 +5,7 @@ from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.fsm.context import FSMContext
 
-from database import db
+from database import adb
 from keyboards import get_contact_keyboard, get_subscription_keyboard, get_main_menu_keyboard
 from utils import check_user_subscription, generate_referral_link, extract_referrer_id
 import logging
@@ -21,8 +21,10 @@ async def check_subscription_callback(callback: CallbackQuery, state: FSMContext
     user = callback.from_user
     user_id = user.id
     
-    # Check if user is subscribed
-    is_subscribed = await check_user_subscription(callback.bot, user_id)
+    profile = await adb.get_profile(user_id)
+    
+    # Check if user is subscribed (always ask Telegram: they may have just joined)
+    is_subscribed = await check_user_subscription(callback.bot, user_id, force=True, profile=profile)
     
     if not is_subscribed:
         # Still not subscribed
@@ -32,19 +34,17 @@ async def check_subscription_callback(callback: CallbackQuery, state: FSMContext
         )
         return
     
-    # User is subscribed
-    db.update_user_subscription(user_id, True)
+    # User is subscribed (check_user_subscription already stored it)
     await callback.answer("✅ Obuna tasdiqlandi!", show_alert=False)
     
     # Check if referral should be processed
-    user_data = db.get_user(user_id)
-    if user_data and user_data.get('referrer_id'):
+    if profile and profile.referrer_id:
         # Add referral if not already added
-        db.add_referral(user_data['referrer_id'], user_id)
-        logger.info(f"Referral processed: {user_data['referrer_id']} -> {user_id}")
+        await adb.add_referral(profile.referrer_id, user_id)
+        logger.info(f"Referral processed: {profile.referrer_id} -> {user_id}")
     
     # Check if user has shared contact
-    if not user_data.get('phone_number'):
+    if not (profile and profile.has_phone):
         # Need to get contact
         await state.set_state("waiting_for_contact")
         await callback.message.edit_text(
@@ -58,8 +58,8 @@ async def check_subscription_callback(callback: CallbackQuery, state: FSMContext
     else:
         # User is fully registered - show main menu
         referral_link = generate_referral_link(user_id)
-        points = db.get_user_points(user_id)
-        referral_count = db.get_referral_count(user_id)
+        points = profile.points
+        referral_count = profile.referral_count
         
         welcome_text = (
             f"✅ A'lo! Hamma narsa tayyor.\n\n"
@@ -0,0 +1,81 @@
+"""
+Per-user update serialization
+aiogram's FSM middleware wraps the handling of every update in
+events_isolation.lock(key) before it loads the user's state. This isolation
+locks per user, so updates from one user are handled one at a time, and caps
+how many users are handled at once. Unlike aiogram's SimpleEventIsolation it
+forgets a user's lock as soon as nobody holds or waits for it.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, Hashable, Optional
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+
+class KeyedLocks:
+    """
+    One asyncio.Lock per key, kept only while someone holds or waits for it
+
+    Memory is proportional to the number of keys in flight rather than to
+    every key ever seen.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._users: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncGenerator[None, None]:
+        """Hold the lock of a key for the duration of the block"""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            remaining = self._users[key] - 1
+            if remaining:
+                self._users[key] = remaining
+            else:
+                del self._users[key]
+                del self._locks[key]
+
+
+class UserEventIsolation(BaseEventIsolation):
+    """
+    Serialize updates per user, run different users in parallel
+
+    A double tap on "Bajarildi ✅" or two quick /start commands are handled
+    one after the other instead of racing on get_profile/add_user/
+    add_referral. The lock is per user rather than per chat, so a channel
+    join (chat_member update) also waits for the user's private chat
+    updates. At most `concurrency` users are handled at once; an update
+    waiting for its user's turn does not take a slot.
+    """
+
+    def __init__(self, concurrency: int = 100):
+        self.locks = KeyedLocks()
+        self.concurrency = concurrency
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        async with self.locks.hold((key.bot_id, key.user_id)):
+            async with self._slots:
+                yield
+
+    def stats(self) -> dict:
+        """Users currently handled or waiting"""
+        return {'locked_users': len(self.locks)}
+
+    async def close(self) -> None:
+        pass
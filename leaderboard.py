@@ -0,0 +1,153 @@
+"""
+In-memory referral leaderboard
+Users are kept in buckets keyed by referral count, and a Fenwick tree over
+the counts answers "how many users have at most N referrals" in O(log n).
+Together they give O(log n) rank lookups and paging without a GROUP BY.
+
+Buckets are sorted lists, so a change of count costs O(log n + b) for
+buckets of size b (the list shift on insert and removal), and low counts
+hold most users. The shift is a memmove, ~175 us with a million users in a
+bucket, and keeps the tie-break position in rank lookups a binary search.
+"""
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class Leaderboard:
+    """
+    Ranking of users by referral count (highest first)
+
+    Ties are broken by user_id, matching the (referral_count DESC, user_id)
+    index in the database. Users with zero referrals are not ranked.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[int, int]] = ()):
+        self._lock = threading.Lock()
+        self._counts: Dict[int, int] = {}
+        self._buckets: Dict[int, List[int]] = {}
+        self._size = 64
+        self._tree = [0] * (self._size + 1)
+
+        for user_id, count in entries:
+            if count > 0:
+                self._counts[user_id] = count
+                self._buckets.setdefault(count, []).append(user_id)
+        for bucket in self._buckets.values():
+            bucket.sort()
+        self._rebuild(max(self._buckets, default=0))
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    # Fenwick tree over counts: _tree answers "users with count <= c"
+
+    def _rebuild(self, max_count: int):
+        """Resize the tree to fit max_count and refill it from the buckets"""
+        while self._size < max_count:
+            self._size *= 2
+        self._tree = [0] * (self._size + 1)
+        for count, bucket in self._buckets.items():
+            self._add(count, len(bucket))
+
+    def _add(self, count: int, delta: int):
+        """Change the number of users holding `count` by delta"""
+        while count <= self._size:
+            self._tree[count] += delta
+            count += count & -count
+
+    def _prefix(self, count: int) -> int:
+        """Number of ranked users with referral count <= count"""
+        total = 0
+        while count > 0:
+            total += self._tree[count]
+            count -= count & -count
+        return total
+
+    def _find(self, position: int) -> int:
+        """Smallest count c with _prefix(c) > position (0-based, ascending order)"""
+        count = 0
+        step = self._size
+        while step:
+            nxt = count + step
+            if nxt <= self._size and self._tree[nxt] <= position:
+                count = nxt
+                position -= self._tree[nxt]
+            step //= 2
+        return count + 1
+
+    # Updates
+
+    def _move(self, user_id: int, count: int):
+        """Move a user to another bucket, O(log n + bucket size); caller holds _lock"""
+        old = self._counts.get(user_id, 0)
+        if old == count:
+            return
+
+        if old > 0:
+            bucket = self._buckets[old]
+            bucket.pop(bisect_left(bucket, user_id))
+            if not bucket:
+                del self._buckets[old]
+            self._add(old, -1)
+            del self._counts[user_id]
+
+        if count > 0:
+            if count > self._size:
+                self._rebuild(count)
+            insort(self._buckets.setdefault(count, []), user_id)
+            self._add(count, 1)
+            self._counts[user_id] = count
+
+    def set(self, user_id: int, count: int):
+        """Set a user's referral count"""
+        with self._lock:
+            self._move(user_id, max(count, 0))
+
+    def increment(self, user_id: int, delta: int = 1):
+        """Add delta to a user's referral count"""
+        with self._lock:
+            self._move(user_id, max(self._counts.get(user_id, 0) + delta, 0))
+
+    # Queries
+
+    def count_of(self, user_id: int) -> int:
+        """Referral count of a user (0 if unranked)"""
+        return self._counts.get(user_id, 0)
+
+    def rank_of(self, user_id: int) -> Optional[int]:
+        """1-based rank of a user, or None if they have no referrals"""
+        with self._lock:
+            count = self._counts.get(user_id)
+            if not count:
+                return None
+            ahead = len(self._counts) - self._prefix(count)
+            return ahead + bisect_left(self._buckets[count], user_id) + 1
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, int]]:
+        """
+        Get a slice of the ranking
+
+        Args:
+            offset: Number of top entries to skip
+            limit: Maximum number of entries to return
+
+        Returns:
+            List of (user_id, referral_count), best first
+        """
+        with self._lock:
+            total = len(self._counts)
+            result: List[Tuple[int, int]] = []
+            while offset < total and len(result) < limit:
+                # Bucket holding the entry at descending position `offset`
+                count = self._find(total - 1 - offset)
+                bucket = self._buckets[count]
+                start = offset - (total - self._prefix(count))
+                for user_id in bucket[start:start + limit - len(result)]:
+                    result.append((user_id, count))
+                offset += len(bucket) - start
+            return result
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        """Get the best `limit` entries as (user_id, referral_count)"""
+        return self.page(0, limit)
@@ -8,10 +8,15 @@ import sys
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 
+from broadcaster import CampaignRunner
 from config import config
-from handlers import start, subscription, contact, menu, admin
+from database import adb
+from fsm import TieredFSMStorage
+from isolation import UserEventIsolation
+from handlers import start, subscription, contact, menu, admin, membership
+from ratelimit import limit_outbound
+from webhook import run_webhook
 
 # Configure logging
 logging.basicConfig(
@@ -33,6 +38,10 @@ async def main():
         logger.error("Bot token not configured! Please set BOT_TOKEN in environment or config.py")
         sys.exit(1)
     
+    if config.BOT_MODE not in ("polling", "webhook"):
+        logger.error(f"Unknown BOT_MODE '{config.BOT_MODE}'! Use 'polling' or 'webhook'")
+        sys.exit(1)
+    
     if config.CHANNEL_ID == "@your_channel":
         logger.warning("Channel ID not configured! Please set CHANNEL_ID in environment or config.py")
     
@@ -41,8 +50,19 @@ async def main():
         token=config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    limit_outbound(bot)  # Queue replies instead of hitting Telegram's limits
+    
+    # Conversation states persist in the database with a bounded memory tier;
+    # updates of one user are handled in order, different users in parallel
+    dp = Dispatcher(
+        storage=TieredFSMStorage(adb),
+        events_isolation=UserEventIsolation(config.UPDATE_CONCURRENCY)
+    )
     
-    dp = Dispatcher(storage=MemoryStorage())
+    # Scheduled campaigns are sent from this process, behind the replies;
+    # admin commands reach the runner as the campaign_runner handler argument
+    campaign_runner = CampaignRunner(bot)
+    dp["campaign_runner"] = campaign_runner
     
     # Register routers
     dp.include_router(admin.router)  # Admin router first for priority
@@ -50,14 +70,25 @@ async def main():
     dp.include_router(subscription.router)
     dp.include_router(contact.router)
     dp.include_router(menu.router)
+    dp.include_router(membership.router)  # Channel joins/leaves (chat_member updates)
     
-    logger.info("Bot starting...")
+    logger.info(f"Bot starting in {config.BOT_MODE} mode...")
     
+    runner_task = asyncio.create_task(campaign_runner.run()) if config.CAMPAIGN_RUNNER else None
     try:
-        # Start polling
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if config.BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # getUpdates is refused while a webhook is set (e.g. after webhook mode)
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        if runner_task is not None:
+            # The sends in flight are journaled before the storage closes
+            runner_task.cancel()
+            await asyncio.gather(runner_task, return_exceptions=True)
         await bot.session.close()
+        await adb.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+"""
+Telegram media registry
+Uploads each local media file once and reuses the file_id Telegram returns.
+file_ids are stored in the database keyed by path and content hash, so they
+survive restarts and are shared with the broadcast scripts; editing a file
+changes its hash and triggers a fresh upload.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+
+from database import adb
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(BASE_DIR, "assets")
+
+# Fragments of the errors Telegram returns for file_ids it does not accept
+# (e.g. after the bot token changed)
+INVALID_FILE_ID_ERRORS = ("file identifier", "file_id", "remote file", "file reference")
+
+
+def asset_path(name: str) -> str:
+    """Absolute path of a file in the assets folder"""
+    return os.path.join(ASSETS_DIR, name)
+
+
+def is_invalid_file_id(error: TelegramBadRequest) -> bool:
+    """Whether Telegram rejected a request because of the file_id it contained"""
+    message = str(error).lower()
+    return any(fragment in message for fragment in INVALID_FILE_ID_ERRORS)
+
+
+class MediaRegistry:
+    """
+    Maps local media files to Telegram file_ids
+
+    Lookups go to an in-process dict first and to the storage backend
+    second. Content hashes are recomputed only when a file's size or mtime
+    changes. Concurrent sends of the same file wait for one upload, both on
+    first send and when Telegram rejects a file_id: the first sender to see
+    the rejection uploads again, the others retry with its new file_id.
+    """
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+        self._file_ids: Dict[Tuple[str, str], str] = {}
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.uploads = 0
+        self.reuses = 0
+
+    @staticmethod
+    def key_path(path: str) -> str:
+        """Path as stored in the database (relative to the project when inside it)"""
+        path = os.path.abspath(path)
+        if path.startswith(BASE_DIR + os.sep):
+            return os.path.relpath(path, BASE_DIR)
+        return path
+
+    def content_hash(self, path: str) -> str:
+        """SHA-256 of a file, cached until its size or mtime changes"""
+        stat = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        self._hashes[path] = (stat.st_size, stat.st_mtime_ns, sha256)
+        return sha256
+
+    async def file_id(self, path: str) -> Optional[str]:
+        """Known file_id for the current content of a file"""
+        key = (self.key_path(path), self.content_hash(path))
+        file_id = self._file_ids.get(key)
+        if file_id is None:
+            file_id = await self.storage.get_media_file_id(*key)
+            if file_id:
+                self._file_ids[key] = file_id
+        return file_id
+
+    async def remember(self, path: str, file_id: str):
+        """Store the file_id returned for an upload of a file"""
+        key = (self.key_path(path), self.content_hash(path))
+        self._file_ids[key] = file_id
+        await self.storage.save_media_file_id(*key, file_id)
+
+    async def forget(self, path: str):
+        """Drop a file_id that Telegram rejected"""
+        key = (self.key_path(path), self.content_hash(path))
+        self._file_ids.pop(key, None)
+        await self.storage.delete_media_file_id(*key)
+
+    async def send_photo(self, bot: Bot, chat_id: int, path: str, **kwargs) -> Message:
+        """
+        Send a local photo, uploading it only if no valid file_id is known
+
+        Args:
+            bot: Bot instance
+            chat_id: Target chat
+            path: Path of the image file
+            **kwargs: Passed to bot.send_photo (caption, reply_markup, ...)
+
+        Returns:
+            The sent message
+        """
+        lock = self._locks.setdefault(self.key_path(path), asyncio.Lock())
+        file_id = await self.file_id(path)
+        if file_id is None:
+            async with lock:
+                # Another sender may have uploaded it while we waited
+                file_id = await self.file_id(path)
+                if file_id is None:
+                    return await self._upload(bot, chat_id, path, **kwargs)
+
+        try:
+            message = await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            if not is_invalid_file_id(e):
+                raise
+            async with lock:
+                # Another sender may have replaced the rejected file_id already
+                current = await self.file_id(path)
+                if current is None or current == file_id:
+                    logger.warning(f"Cached file_id for {path} was rejected ({e}), uploading again")
+                    await self.forget(path)
+                    return await self._upload(bot, chat_id, path, **kwargs)
+            message = await bot.send_photo(chat_id=chat_id, photo=current, **kwargs)
+        self.reuses += 1
+        return message
+
+    async def _upload(self, bot: Bot, chat_id: int, path: str, **kwargs) -> Message:
+        """Send the file from disk and remember the file_id of the largest size"""
+        message = await bot.send_photo(chat_id=chat_id, photo=FSInputFile(path), **kwargs)
+        self.uploads += 1
+        if message.photo:
+            await self.remember(path, message.photo[-1].file_id)
+            logger.info(f"Uploaded {path} to Telegram and cached its file_id")
+        return message
+
+    async def send_media_group(self, bot: Bot, chat_id: int, paths: List[str],
+                               caption: Optional[str] = None) -> List[Message]:
+        """
+        Send local photos as one album, uploading only those with no known file_id
+
+        Args:
+            bot: Bot instance
+            chat_id: Target chat
+            paths: Paths of the image files (2 to 10), in album order
+            caption: Shown under the album (set on its first photo)
+
+        Returns:
+            The sent messages, one per photo
+        """
+        lock = self._locks.setdefault("|".join(self.key_path(path) for path in paths), asyncio.Lock())
+        file_ids = [await self.file_id(path) for path in paths]
+        if None in file_ids:
+            async with lock:
+                # Another sender may have uploaded them while we waited
+                file_ids = [await self.file_id(path) for path in paths]
+                if None in file_ids:
+                    return await self._upload_group(bot, chat_id, paths, file_ids, caption)
+
+        try:
+            messages = await bot.send_media_group(chat_id=chat_id, media=self._album(file_ids, caption))
+        except TelegramBadRequest as e:
+            if not is_invalid_file_id(e):
+                raise
+            async with lock:
+                # Another sender may have replaced the rejected file_ids already
+                current = [await self.file_id(path) for path in paths]
+                if current == file_ids:
+                    logger.warning(f"Cached file_ids for {', '.join(paths)} were rejected ({e}), uploading again")
+                    for path in paths:
+                        await self.forget(path)
+                    return await self._upload_group(bot, chat_id, paths, [None] * len(paths), caption)
+                if None in current:
+                    return await self._upload_group(bot, chat_id, paths, current, caption)
+            messages = await bot.send_media_group(chat_id=chat_id, media=self._album(current, caption))
+        self.reuses += len(paths)
+        return messages
+
+    @staticmethod
+    def _album(photos: list, caption: Optional[str]) -> List[InputMediaPhoto]:
+        return [
+            InputMediaPhoto(media=photo, caption=caption if i == 0 else None)
+            for i, photo in enumerate(photos)
+        ]
+
+    async def _upload_group(self, bot: Bot, chat_id: int, paths: List[str], file_ids: List[Optional[str]],
+                            caption: Optional[str]) -> List[Message]:
+        """Send an album with the files missing a file_id read from disk, and remember their file_ids"""
+        photos = [file_id or FSInputFile(path) for path, file_id in zip(paths, file_ids)]
+        messages = await bot.send_media_group(chat_id=chat_id, media=self._album(photos, caption))
+        for path, file_id, message in zip(paths, file_ids, messages):
+            if file_id is None and message.photo:
+                self.uploads += 1
+                await self.remember(path, message.photo[-1].file_id)
+                logger.info(f"Uploaded {path} to Telegram and cached its file_id")
+            elif file_id is not None:
+                self.reuses += 1
+        return messages
+
+
+media = MediaRegistry(adb)
+
+
+async def send_photo(bot: Bot, chat_id: int, path: str, **kwargs) -> Message:
+    """Send a local photo through the shared media registry"""
+    return await media.send_photo(bot, chat_id, path, **kwargs)
+
+
+async def send_media_group(bot: Bot, chat_id: int, paths: List[str], caption: Optional[str] = None) -> List[Message]:
+    """Send local photos as one album through the shared media registry"""
+    return await media.send_media_group(bot, chat_id, paths, caption=caption)
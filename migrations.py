@@ -0,0 +1,367 @@
+"""
+Database schema migrations
+Every migration runs once, in order, inside its own transaction. The applied
+version is stored in SQLite's PRAGMA user_version, so existing databases are
+upgraded in place the next time the bot (or any script) opens them.
+"""
+import sqlite3
+import logging
+from typing import Callable, List, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+Migration = Tuple[int, str, Callable[[sqlite3.Connection], None]]
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register a migration function under the given schema version"""
+    def decorator(func: Callable[[sqlite3.Connection], None]):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+@migration(1, "create base tables")
+def create_base_tables(conn: sqlite3.Connection):
+    # Users table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            phone_number TEXT,
+            referrer_id INTEGER,
+            points INTEGER DEFAULT 0,
+            is_subscribed INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (referrer_id) REFERENCES users(user_id)
+        )
+    """)
+
+    # Referrals table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS referrals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            referrer_id INTEGER NOT NULL,
+            referred_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (referrer_id) REFERENCES users(user_id),
+            FOREIGN KEY (referred_id) REFERENCES users(user_id)
+        )
+    """)
+
+
+@migration(2, "index referrals by referrer and by referred user")
+def index_referrals(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_referrals_referrer_created
+        ON referrals (referrer_id, created_at)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_referrals_referred
+        ON referrals (referred_id)
+    """)
+
+
+@migration(3, "make (referrer_id, referred_id) unique")
+def unique_referral_pair(conn: sqlite3.Connection):
+    # Duplicates could slip in through the old check-then-insert race. Keep the
+    # first row of each pair and take back the points the extra rows granted.
+    duplicates = conn.execute("""
+        SELECT referrer_id, COUNT(*) - 1 AS extra
+        FROM referrals
+        GROUP BY referrer_id, referred_id
+        HAVING COUNT(*) > 1
+    """).fetchall()
+
+    if duplicates:
+        conn.execute("""
+            DELETE FROM referrals
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM referrals GROUP BY referrer_id, referred_id
+            )
+        """)
+        conn.executemany(
+            "UPDATE users SET points = MAX(points - ?, 0) WHERE user_id = ?",
+            [(row[1] * config.POINTS_PER_REFERRAL, row[0]) for row in duplicates]
+        )
+        logger.warning(f"Removed duplicate referrals for {len(duplicates)} referrers")
+
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_referrals_pair
+        ON referrals (referrer_id, referred_id)
+    """)
+
+
+@migration(4, "partial indexes for subscribed users and users with a phone")
+def index_user_flags(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_subscribed
+        ON users (user_id) WHERE is_subscribed = 1
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_phone
+        ON users (user_id) WHERE phone_number IS NOT NULL
+    """)
+
+
+@migration(5, "denormalized users.referral_count")
+def add_referral_count(conn: sqlite3.Connection):
+    conn.execute("ALTER TABLE users ADD COLUMN referral_count INTEGER NOT NULL DEFAULT 0")
+
+    # Backfill only the users who actually referred someone
+    conn.execute("""
+        UPDATE users
+        SET referral_count = (
+            SELECT COUNT(*) FROM referrals r WHERE r.referrer_id = users.user_id
+        )
+        WHERE user_id IN (SELECT DISTINCT referrer_id FROM referrals)
+    """)
+
+    # Leaderboard reads walk this index instead of aggregating referrals
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_referral_count
+        ON users (referral_count DESC, user_id) WHERE referral_count > 0
+    """)
+
+
+@migration(6, "stats table maintained by triggers")
+def add_stats_table(conn: sqlite3.Connection):
+    # One row of counters so /stats never has to scan users or referrals.
+    # The triggers run inside the writing transaction, so the counters are
+    # always exactly in step with the tables.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_users INTEGER NOT NULL DEFAULT 0,
+            subscribed_users INTEGER NOT NULL DEFAULT 0,
+            users_with_phone INTEGER NOT NULL DEFAULT 0,
+            total_referrals INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO stats (id, total_users, subscribed_users, users_with_phone, total_referrals)
+        SELECT 1,
+               (SELECT COUNT(*) FROM users),
+               (SELECT COUNT(*) FROM users WHERE is_subscribed = 1),
+               (SELECT COUNT(*) FROM users WHERE phone_number IS NOT NULL),
+               (SELECT COUNT(*) FROM referrals)
+    """)
+
+    triggers = [
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users
+        BEGIN
+            UPDATE stats SET
+                total_users = total_users + 1,
+                subscribed_users = subscribed_users + (NEW.is_subscribed IS 1),
+                users_with_phone = users_with_phone + (NEW.phone_number IS NOT NULL)
+            WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users
+        BEGIN
+            UPDATE stats SET
+                total_users = total_users - 1,
+                subscribed_users = subscribed_users - (OLD.is_subscribed IS 1),
+                users_with_phone = users_with_phone - (OLD.phone_number IS NOT NULL)
+            WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_update
+        AFTER UPDATE OF is_subscribed, phone_number ON users
+        WHEN (OLD.is_subscribed IS 1) != (NEW.is_subscribed IS 1)
+          OR (OLD.phone_number IS NULL) != (NEW.phone_number IS NULL)
+        BEGIN
+            UPDATE stats SET
+                subscribed_users = subscribed_users
+                    + (NEW.is_subscribed IS 1) - (OLD.is_subscribed IS 1),
+                users_with_phone = users_with_phone
+                    + (NEW.phone_number IS NOT NULL) - (OLD.phone_number IS NOT NULL)
+            WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_referrals_insert AFTER INSERT ON referrals
+        BEGIN
+            UPDATE stats SET total_referrals = total_referrals + 1 WHERE id = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_referrals_delete AFTER DELETE ON referrals
+        BEGIN
+            UPDATE stats SET total_referrals = total_referrals - 1 WHERE id = 1;
+        END
+        """,
+    ]
+    # executescript() would commit the migration transaction, so run them one by one
+    for trigger in triggers:
+        conn.execute(trigger)
+
+
+@migration(7, "channel join/leave timestamps")
+def add_membership_columns(conn: sqlite3.Connection):
+    # Filled from chat_member updates; membership_updated_at is the date of
+    # the last event applied, so late or replayed events can be ignored
+    conn.execute("ALTER TABLE users ADD COLUMN joined_at TIMESTAMP")
+    conn.execute("ALTER TABLE users ADD COLUMN left_at TIMESTAMP")
+    conn.execute("ALTER TABLE users ADD COLUMN membership_updated_at TIMESTAMP")
+
+
+@migration(8, "checkpoints for long-running sweeps")
+def add_sweep_checkpoints(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sweep_checkpoints (
+            name TEXT PRIMARY KEY,
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            checked INTEGER NOT NULL DEFAULT 0,
+            changed INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+@migration(9, "Telegram file_id cache for uploaded media")
+def add_media_cache(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS media_cache (
+            path TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (path, sha256)
+        )
+    """)
+
+
+@migration(10, "Persistent FSM states")
+def add_fsm_states(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Expired states are purged by age
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)")
+
+
+@migration(11, "Broadcast campaigns and delivery journal")
+def add_campaigns(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS campaigns (
+            campaign_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    # One row per recipient, created as 'pending' when claim_campaign_recipients
+    # hands the user out through the campaign's keyset cursor
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS campaign_deliveries (
+            campaign_id INTEGER NOT NULL REFERENCES campaigns(campaign_id),
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            message_id INTEGER,
+            error TEXT,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (campaign_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    # Resuming reads the recipients still to do
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_campaign_deliveries_status
+        ON campaign_deliveries (campaign_id, status, user_id)
+    """)
+
+
+@migration(12, "Suppression of unreachable users")
+def add_delivery_status(conn: sqlite3.Connection):
+    # NULL while the user can be messaged; 'blocked', 'deactivated' or
+    # 'chat_not_found' once a broadcast found out otherwise
+    conn.execute("ALTER TABLE users ADD COLUMN delivery_status TEXT")
+    conn.execute("ALTER TABLE users ADD COLUMN delivery_status_at TIMESTAMP")
+    # Broadcast recipients: only deliverable users are indexed, and
+    # delivery_status is included so reads never touch the table
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_deliverable
+        ON users (user_id, delivery_status) WHERE delivery_status IS NULL
+    """)
+
+
+@migration(13, "Recipient cursor of broadcast campaigns")
+def add_campaign_cursor(conn: sqlite3.Connection):
+    # Recipients are read from users in user_id order; last_user_id is the
+    # last one handed to the campaign, total the audience size at the start
+    conn.execute("ALTER TABLE campaigns ADD COLUMN last_user_id INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE campaigns ADD COLUMN total INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(14, "Scheduled campaigns")
+def add_campaign_schedule(conn: sqlite3.Connection):
+    # Campaigns run by the bot itself keep what they send (an announcement
+    # definition as JSON) and when to start; scripts leave both NULL
+    conn.execute("ALTER TABLE campaigns ADD COLUMN payload TEXT")
+    conn.execute("ALTER TABLE campaigns ADD COLUMN scheduled_at TIMESTAMP")
+    # The runner polls for the next due campaign
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_campaigns_scheduled
+        ON campaigns (status, scheduled_at)
+    """)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Read the schema version stored in the database file"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Apply all pending migrations
+
+    Each migration takes the write lock with BEGIN IMMEDIATE and re-checks the
+    version inside the transaction, so several processes starting at once
+    never apply the same step twice. Readers keep working during a migration
+    thanks to WAL mode; other writers wait up to busy_timeout.
+
+    Args:
+        conn: Connection to migrate (the pool's writer)
+
+    Returns:
+        Schema version after migrating
+    """
+    for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if get_schema_version(conn) >= version:
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+
+            func(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception(f"Migration {version} ({description}) failed")
+            raise
+
+        logger.info(f"Applied migration {version}: {description}")
+
+    # Refresh planner statistics for any new indexes
+    conn.execute("PRAGMA optimize")
+    return get_schema_version(conn)
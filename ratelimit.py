@@ -0,0 +1,265 @@
+"""
+Rate limiting for outgoing Telegram API calls
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import List, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Methods that deliver messages to a chat and count against Telegram's limits
+MESSAGE_METHOD_PREFIXES = ("Send", "Copy", "Forward")
+
+# Priorities of outgoing messages (lower goes first)
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Priority of the messages sent from the current context. Background work
+# such as a scheduled broadcast sets BACKGROUND once; the tasks it starts
+# inherit it, so handler replies waiting for the same tokens go first
+outbound_priority: ContextVar[int] = ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+class TokenBucket:
+    """
+    Async token bucket
+
+    Tokens refill continuously at `rate` per second up to `capacity`; each
+    acquire() takes one (or several at once) and waits when too few are left.
+    A take larger than the capacity waits for a full bucket and then until
+    the rest is earned. Waiters are served by priority, then in arrival
+    order: a waiter that arrives with a higher priority is next in line even
+    if lower ones have waited longer. pause() stops all takers, e.g. after
+    Telegram answered with RetryAfter.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated: Optional[float] = None
+        self._paused_until = 0.0
+        # Heap of [priority, arrival, wakeup future]; only the first may take tokens
+        self._waiters: List[list] = []
+        self._arrivals = itertools.count()
+
+    def _refill(self, now: float):
+        """Add the tokens earned since the last refill"""
+        if self._updated is not None:
+            if now <= self._updated:
+                # Still inside a pause
+                return
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0, priority: int = INTERACTIVE):
+        """Wait until `tokens` are available and it is this caller's turn, and take them"""
+        loop = asyncio.get_running_loop()
+        waiter = [priority, next(self._arrivals), None]
+        heapq.heappush(self._waiters, waiter)
+        try:
+            while True:
+                if self._waiters[0] is not waiter:
+                    # Woken by _next() when everyone ahead is served
+                    waiter[2] = loop.create_future()
+                    await waiter[2]
+                    continue
+
+                now = loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._refill(now)
+                needed = min(tokens, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    break
+                # A waiter of higher priority may arrive meanwhile; it is then
+                # first in line and this one waits again when it wakes up
+                await asyncio.sleep((needed - self._tokens) / self.rate)
+        finally:
+            self._next(waiter)
+
+        if self._tokens < 0:
+            # Return when the last of them is earned, and count the next one
+            # from when that really was (the debt keeps the others waiting)
+            await asyncio.sleep(-self._tokens / self.rate)
+            if self._tokens < 0:
+                self._tokens = 0.0
+                self._updated = max(loop.time(), self._updated)
+
+    def _next(self, waiter: list):
+        """Take a served or cancelled waiter out of line and wake the next one"""
+        if self._waiters[0] is waiter:
+            heapq.heappop(self._waiters)
+        else:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+        if self._waiters:
+            wakeup = self._waiters[0][2]
+            if wakeup is not None and not wakeup.done():
+                wakeup.set_result(None)
+
+    def set_rate(self, rate: float):
+        """Change the refill rate; tokens earned so far are kept"""
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self._refill(asyncio.get_running_loop().time())
+        self.rate = rate
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next `seconds` and drop the saved burst"""
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+        self._tokens = min(self._tokens, 0.0)
+        self._updated = self._paused_until
+
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """
+    Session middleware that paces messages sent through a Bot
+
+    Every send/copy/forward call takes a token from its chat's bucket and
+    then from the global bucket, so calls over the limit are queued instead
+    of being answered with 429. If Telegram still answers with RetryAfter,
+    the chat and the global bucket are paused for the requested time and the
+    call is retried. Other methods (getUpdates, getChatMember, ...) are not
+    counted against the message budget. Calls made with outbound_priority
+    set to BACKGROUND wait behind every INTERACTIVE one, so a broadcast
+    running in the bot's process delays a handler reply by one message's
+    share of the rate at most.
+
+    The global rate adapts: each RetryAfter cuts it by a fifth (down to a
+    quarter of the configured rate), and every second's worth of messages
+    sent without one raises it by 1 message/s, back up to the configured rate.
+    """
+
+    def __init__(self, global_rate: float = 30.0, global_burst: float = 1.0, chat_rate: float = 1.0,
+                 chat_burst: float = 3.0, group_rate: float = 20 / 60, max_retries: int = 3,
+                 max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, capacity=global_burst)
+        self.max_global_rate = global_rate
+        self.min_global_rate = global_rate / 4
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chat_buckets: "OrderedDict[Union[int, str], TokenBucket]" = OrderedDict()
+        self._clean_sends = 0
+        self.retries = 0
+
+    @property
+    def global_rate(self) -> float:
+        """Current bot-wide messages per second"""
+        return self.global_bucket.rate
+
+    def _slow_down(self):
+        """Multiplicative decrease after Telegram's flood control kicked in"""
+        self._clean_sends = 0
+        rate = max(self.min_global_rate, self.global_bucket.rate * 0.8)
+        if rate < self.global_bucket.rate:
+            self.global_bucket.set_rate(rate)
+            logger.info(f"Outbound rate lowered to {rate:.1f} messages/s")
+
+    def _speed_up(self, tokens: float):
+        """Additive increase after a second's worth of accepted messages"""
+        if self.global_bucket.rate >= self.max_global_rate:
+            return
+        self._clean_sends += tokens
+        if self._clean_sends >= self.global_bucket.rate:
+            self._clean_sends = 0
+            self.global_bucket.set_rate(min(self.max_global_rate, self.global_bucket.rate + 1))
+
+    def chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        """Bucket of one chat; the least recently used ones are dropped"""
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Private chats have positive ids; groups, channels and @usernames are slower
+            private = isinstance(chat_id, int) and chat_id > 0
+            if private:
+                bucket = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, capacity=1)
+            self._chat_buckets[chat_id] = bucket
+            # Buckets idle for a while are full again, so forgetting them is harmless
+            while len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    @staticmethod
+    def cost(method: TelegramMethod) -> float:
+        """Number of messages a call sends (0 for calls that send none)"""
+        name = type(method).__name__
+        if name == "SendChatAction" or not name.startswith(MESSAGE_METHOD_PREFIXES):
+            return 0.0
+        if getattr(method, "chat_id", None) is None:
+            return 0.0
+        # Albums and copyMessages/forwardMessages deliver several messages at once
+        for field in ("media", "message_ids"):
+            items = getattr(method, field, None)
+            if isinstance(items, list):
+                return float(len(items))
+        return 1.0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        tokens = self.cost(method)
+        if not tokens:
+            return await make_request(bot, method)
+
+        chat = self.chat_bucket(method.chat_id)
+        priority = outbound_priority.get()
+        for attempt in range(self.max_retries + 1):
+            # A chat over its limit must not hold global tokens while it waits.
+            # Albums take one token per message, all in one acquire: taken one
+            # by one, concurrent albums would each hold part of their tokens
+            # and then go out together in a burst
+            await chat.acquire(tokens, priority)
+            await self.global_bucket.acquire(tokens, priority)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self._slow_down()
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning(f"Flood control on chat {method.chat_id}, retrying in {e.retry_after}s")
+                # Telegram does not say which limit was hit: slow down everything
+                chat.pause(e.retry_after)
+                self.global_bucket.pause(e.retry_after)
+            else:
+                self._speed_up(tokens)
+                return response
+
+
+outbound_limiter = OutboundRateLimiter(
+    global_rate=config.OUTBOUND_GLOBAL_RATE,
+    global_burst=config.OUTBOUND_GLOBAL_BURST,
+    chat_rate=config.OUTBOUND_CHAT_RATE,
+    chat_burst=config.OUTBOUND_CHAT_BURST,
+    group_rate=config.OUTBOUND_GROUP_RATE
+)
+
+
+def limit_outbound(bot: Bot) -> Bot:
+    """Send a bot's messages through the process-wide limiter"""
+    bot.session.middleware(outbound_limiter)
+    return bot
@@ -0,0 +1,130 @@
+"""
+Send an announcement defined in the announcements folder
+Each announcements/<name>.json lists the images, caption and buttons to send;
+several images go out as one album.
+Usage: python send_announcement.py <name or path.json> [--resume CAMPAIGN_ID]
+       python send_announcement.py --list
+       python send_announcement.py houses --simulate
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from typing import List, Optional
+
+from broadcaster import (
+    Announcement, MediaGroupPayload, PhotoPayload, PhotoSequence, TextPayload, list_announcements,
+    load_announcement, run_broadcast
+)
+from broadcaster.simulation import add_simulation_arguments, run_simulation
+from media import MediaRegistry
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout),
+        logging.FileHandler('broadcast.log')
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+
+def print_announcement(announcement: Announcement):
+    """Show what will be sent"""
+    payload = announcement.payload
+    print("\n" + "="*60)
+    print(announcement.title)
+    print("="*60)
+    if isinstance(payload, PhotoSequence):
+        paths = [photo.path for photo in payload.photos]
+        payload = payload.photos[-1]
+    elif isinstance(payload, MediaGroupPayload):
+        paths = payload.paths
+    elif isinstance(payload, PhotoPayload):
+        paths = [payload.path]
+    else:
+        paths = []
+    for i, path in enumerate(paths, 1):
+        path = MediaRegistry.key_path(path)
+        print(f"📸 Photo {i}: {path}" if len(paths) > 1 else f"📸 Photo: {path}")
+    caption = payload.text if isinstance(payload, TextPayload) else payload.caption
+    if caption:
+        print(f"💬 Caption: {caption[:50]}...")
+    if payload.reply_markup is not None:
+        for row in payload.reply_markup.inline_keyboard:
+            for button in row:
+                print(f"🔗 Button: {button.text}")
+
+
+async def broadcast_announcement(announcement: Announcement, resume: Optional[int] = None):
+    """Broadcast an announcement to all users"""
+    try:
+        await run_broadcast(announcement.payload, resume=resume)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(str(e))
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+
+
+def main(argv: Optional[List[str]] = None, name: Optional[str] = None):
+    """Main function; `name` fixes the announcement for preset scripts"""
+    parser = argparse.ArgumentParser(description='Send an announcement to all bot users')
+    if name is None:
+        parser.add_argument('announcement', nargs='?', help='Announcement name (e.g. houses) or path to a JSON file')
+        parser.add_argument('--list', action='store_true', help='List the available announcements')
+    parser.add_argument(
+        '--resume',
+        type=int,
+        metavar='CAMPAIGN_ID',
+        help='Continue an interrupted campaign with the users it has not reached'
+    )
+    add_simulation_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    if name is None:
+        if args.list or not args.announcement:
+            print("Available announcements: " + (", ".join(list_announcements()) or "none"))
+            sys.exit(0 if args.list else 1)
+        name = args.announcement
+    
+    try:
+        announcement = load_announcement(name)
+        announcement.payload.validate()
+    except (FileNotFoundError, ValueError) as e:
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+    
+    if args.simulate:
+        run_simulation(announcement.payload, args)
+        return
+    
+    print_announcement(announcement)
+    if args.resume:
+        print(f"🔁 Resuming campaign #{args.resume}")
+    print("="*60)
+    
+    confirmation = input("\nAre you sure you want to send this to all users? (yes/no): ")
+    
+    if confirmation.lower() not in ['yes', 'y']:
+        print("❌ Broadcast cancelled")
+        sys.exit(0)
+    
+    print("\n🚀 Starting broadcast...\n")
+    
+    # Run broadcast
+    try:
+        asyncio.run(broadcast_announcement(announcement, args.resume))
+    except KeyboardInterrupt:
+        logger.info("\n⚠️ Broadcast interrupted by user")
+        print("\n⚠️ Broadcast interrupted!")
+    except Exception as e:
+        logger.error(f"Broadcast failed with error: {e}")
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""
+Storage backends
+Every part of the bot and the broadcast tooling talks to the database through
+the Storage interface; config.STORAGE_BACKEND picks the implementation.
+"""
+from .base import Storage, UserProfile
+
+__all__ = ['Storage', 'UserProfile']
@@ -0,0 +1,377 @@
+"""
+Storage interface shared by all backends
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+
+def _text(value) -> Optional[str]:
+    """Timestamps come back as str from SQLite and as text from PostgreSQL"""
+    return str(value) if value is not None else None
+
+
+@dataclass(frozen=True)
+class UserProfile:
+    """Snapshot of everything the menu and onboarding screens show for a user"""
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    phone_number: Optional[str]
+    referrer_id: Optional[int]
+    points: int
+    referral_count: int
+    is_subscribed: bool
+    created_at: Optional[str]
+    rank: Optional[int] = None
+    joined_at: Optional[str] = None
+    left_at: Optional[str] = None
+    membership_updated_at: Optional[str] = None
+    delivery_status: Optional[str] = None
+    delivery_status_at: Optional[str] = None
+    
+    @property
+    def has_phone(self) -> bool:
+        """Whether the user has already shared a phone number"""
+        return bool(self.phone_number)
+    
+    @property
+    def suppressed(self) -> bool:
+        """Whether broadcasts skip the user (blocked the bot, deleted account, ...)"""
+        return self.delivery_status is not None
+    
+    @property
+    def membership_known(self) -> bool:
+        """Whether is_subscribed comes from a chat_member update for the channel"""
+        return self.membership_updated_at is not None
+    
+    @classmethod
+    def from_row(cls, row, rank: Optional[int] = None) -> "UserProfile":
+        """Build a profile from a users row (sqlite3.Row, asyncpg Record or dict)"""
+        return cls(
+            user_id=row['user_id'],
+            username=row['username'],
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            phone_number=row['phone_number'],
+            referrer_id=row['referrer_id'],
+            points=row['points'] or 0,
+            referral_count=row['referral_count'] or 0,
+            is_subscribed=bool(row['is_subscribed']),
+            created_at=_text(row['created_at']),
+            rank=rank,
+            joined_at=_text(row['joined_at']),
+            left_at=_text(row['left_at']),
+            membership_updated_at=_text(row['membership_updated_at']),
+            delivery_status=row['delivery_status'],
+            delivery_status_at=_text(row['delivery_status_at'])
+        )
+
+
+def empty_stats_snapshot() -> dict:
+    """Stats snapshot of an empty database (also returned on errors)"""
+    return {
+        'total_users': 0,
+        'subscribed_users': 0,
+        'users_with_phone': 0,
+        'total_referrals': 0,
+        'top_referrers': []
+    }
+
+
+class Storage(ABC):
+    """
+    Async data access API used by handlers, admin commands and broadcasts
+    
+    Implementations must behave identically; check_storage.py runs the same
+    conformance checks against each of them.
+    """
+    
+    # Users
+    
+    @abstractmethod
+    async def add_user(self, user_id: int, username: Optional[str] = None,
+                       first_name: Optional[str] = None, last_name: Optional[str] = None,
+                       referrer_id: Optional[int] = None) -> bool:
+        """Add new user (ignored if the user already exists)"""
+    
+    @abstractmethod
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        """Get user row by ID"""
+    
+    @abstractmethod
+    async def get_profile(self, user_id: int) -> Optional[UserProfile]:
+        """Get user fields, points, referral count, rank and flags"""
+    
+    @abstractmethod
+    async def update_user_subscription(self, user_id: int, is_subscribed: bool) -> bool:
+        """Update user subscription status"""
+    
+    @abstractmethod
+    async def update_phone_number(self, user_id: int, phone_number: str) -> bool:
+        """Update user phone number"""
+    
+    @abstractmethod
+    async def get_all_user_ids(self, deliverable_only: bool = False) -> List[int]:
+        """Get the IDs of every user, or only of those with no delivery_status"""
+    
+    @abstractmethod
+    async def get_user_ids_page(self, after_user_id: int = 0, limit: int = 1000,
+                                referred_only: bool = False, deliverable_only: bool = False) -> List[int]:
+        """Get the next user IDs after after_user_id in ascending order (keyset pagination)"""
+    
+    @abstractmethod
+    async def suppress_users(self, results: List[Tuple[int, str]]) -> int:
+        """
+        Set users.delivery_status (and its timestamp) so broadcasts skip the users
+        
+        Returns:
+            Number of users updated (-1 on error)
+        """
+    
+    @abstractmethod
+    async def unsuppress_user(self, user_id: int) -> bool:
+        """Clear users.delivery_status so broadcasts reach the user again"""
+    
+    @abstractmethod
+    async def record_membership(self, user_id: int, is_subscribed: bool, changed_at: datetime) -> bool:
+        """
+        Apply a channel join or leave seen in a chat_member update
+        
+        Events older than the last one applied are ignored.
+        
+        Returns:
+            True if the user exists and the event was applied
+        """
+    
+    async def get_user_points(self, user_id: int) -> int:
+        """Get user points"""
+        profile = await self.get_profile(user_id)
+        return profile.points if profile else 0
+    
+    # Referrals
+    
+    @abstractmethod
+    async def add_referral(self, referrer_id: int, referred_id: int) -> bool:
+        """Add referral and credit the referrer; False if it already existed"""
+    
+    @abstractmethod
+    async def revoke_referral(self, referred_id: int) -> List[int]:
+        """Delete the referrals of a user and take back the referrers' credit; returns referrer IDs"""
+    
+    @abstractmethod
+    async def get_user_referrals(self, user_id: int) -> List[dict]:
+        """Get all referrals for a user, newest first"""
+    
+    @abstractmethod
+    async def get_referral_count(self, user_id: int) -> int:
+        """Get count of user's referrals"""
+    
+    @abstractmethod
+    async def verify_referral_counts(self, repair: bool = False) -> List[dict]:
+        """Compare stored referral counters with the referrals table"""
+    
+    # Media
+    
+    @abstractmethod
+    async def get_media_file_id(self, path: str, sha256: str) -> Optional[str]:
+        """Get the Telegram file_id stored for a media file with this content"""
+    
+    @abstractmethod
+    async def save_media_file_id(self, path: str, sha256: str, file_id: str) -> bool:
+        """Store the file_id of an upload, replacing ids of older versions of the file"""
+    
+    @abstractmethod
+    async def delete_media_file_id(self, path: str, sha256: str) -> bool:
+        """Forget a file_id that Telegram no longer accepts"""
+    
+    # FSM
+    
+    @abstractmethod
+    async def get_fsm_record(self, key: str, max_age: float) -> Optional[dict]:
+        """
+        Get the FSM state and data saved under a key
+        
+        Returns:
+            Dict with state (str or None) and data (JSON text), or None if
+            nothing was saved or the record is older than max_age seconds
+        """
+    
+    @abstractmethod
+    async def save_fsm_record(self, key: str, state: Optional[str], data: str) -> bool:
+        """Store the FSM state and JSON data for a key"""
+    
+    @abstractmethod
+    async def delete_fsm_record(self, key: str) -> bool:
+        """Forget the FSM state and data for a key"""
+    
+    @abstractmethod
+    async def purge_fsm_records(self, max_age: float) -> int:
+        """Delete FSM records not touched for max_age seconds; returns how many"""
+    
+    # Campaigns
+    
+    @abstractmethod
+    async def create_campaign(self, description: str, fingerprint: str) -> Optional[int]:
+        """
+        Start a broadcast campaign to every deliverable user (total = their count now)
+        
+        Returns:
+            The new campaign ID, or None on error
+        """
+    
+    @abstractmethod
+    async def get_campaign(self, campaign_id: int) -> Optional[dict]:
+        """
+        Get a campaign
+        
+        Returns:
+            Dict with campaign_id, description, fingerprint, status, created_at,
+            finished_at, last_user_id, total, payload, scheduled_at and
+            deliveries (count per delivery status), or None
+        """
+    
+    @abstractmethod
+    async def get_campaigns(self, statuses: Optional[Sequence[str]] = None, limit: int = 10) -> List[dict]:
+        """Get the latest campaigns (only those in one of `statuses` if given), newest first, like get_campaign"""
+    
+    @abstractmethod
+    async def schedule_campaign(self, description: str, fingerprint: str, payload: str,
+                                scheduled_at: datetime) -> Optional[int]:
+        """
+        Store a campaign for the bot's campaign runner to start at scheduled_at
+        
+        Args:
+            payload: Announcement definition (JSON) the runner rebuilds the payload from
+            
+        Returns:
+            The new campaign ID, or None on error
+        """
+    
+    @abstractmethod
+    async def claim_due_campaign(self) -> Optional[dict]:
+        """
+        Mark the scheduled campaign that is due first as running and return it
+        
+        The audience is counted (total) the first time it starts. Two runners
+        never get the same campaign.
+        
+        Returns:
+            The campaign like get_campaign, or None if none is due or on error
+        """
+    
+    @abstractmethod
+    async def set_campaign_status(self, campaign_id: int, status: str, expected: Sequence[str],
+                                  scheduled_at: Optional[datetime] = None) -> bool:
+        """
+        Move a campaign to status if it is in one of the expected statuses
+        
+        finished_at is set for 'finished' and 'cancelled' and cleared
+        otherwise; scheduled_at is replaced when given.
+        
+        Returns:
+            True if the campaign was found in an expected status and changed
+        """
+    
+    @abstractmethod
+    async def claim_campaign_recipients(self, campaign_id: int, limit: int = 1000) -> Optional[List[int]]:
+        """
+        Hand out the next page of deliverable users after the campaign's cursor
+        
+        The users are journaled as pending and the cursor moves past them in
+        one transaction; users the journal already has are skipped.
+        
+        Returns:
+            User IDs in ascending order, empty at the end, None on error
+        """
+    
+    @abstractmethod
+    async def get_campaign_recipients(self, campaign_id: int, after_user_id: int = 0,
+                                      limit: int = 1000) -> Optional[List[int]]:
+        """
+        Get the next journaled recipients that are pending or failed (and not suppressed)
+        
+        Returns:
+            User IDs after after_user_id in ascending order, None on error
+        """
+    
+    @abstractmethod
+    async def record_deliveries(self, campaign_id: int,
+                                results: List[Tuple[int, str, Optional[int], Optional[str]]]) -> bool:
+        """Store (user_id, status, message_id, error) delivery outcomes in one transaction"""
+    
+    @abstractmethod
+    async def finish_campaign(self, campaign_id: int) -> bool:
+        """Mark a campaign as finished"""
+    
+    # Sweeps
+    
+    @abstractmethod
+    async def get_sweep_checkpoint(self, name: str) -> Optional[dict]:
+        """Get the progress saved by a sweep (last_user_id, checked, changed)"""
+    
+    @abstractmethod
+    async def reset_sweep_checkpoint(self, name: str) -> bool:
+        """Forget a sweep's progress so the next run starts from the beginning"""
+    
+    @abstractmethod
+    async def save_subscription_sweep(self, name: str, results: List[Tuple[int, bool]],
+                                      last_user_id: int) -> int:
+        """
+        Store re-checked subscription states and advance the checkpoint atomically
+        
+        Returns:
+            Number of users whose is_subscribed changed (-1 on error)
+        """
+    
+    # Leaderboard
+    
+    @abstractmethod
+    async def get_leaderboard_page(self, offset: int = 0, limit: int = 10) -> List[dict]:
+        """Get a slice of the referral ranking with user details and rank"""
+    
+    @abstractmethod
+    async def get_rank(self, user_id: int) -> Optional[int]:
+        """Get a user's 1-based leaderboard position (None without referrals)"""
+    
+    async def get_top_referrers(self, limit: int = 10) -> List[dict]:
+        """Get top referrers by referral count"""
+        return await self.get_leaderboard_page(0, limit)
+    
+    @abstractmethod
+    async def get_users_with_referrals(self) -> List[dict]:
+        """Get every user who referred at least one person"""
+    
+    # Statistics
+    
+    @abstractmethod
+    async def get_total_users(self) -> int:
+        """Get total number of users"""
+    
+    @abstractmethod
+    async def get_total_referrals(self) -> int:
+        """Get total number of referrals"""
+    
+    @abstractmethod
+    async def get_subscribed_users_count(self) -> int:
+        """Get count of subscribed users"""
+    
+    @abstractmethod
+    async def get_users_with_phone_count(self) -> int:
+        """Get count of users who shared phone number"""
+    
+    @abstractmethod
+    async def get_stats_snapshot(self, top: int = 50) -> dict:
+        """Get every /stats counter and the top referrers from one consistent read"""
+    
+    def cache_stats(self) -> dict:
+        """Counters of the backend's user cache (zeros if it has none)"""
+        return {'entries': 0, 'bytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0, 'hit_rate': 0.0}
+    
+    # Lifecycle
+    
+    @abstractmethod
+    async def close(self):
+        """Flush pending writes and release connections"""
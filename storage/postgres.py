@@ -0,0 +1,1111 @@
+"""
+PostgreSQL storage backend
+Lets several bot and broadcast processes on different hosts share one
+database. Needs the optional asyncpg package: pip install asyncpg
+
+Unlike the SQLite backend there is no in-process row cache, write-behind
+buffer or leaderboard here: other processes write to the same tables, so
+every read goes to the database and relies on its indexes instead.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from config import config
+from .base import Storage, UserProfile, empty_stats_snapshot
+
+try:
+    import asyncpg
+except ImportError:  # optional dependency
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+# Same shape as SQLite rows: created_at as 'YYYY-MM-DD HH:MM:SS' (UTC)
+USER_COLUMNS = """
+    user_id, username, first_name, last_name, phone_number, referrer_id,
+    points, referral_count, is_subscribed,
+    to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS created_at,
+    to_char(joined_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS joined_at,
+    to_char(left_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS left_at,
+    to_char(membership_updated_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS membership_updated_at,
+    delivery_status,
+    to_char(delivery_status_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS delivery_status_at
+"""
+
+# Campaign rows in the same shape
+CAMPAIGN_COLUMNS = """
+    campaign_id, description, fingerprint, status, last_user_id, total, payload,
+    to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS created_at,
+    to_char(finished_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS finished_at,
+    to_char(scheduled_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS scheduled_at
+"""
+
+# Number of users ranked ahead of user $1 (ties broken by user_id)
+RANK_SQL = """
+    SELECT CASE WHEN u.referral_count > 0 THEN 1
+        + (SELECT COUNT(*) FROM users o
+           WHERE o.referral_count > u.referral_count AND o.referral_count > 0)
+        + (SELECT COUNT(*) FROM users o
+           WHERE o.referral_count = u.referral_count AND o.referral_count > 0
+             AND o.user_id < u.user_id)
+    END
+    FROM users u WHERE u.user_id = $1
+"""
+
+MIGRATIONS = [
+    (1, "base schema", """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            phone_number TEXT,
+            referrer_id BIGINT,
+            points INTEGER NOT NULL DEFAULT 0,
+            referral_count INTEGER NOT NULL DEFAULT 0,
+            is_subscribed SMALLINT NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS referrals (
+            id BIGSERIAL PRIMARY KEY,
+            referrer_id BIGINT NOT NULL,
+            referred_id BIGINT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            UNIQUE (referrer_id, referred_id)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_referrals_referrer_created
+            ON referrals (referrer_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_referrals_referred
+            ON referrals (referred_id);
+        CREATE INDEX IF NOT EXISTS idx_users_subscribed
+            ON users (user_id) WHERE is_subscribed = 1;
+        CREATE INDEX IF NOT EXISTS idx_users_phone
+            ON users (user_id) WHERE phone_number IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_users_referral_count
+            ON users (referral_count DESC, user_id) WHERE referral_count > 0;
+    """),
+    (2, "stats table maintained by triggers", """
+        CREATE TABLE IF NOT EXISTS stats (
+            id SMALLINT PRIMARY KEY CHECK (id = 1),
+            total_users BIGINT NOT NULL DEFAULT 0,
+            subscribed_users BIGINT NOT NULL DEFAULT 0,
+            users_with_phone BIGINT NOT NULL DEFAULT 0,
+            total_referrals BIGINT NOT NULL DEFAULT 0
+        );
+
+        INSERT INTO stats (id, total_users, subscribed_users, users_with_phone, total_referrals)
+        SELECT 1,
+               (SELECT COUNT(*) FROM users),
+               (SELECT COUNT(*) FROM users WHERE is_subscribed = 1),
+               (SELECT COUNT(*) FROM users WHERE phone_number IS NOT NULL),
+               (SELECT COUNT(*) FROM referrals)
+        ON CONFLICT (id) DO UPDATE SET
+            total_users = EXCLUDED.total_users,
+            subscribed_users = EXCLUDED.subscribed_users,
+            users_with_phone = EXCLUDED.users_with_phone,
+            total_referrals = EXCLUDED.total_referrals;
+
+        CREATE OR REPLACE FUNCTION stats_users_changed() RETURNS trigger AS $$
+        DECLARE
+            d_users INTEGER := 0;
+            d_subscribed INTEGER := 0;
+            d_phone INTEGER := 0;
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                d_users := d_users + 1;
+                d_subscribed := d_subscribed + (NEW.is_subscribed = 1)::int;
+                d_phone := d_phone + (NEW.phone_number IS NOT NULL)::int;
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                d_users := d_users - 1;
+                d_subscribed := d_subscribed - (OLD.is_subscribed = 1)::int;
+                d_phone := d_phone - (OLD.phone_number IS NOT NULL)::int;
+            END IF;
+            IF d_users <> 0 OR d_subscribed <> 0 OR d_phone <> 0 THEN
+                UPDATE stats SET
+                    total_users = total_users + d_users,
+                    subscribed_users = subscribed_users + d_subscribed,
+                    users_with_phone = users_with_phone + d_phone
+                WHERE id = 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION stats_referrals_changed() RETURNS trigger AS $$
+        BEGIN
+            UPDATE stats SET total_referrals = total_referrals
+                + CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END
+            WHERE id = 1;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_stats_users ON users;
+        CREATE TRIGGER trg_stats_users
+            AFTER INSERT OR DELETE OR UPDATE OF is_subscribed, phone_number ON users
+            FOR EACH ROW EXECUTE FUNCTION stats_users_changed();
+
+        DROP TRIGGER IF EXISTS trg_stats_referrals ON referrals;
+        CREATE TRIGGER trg_stats_referrals
+            AFTER INSERT OR DELETE ON referrals
+            FOR EACH ROW EXECUTE FUNCTION stats_referrals_changed();
+    """),
+    (3, "channel join/leave timestamps", """
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS joined_at TIMESTAMPTZ;
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS left_at TIMESTAMPTZ;
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS membership_updated_at TIMESTAMPTZ;
+    """),
+    (4, "checkpoints for long-running sweeps", """
+        CREATE TABLE IF NOT EXISTS sweep_checkpoints (
+            name TEXT PRIMARY KEY,
+            last_user_id BIGINT NOT NULL DEFAULT 0,
+            checked BIGINT NOT NULL DEFAULT 0,
+            changed BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """),
+    (5, "Telegram file_id cache for uploaded media", """
+        CREATE TABLE IF NOT EXISTS media_cache (
+            path TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            uploaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (path, sha256)
+        );
+    """),
+    (6, "persistent FSM states", """
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at);
+    """),
+    (7, "broadcast campaigns and delivery journal", """
+        CREATE TABLE IF NOT EXISTS campaigns (
+            campaign_id BIGSERIAL PRIMARY KEY,
+            description TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ
+        );
+        CREATE TABLE IF NOT EXISTS campaign_deliveries (
+            campaign_id BIGINT NOT NULL REFERENCES campaigns(campaign_id),
+            user_id BIGINT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            message_id BIGINT,
+            error TEXT,
+            updated_at TIMESTAMPTZ,
+            PRIMARY KEY (campaign_id, user_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_campaign_deliveries_status
+            ON campaign_deliveries (campaign_id, status, user_id);
+    """),
+    (8, "suppression of unreachable users", """
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS delivery_status TEXT;
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS delivery_status_at TIMESTAMPTZ;
+        CREATE INDEX IF NOT EXISTS idx_users_deliverable
+            ON users (user_id, delivery_status) WHERE delivery_status IS NULL;
+    """),
+    (9, "recipient cursor of broadcast campaigns", """
+        ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS last_user_id BIGINT NOT NULL DEFAULT 0;
+        ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS total BIGINT NOT NULL DEFAULT 0;
+    """),
+    (10, "scheduled campaigns", """
+        ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS payload TEXT;
+        ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS scheduled_at TIMESTAMPTZ;
+        CREATE INDEX IF NOT EXISTS idx_campaigns_scheduled ON campaigns (status, scheduled_at);
+    """),
+    (11, "stats counters sharded over 16 rows", """
+        -- Every write used to update the single stats row, which serialized all
+        -- writers. Each user (and each referral, by the referred user) now
+        -- updates one of 16 rows; the readers sum them.
+        LOCK TABLE users, referrals IN SHARE ROW EXCLUSIVE MODE;
+
+        CREATE TABLE IF NOT EXISTS stats_shards (
+            shard SMALLINT PRIMARY KEY,
+            total_users BIGINT NOT NULL DEFAULT 0,
+            subscribed_users BIGINT NOT NULL DEFAULT 0,
+            users_with_phone BIGINT NOT NULL DEFAULT 0,
+            total_referrals BIGINT NOT NULL DEFAULT 0
+        );
+
+        INSERT INTO stats_shards (shard, total_users, subscribed_users, users_with_phone, total_referrals)
+        SELECT s.shard,
+               COALESCE(u.total_users, 0),
+               COALESCE(u.subscribed_users, 0),
+               COALESCE(u.users_with_phone, 0),
+               COALESCE(r.total_referrals, 0)
+        FROM generate_series(0, 15) AS s(shard)
+        LEFT JOIN (
+            SELECT abs(user_id % 16) AS shard,
+                   COUNT(*) AS total_users,
+                   COUNT(*) FILTER (WHERE is_subscribed = 1) AS subscribed_users,
+                   COUNT(*) FILTER (WHERE phone_number IS NOT NULL) AS users_with_phone
+            FROM users GROUP BY 1
+        ) u ON u.shard = s.shard
+        LEFT JOIN (
+            SELECT abs(referred_id % 16) AS shard, COUNT(*) AS total_referrals
+            FROM referrals GROUP BY 1
+        ) r ON r.shard = s.shard
+        ON CONFLICT (shard) DO UPDATE SET
+            total_users = EXCLUDED.total_users,
+            subscribed_users = EXCLUDED.subscribed_users,
+            users_with_phone = EXCLUDED.users_with_phone,
+            total_referrals = EXCLUDED.total_referrals;
+
+        CREATE OR REPLACE FUNCTION stats_users_changed() RETURNS trigger AS $$
+        DECLARE
+            d_users INTEGER := 0;
+            d_subscribed INTEGER := 0;
+            d_phone INTEGER := 0;
+            row_user_id BIGINT;
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                row_user_id := NEW.user_id;
+                d_users := d_users + 1;
+                d_subscribed := d_subscribed + (NEW.is_subscribed = 1)::int;
+                d_phone := d_phone + (NEW.phone_number IS NOT NULL)::int;
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                row_user_id := OLD.user_id;
+                d_users := d_users - 1;
+                d_subscribed := d_subscribed - (OLD.is_subscribed = 1)::int;
+                d_phone := d_phone - (OLD.phone_number IS NOT NULL)::int;
+            END IF;
+            IF d_users <> 0 OR d_subscribed <> 0 OR d_phone <> 0 THEN
+                UPDATE stats_shards SET
+                    total_users = total_users + d_users,
+                    subscribed_users = subscribed_users + d_subscribed,
+                    users_with_phone = users_with_phone + d_phone
+                WHERE shard = abs(row_user_id % 16);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION stats_referrals_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE stats_shards SET total_referrals = total_referrals + 1
+                WHERE shard = abs(NEW.referred_id % 16);
+            ELSE
+                UPDATE stats_shards SET total_referrals = total_referrals - 1
+                WHERE shard = abs(OLD.referred_id % 16);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TABLE IF EXISTS stats;
+    """),
+]
+
+
+class PostgresStorage(Storage):
+    """Storage backed by a shared PostgreSQL database through an asyncpg pool"""
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10):
+        if asyncpg is None:
+            raise RuntimeError("STORAGE_BACKEND=postgres needs asyncpg: pip install asyncpg")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool: Optional["asyncpg.Pool"] = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self) -> "asyncpg.Pool":
+        """Create the pool and migrate the schema on first use"""
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    pool = await asyncpg.create_pool(
+                        self.dsn, min_size=self.min_size, max_size=self.max_size
+                    )
+                    async with pool.acquire() as conn:
+                        await self._migrate(conn)
+                    self._pool = pool
+        return self._pool
+
+    async def _migrate(self, conn: "asyncpg.Connection"):
+        """Apply pending schema migrations under an advisory lock"""
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('referral_bot_migrations'))")
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            applied = {row['version'] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+
+            for version, description, sql in MIGRATIONS:
+                if version in applied:
+                    continue
+                await conn.execute(sql)
+                await conn.execute("INSERT INTO schema_migrations (version) VALUES ($1)", version)
+                logger.info(f"Applied PostgreSQL migration {version}: {description}")
+
+    # Users
+
+    async def add_user(self, user_id: int, username: Optional[str] = None,
+                       first_name: Optional[str] = None, last_name: Optional[str] = None,
+                       referrer_id: Optional[int] = None) -> bool:
+        """Add new user (ignored if the user already exists)"""
+        try:
+            pool = await self._get_pool()
+            await pool.execute("""
+                INSERT INTO users (user_id, username, first_name, last_name, referrer_id)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (user_id) DO NOTHING
+            """, user_id, username, first_name, last_name, referrer_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error adding user: {e}")
+            return False
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        """Get user row by ID"""
+        try:
+            pool = await self._get_pool()
+            row = await pool.fetchrow(f"SELECT {USER_COLUMNS} FROM users WHERE user_id = $1", user_id)
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting user: {e}")
+            return None
+
+    async def get_profile(self, user_id: int) -> Optional[UserProfile]:
+        """Get user fields, points, referral count, rank and flags"""
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                row = await conn.fetchrow(f"SELECT {USER_COLUMNS} FROM users WHERE user_id = $1", user_id)
+                if not row:
+                    return None
+                rank = await conn.fetchval(RANK_SQL, user_id) if row['referral_count'] > 0 else None
+            return UserProfile.from_row(row, rank)
+        except Exception as e:
+            logger.error(f"Error getting profile: {e}")
+            return None
+
+    async def update_user_subscription(self, user_id: int, is_subscribed: bool) -> bool:
+        """Update user subscription status"""
+        try:
+            pool = await self._get_pool()
+            await pool.execute("""
+                UPDATE users SET is_subscribed = $2
+                WHERE user_id = $1 AND is_subscribed IS DISTINCT FROM $2
+            """, user_id, 1 if is_subscribed else 0)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating subscription: {e}")
+            return False
+
+    async def update_phone_number(self, user_id: int, phone_number: str) -> bool:
+        """Update user phone number"""
+        try:
+            pool = await self._get_pool()
+            await pool.execute("""
+                UPDATE users SET phone_number = $2
+                WHERE user_id = $1 AND phone_number IS DISTINCT FROM $2
+            """, user_id, phone_number)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating phone number: {e}")
+            return False
+
+    async def get_all_user_ids(self, deliverable_only: bool = False) -> List[int]:
+        """Get the IDs of every user, or only of those with no delivery_status"""
+        try:
+            pool = await self._get_pool()
+            deliverable = "WHERE delivery_status IS NULL" if deliverable_only else ""
+            rows = await pool.fetch(f"SELECT user_id FROM users {deliverable} ORDER BY user_id")
+            return [row['user_id'] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting user IDs: {e}")
+            return []
+
+    async def get_user_ids_page(self, after_user_id: int = 0, limit: int = 1000,
+                                referred_only: bool = False, deliverable_only: bool = False) -> List[int]:
+        """Get the next user IDs in ascending order (keyset pagination)"""
+        try:
+            pool = await self._get_pool()
+            if referred_only:
+                deliverable = """
+                    AND referred_id IN (SELECT user_id FROM users WHERE delivery_status IS NULL)
+                """ if deliverable_only else ""
+                rows = await pool.fetch(f"""
+                    SELECT DISTINCT referred_id AS user_id FROM referrals
+                    WHERE referred_id > $1 {deliverable}
+                    ORDER BY referred_id
+                    LIMIT $2
+                """, after_user_id, limit)
+            else:
+                deliverable = "AND delivery_status IS NULL" if deliverable_only else ""
+                rows = await pool.fetch(f"""
+                    SELECT user_id FROM users
+                    WHERE user_id > $1 {deliverable}
+                    ORDER BY user_id
+                    LIMIT $2
+                """, after_user_id, limit)
+            return [row['user_id'] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting user IDs page: {e}")
+            return []
+
+    async def suppress_users(self, results: List[Tuple[int, str]]) -> int:
+        """Stop broadcasting to users that can't be reached"""
+        if not results:
+            return 0
+        try:
+            pool = await self._get_pool()
+            status = await pool.execute("""
+                UPDATE users u
+                SET delivery_status = r.status, delivery_status_at = now()
+                FROM unnest($1::bigint[], $2::text[]) AS r(user_id, status)
+                WHERE u.user_id = r.user_id
+            """, [user_id for user_id, _ in results], [status for _, status in results])
+            return int(status.split()[-1])
+        except Exception as e:
+            logger.error(f"Error suppressing users: {e}")
+            return -1
+
+    async def unsuppress_user(self, user_id: int) -> bool:
+        """Include a user in broadcasts again"""
+        try:
+            pool = await self._get_pool()
+            await pool.execute("""
+                UPDATE users SET delivery_status = NULL, delivery_status_at = NULL
+                WHERE user_id = $1 AND delivery_status IS NOT NULL
+            """, user_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error unsuppressing user: {e}")
+            return False
+
+    async def record_membership(self, user_id: int, is_subscribed: bool, changed_at: datetime) -> bool:
+        """Apply a channel join or leave seen in a chat_member update (older events are ignored)"""
+        try:
+            pool = await self._get_pool()
+            result = await pool.execute("""
+                UPDATE users
+                SET is_subscribed = $2::smallint,
+                    joined_at = CASE WHEN $2::smallint = 1 THEN $3 ELSE joined_at END,
+                    left_at = CASE WHEN $2::smallint = 1 THEN left_at ELSE $3 END,
+                    membership_updated_at = $3
+                WHERE user_id = $1
+                  AND (membership_updated_at IS NULL OR membership_updated_at <= $3)
+            """, user_id, 1 if is_subscribed else 0, changed_at)
+            return result != "UPDATE 0"
+        except Exception as e:
+            logger.error(f"Error recording membership: {e}")
+            return False
+
+    # Referrals
+
+    async def add_referral(self, referrer_id: int, referred_id: int) -> bool:
+        """Add referral and credit the referrer; False if it already existed"""
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    inserted = await conn.fetchval("""
+                        INSERT INTO referrals (referrer_id, referred_id)
+                        VALUES ($1, $2)
+                        ON CONFLICT (referrer_id, referred_id) DO NOTHING
+                        RETURNING id
+                    """, referrer_id, referred_id)
+
+                    if inserted is None:
+                        return False
+
+                    await conn.execute("""
+                        UPDATE users
+                        SET points = points + $2, referral_count = referral_count + 1
+                        WHERE user_id = $1
+                    """, referrer_id, config.POINTS_PER_REFERRAL)
+            return True
+        except Exception as e:
+            logger.error(f"Error adding referral: {e}")
+            return False
+
+    async def revoke_referral(self, referred_id: int) -> List[int]:
+        """Delete the referrals of a user and take back the referrers' credit"""
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    rows = await conn.fetch(
+                        "DELETE FROM referrals WHERE referred_id = $1 RETURNING referrer_id", referred_id
+                    )
+                    referrer_ids = [row['referrer_id'] for row in rows]
+                    if referrer_ids:
+                        await conn.execute("""
+                            UPDATE users
+                            SET points = GREATEST(points - $2, 0),
+                                referral_count = GREATEST(referral_count - 1, 0)
+                            WHERE user_id = ANY($1::bigint[])
+                        """, referrer_ids, config.POINTS_PER_REFERRAL)
+            return referrer_ids
+        except Exception as e:
+            logger.error(f"Error revoking referral: {e}")
+            return []
+
+    async def get_user_referrals(self, user_id: int) -> List[dict]:
+        """Get all referrals for a user, newest first"""
+        try:
+            pool = await self._get_pool()
+            rows = await pool.fetch("""
+                SELECT u.user_id, u.username, u.first_name,
+                       to_char(r.created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS created_at
+                FROM referrals r
+                JOIN users u ON r.referred_id = u.user_id
+                WHERE r.referrer_id = $1
+                ORDER BY r.created_at DESC
+            """, user_id)
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting referrals: {e}")
+            return []
+
+    async def get_referral_count(self, user_id: int) -> int:
+        """Get count of user's referrals"""
+        try:
+            pool = await self._get_pool()
+            count = await pool.fetchval("SELECT referral_count FROM users WHERE user_id = $1", user_id)
+            return count or 0
+        except Exception as e:
+            logger.error(f"Error getting referral count: {e}")
+            return 0
+
+    async def verify_referral_counts(self, repair: bool = False) -> List[dict]:
+        """Compare stored referral counters with the referrals table"""
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    rows = await conn.fetch("""
+                        SELECT u.user_id, u.referral_count AS stored, COALESCE(r.cnt, 0) AS actual
+                        FROM users u
+                        LEFT JOIN (
+                            SELECT referrer_id, COUNT(*) AS cnt FROM referrals GROUP BY referrer_id
+                        ) r ON r.referrer_id = u.user_id
+                        WHERE u.referral_count != COALESCE(r.cnt, 0)
+                    """)
+                    mismatches = [dict(row) for row in rows]
+
+                    if repair and mismatches:
+                        await conn.executemany(
+                            "UPDATE users SET referral_count = $1 WHERE user_id = $2",
+                            [(m['actual'], m['user_id']) for m in mismatches]
+                        )
+
+            if mismatches:
+                logger.warning(
+                    f"Found {len(mismatches)} wrong referral counters"
+                    + (" (repaired)" if repair else "")
+                )
+            return mismatches
+        except Exception as e:
+            logger.error(f"Error verifying referral counts: {e}")
+            return []
+
+    # Leaderboard
+
+    async def get_leaderboard_page(self, offset: int = 0, limit: int = 10) -> List[dict]:
+        """Get a slice of the referral ranking with user details and rank"""
+        try:
+            pool = await self._get_pool()
+            rows = await pool.fetch("""
+                SELECT user_id, username, first_name, last_name, phone_number, points, referral_count
+                FROM users
+                WHERE referral_count > 0
+                ORDER BY referral_count DESC, user_id
+                LIMIT $1 OFFSET $2
+            """, limit, offset)
+
+            page = []
+            for position, row in enumerate(rows, offset + 1):
+                entry = dict(row)
+                entry['rank'] = position
+                page.append(entry)
+            return page
+        except Exception as e:
+            logger.error(f"Error getting leaderboard page: {e}")
+            return []
+
+    async def get_rank(self, user_id: int) -> Optional[int]:
+        """Get a user's 1-based leaderboard position (None without referrals)"""
+        try:
+            pool = await self._get_pool()
+            return await pool.fetchval(RANK_SQL, user_id)
+        except Exception as e:
+            logger.error(f"Error getting rank: {e}")
+            return None
+
+    async def get_users_with_referrals(self) -> List[dict]:
+        """Get every user who referred at least one person"""
+        try:
+            pool = await self._get_pool()
+            rows = await pool.fetch("""
+                SELECT user_id, first_name, last_name, username, phone_number, referral_count
+                FROM users
+                WHERE referral_count > 0
+                ORDER BY referral_count DESC, first_name ASC
+            """)
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting users with referrals: {e}")
+            return []
+
+    # Media
+
+    async def get_media_file_id(self, path: str, sha256: str) -> Optional[str]:
+        """Get the Telegram file_id stored for a media file with this content"""
+        try:
+            pool = await self._get_pool()
+            return await pool.fetchval(
+                "SELECT file_id FROM media_cache WHERE path = $1 AND sha256 = $2", path, sha256
+            )
+        except Exception as e:
+            logger.error(f"Error getting media file_id: {e}")
+            return None
+
+    async def save_media_file_id(self, path: str, sha256: str, file_id: str) -> bool:
+        """Store the file_id of an upload, replacing ids of older versions of the file"""
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("DELETE FROM media_cache WHERE path = $1 AND sha256 <> $2", path, sha256)
+                    await conn.execute("""
+                        INSERT INTO media_cache (path, sha256, file_id, uploaded_at)
+                        VALUES ($1, $2, $3, now())
+                        ON CONFLICT (path, sha256) DO UPDATE SET
+                            file_id = EXCLUDED.file_id, uploaded_at = EXCLUDED.uploaded_at
+                    """, path, sha256, file_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving media file_id: {e}")
+            return False
+
+    async def delete_media_file_id(self, path: str, sha256: str) -> bool:
+        """Forget a file_id that Telegram no longer accepts"""
+        try:
+            pool = await self._get_pool()
+            await pool.execute("DELETE FROM media_cache WHERE path = $1 AND sha256 = $2", path, sha256)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting media file_id: {e}")
+            return False
+
+    # FSM
+
+    async def get_fsm_record(self, key: str, max_age: float) -> Optional[dict]:
+        """Get the FSM state and JSON data saved under a key, unless older than max_age seconds"""
+        try:
+            pool = await self._get_pool()
+            row = await pool.fetchrow("""
+                SELECT state, data FROM fsm_states
+                WHERE key = $1 AND updated_at >= now() - make_interval(secs => $2)
+            """, key, float(max_age))
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting FSM record: {e}")
+            return None
+
+    async def save_fsm_record(self, key: str, state: Optional[str], data: str) -> bool:
+        """Store the FSM state and JSON data for a key"""
+        try:
+            pool = await self._get_pool()
+            await pool.execute("""
+                INSERT INTO fsm_states (key, state, data, updated_at)
+                VALUES ($1, $2, $3, now())
+                ON CONFLICT (key) DO UPDATE SET
+                    state = EXCLUDED.state, data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+            """, key, state, data)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving FSM record: {e}")
+            return False
+
+    async def delete_fsm_record(self, key: str) -> bool:
+        """Forget the FSM state and data for a key"""
+        try:
+            pool = await self._get_pool()
+            await pool.execute("DELETE FROM fsm_states WHERE key = $1", key)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting FSM record: {e}")
+            return False
+
+    async def purge_fsm_records(self, max_age: float) -> int:
+        """Delete FSM records not touched for max_age seconds; returns how many"""
+        try:
+            pool = await self._get_pool()
+            status = await pool.execute(
+                "DELETE FROM fsm_states WHERE updated_at < now() - make_interval(secs => $1)",
+                float(max_age)
+            )
+            return int(status.split()[-1])
+        except Exception as e:
+            logger.error(f"Error purging FSM records: {e}")
+            return 0
+
+    # Campaigns
+
+    async def create_campaign(self, description: str, fingerprint: str) -> Optional[int]:
+        """Start a broadcast campaign to every deliverable user"""
+        try:
+            pool = await self._get_pool()
+            return await pool.fetchval("""
+                INSERT INTO campaigns (description, fingerprint, total)
+                VALUES ($1, $2, (SELECT COUNT(*) FROM users WHERE delivery_status IS NULL))
+                RETURNING campaign_id
+            """, description, fingerprint)
+        except Exception as e:
+            logger.error(f"Error creating campaign: {e}")
+            return None
+
+    async def get_campaign(self, campaign_id: int) -> Optional[dict]:
+        """Get a campaign with the number of recipients in each delivery status"""
+        try:
+            pool = await self._get_pool()
+            row = await pool.fetchrow(f"""
+                SELECT {CAMPAIGN_COLUMNS} FROM campaigns WHERE campaign_id = $1
+            """, campaign_id)
+            if not row:
+                return None
+            counts = await pool.fetch("""
+                SELECT status, COUNT(*) AS count FROM campaign_deliveries
+                WHERE campaign_id = $1 GROUP BY status
+            """, campaign_id)
+
+            campaign = dict(row)
+            campaign['deliveries'] = {r['status']: r['count'] for r in counts}
+            return campaign
+        except Exception as e:
+            logger.error(f"Error getting campaign: {e}")
+            return None
+
+    async def get_campaigns(self, statuses: Optional[Sequence[str]] = None, limit: int = 10) -> List[dict]:
+        """Get the latest campaigns, newest first, with their delivery counts"""
+        try:
+            pool = await self._get_pool()
+            rows = await pool.fetch(f"""
+                SELECT {CAMPAIGN_COLUMNS} FROM campaigns
+                WHERE $1::text[] IS NULL OR status = ANY($1::text[])
+                ORDER BY campaign_id DESC
+                LIMIT $2
+            """, list(statuses) if statuses else None, limit)
+            campaigns = [dict(row) for row in rows]
+            if not campaigns:
+                return []
+            counts = await pool.fetch("""
+                SELECT campaign_id, status, COUNT(*) AS count FROM campaign_deliveries
+                WHERE campaign_id = ANY($1::bigint[])
+                GROUP BY campaign_id, status
+            """, [campaign['campaign_id'] for campaign in campaigns])
+
+            deliveries = {campaign['campaign_id']: {} for campaign in campaigns}
+            for r in counts:
+                deliveries[r['campaign_id']][r['status']] = r['count']
+            for campaign in campaigns:
+                campaign['deliveries'] = deliveries[campaign['campaign_id']]
+            return campaigns
+        except Exception as e:
+            logger.error(f"Error getting campaigns: {e}")
+            return []
+
+    async def schedule_campaign(self, description: str, fingerprint: str, payload: str,
+                                scheduled_at: datetime) -> Optional[int]:
+        """Store a campaign for the campaign runner to start at scheduled_at"""
+        try:
+            pool = await self._get_pool()
+            return await pool.fetchval("""
+                INSERT INTO campaigns (description, fingerprint, status, payload, scheduled_at)
+                VALUES ($1, $2, 'scheduled', $3, $4)
+                RETURNING campaign_id
+            """, description, fingerprint, payload, scheduled_at)
+        except Exception as e:
+            logger.error(f"Error scheduling campaign: {e}")
+            return None
+
+    async def claim_due_campaign(self) -> Optional[dict]:
+        """Mark the scheduled campaign that is due first as running and return it"""
+        try:
+            pool = await self._get_pool()
+            # SKIP LOCKED: two runners polling at once never start the same campaign
+            campaign_id = await pool.fetchval("""
+                UPDATE campaigns
+                SET status = 'running', finished_at = NULL,
+                    total = CASE WHEN last_user_id = 0
+                                 THEN (SELECT COUNT(*) FROM users WHERE delivery_status IS NULL)
+                                 ELSE total END
+                WHERE campaign_id = (
+                    SELECT campaign_id FROM campaigns
+                    WHERE status = 'scheduled' AND scheduled_at <= now()
+                    ORDER BY scheduled_at, campaign_id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING campaign_id
+            """)
+            return await self.get_campaign(campaign_id) if campaign_id is not None else None
+        except Exception as e:
+            logger.error(f"Error claiming due campaign: {e}")
+            return None
+
+    async def set_campaign_status(self, campaign_id: int, status: str, expected: Sequence[str],
+                                  scheduled_at: Optional[datetime] = None) -> bool:
+        """Move a campaign to status if it is in one of the expected statuses"""
+        try:
+            pool = await self._get_pool()
+            result = await pool.execute("""
+                UPDATE campaigns
+                SET status = $2,
+                    finished_at = CASE WHEN $2 IN ('finished', 'cancelled') THEN now() END,
+                    scheduled_at = COALESCE($4, scheduled_at)
+                WHERE campaign_id = $1 AND status = ANY($3::text[])
+            """, campaign_id, status, list(expected), scheduled_at)
+            return int(result.split()[-1]) > 0
+        except Exception as e:
+            logger.error(f"Error setting campaign status: {e}")
+            return False
+
+    async def claim_campaign_recipients(self, campaign_id: int, limit: int = 1000) -> Optional[List[int]]:
+        """Hand out the next page of a campaign's recipients and advance its cursor"""
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    # Row lock: two processes resuming the same campaign get different pages
+                    after_user_id = await conn.fetchval(
+                        "SELECT last_user_id FROM campaigns WHERE campaign_id = $1 FOR UPDATE", campaign_id
+                    )
+                    if after_user_id is None:
+                        return None
+
+                    while True:
+                        page = [r['user_id'] for r in await conn.fetch("""
+                            SELECT user_id FROM users
+                            WHERE user_id > $1 AND delivery_status IS NULL
+                            ORDER BY user_id
+                            LIMIT $2
+                        """, after_user_id, limit)]
+                        if not page:
+                            return []
+                        after_user_id = page[-1]
+
+                        rows = await conn.fetch("""
+                            INSERT INTO campaign_deliveries (campaign_id, user_id)
+                            SELECT $1, user_id FROM unnest($2::bigint[]) AS r(user_id)
+                            ON CONFLICT DO NOTHING
+                            RETURNING user_id
+                        """, campaign_id, page)
+                        await conn.execute(
+                            "UPDATE campaigns SET last_user_id = $2 WHERE campaign_id = $1",
+                            campaign_id, after_user_id
+                        )
+                        if rows:
+                            return sorted(r['user_id'] for r in rows)
+        except Exception as e:
+            logger.error(f"Error claiming campaign recipients: {e}")
+            return None
+
+    async def get_campaign_recipients(self, campaign_id: int, after_user_id: int = 0,
+                                      limit: int = 1000) -> Optional[List[int]]:
+        """Get the next journaled recipients that are still pending or failed"""
+        try:
+            pool = await self._get_pool()
+            rows = await pool.fetch("""
+                SELECT d.user_id FROM campaign_deliveries d
+                JOIN users u ON u.user_id = d.user_id AND u.delivery_status IS NULL
+                WHERE d.campaign_id = $1 AND d.user_id > $2 AND d.status IN ('pending', 'failed')
+                ORDER BY d.user_id
+                LIMIT $3
+            """, campaign_id, after_user_id, limit)
+            return [row['user_id'] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting campaign recipients: {e}")
+            return None
+
+    async def record_deliveries(self, campaign_id: int,
+                                results: List[Tuple[int, str, Optional[int], Optional[str]]]) -> bool:
+        """Store a batch of delivery outcomes in one statement"""
+        if not results:
+            return True
+        try:
+            user_ids, statuses, message_ids, errors = (list(column) for column in zip(*results))
+            pool = await self._get_pool()
+            await pool.execute("""
+                UPDATE campaign_deliveries d
+                SET status = r.status, message_id = r.message_id, error = r.error, updated_at = now()
+                FROM unnest($2::bigint[], $3::text[], $4::bigint[], $5::text[])
+                     AS r(user_id, status, message_id, error)
+                WHERE d.campaign_id = $1 AND d.user_id = r.user_id
+            """, campaign_id, user_ids, statuses, message_ids, errors)
+            return True
+        except Exception as e:
+            logger.error(f"Error recording deliveries: {e}")
+            return False
+
+    async def finish_campaign(self, campaign_id: int) -> bool:
+        """Mark a campaign as finished"""
+        try:
+            pool = await self._get_pool()
+            await pool.execute("""
+                UPDATE campaigns SET status = 'finished', finished_at = now()
+                WHERE campaign_id = $1
+            """, campaign_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error finishing campaign: {e}")
+            return False
+
+    # Sweeps
+
+    async def get_sweep_checkpoint(self, name: str) -> Optional[dict]:
+        """Get the progress saved by a sweep"""
+        try:
+            pool = await self._get_pool()
+            row = await pool.fetchrow("""
+                SELECT name, last_user_id, checked, changed,
+                       to_char(updated_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS updated_at
+                FROM sweep_checkpoints WHERE name = $1
+            """, name)
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting sweep checkpoint: {e}")
+            return None
+
+    async def reset_sweep_checkpoint(self, name: str) -> bool:
+        """Forget a sweep's progress"""
+        try:
+            pool = await self._get_pool()
+            await pool.execute("DELETE FROM sweep_checkpoints WHERE name = $1", name)
+            return True
+        except Exception as e:
+            logger.error(f"Error resetting sweep checkpoint: {e}")
+            return False
+
+    async def save_subscription_sweep(self, name: str, results: List[Tuple[int, bool]],
+                                      last_user_id: int) -> int:
+        """Store a batch of re-checked subscription states and advance the checkpoint"""
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    changed = await conn.fetchval("""
+                        WITH updated AS (
+                            UPDATE users u
+                            SET is_subscribed = r.is_subscribed
+                            FROM unnest($1::bigint[], $2::smallint[]) AS r(user_id, is_subscribed)
+                            WHERE u.user_id = r.user_id AND u.is_subscribed <> r.is_subscribed
+                            RETURNING 1
+                        )
+                        SELECT COUNT(*) FROM updated
+                    """, [user_id for user_id, _ in results], [int(s) for _, s in results])
+                    await conn.execute("""
+                        INSERT INTO sweep_checkpoints (name, last_user_id, checked, changed, updated_at)
+                        VALUES ($1, $2, $3, $4, now())
+                        ON CONFLICT (name) DO UPDATE SET
+                            last_user_id = EXCLUDED.last_user_id,
+                            checked = sweep_checkpoints.checked + EXCLUDED.checked,
+                            changed = sweep_checkpoints.changed + EXCLUDED.changed,
+                            updated_at = EXCLUDED.updated_at
+                    """, name, last_user_id, len(results), changed)
+            return changed
+        except Exception as e:
+            logger.error(f"Error saving subscription sweep: {e}")
+            return -1
+
+    # Statistics
+
+    async def _count(self, query: str) -> int:
+        """Run a query returning a single counter"""
+        pool = await self._get_pool()
+        return await pool.fetchval(query) or 0
+
+    async def get_total_users(self) -> int:
+        """Get total number of users"""
+        try:
+            return await self._count("SELECT SUM(total_users)::bigint FROM stats_shards")
+        except Exception as e:
+            logger.error(f"Error getting total users: {e}")
+            return 0
+
+    async def get_total_referrals(self) -> int:
+        """Get total number of referrals"""
+        try:
+            return await self._count("SELECT SUM(total_referrals)::bigint FROM stats_shards")
+        except Exception as e:
+            logger.error(f"Error getting total referrals: {e}")
+            return 0
+
+    async def get_subscribed_users_count(self) -> int:
+        """Get count of subscribed users"""
+        try:
+            return await self._count("SELECT SUM(subscribed_users)::bigint FROM stats_shards")
+        except Exception as e:
+            logger.error(f"Error getting subscribed users count: {e}")
+            return 0
+
+    async def get_users_with_phone_count(self) -> int:
+        """Get count of users who shared phone number"""
+        try:
+            return await self._count("SELECT SUM(users_with_phone)::bigint FROM stats_shards")
+        except Exception as e:
+            logger.error(f"Error getting users with phone count: {e}")
+            return 0
+
+    async def get_stats_snapshot(self, top: int = 50) -> dict:
+        """
+        Get every /stats counter and the top referrers as of one moment
+
+        The counters are sums of the trigger-maintained stats shards; both
+        reads run in one REPEATABLE READ transaction so they share a snapshot.
+        """
+        try:
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction(isolation='repeatable_read', readonly=True):
+                    counters = await conn.fetchrow("""
+                        SELECT SUM(total_users)::bigint AS total_users,
+                               SUM(subscribed_users)::bigint AS subscribed_users,
+                               SUM(users_with_phone)::bigint AS users_with_phone,
+                               SUM(total_referrals)::bigint AS total_referrals
+                        FROM stats_shards
+                    """)
+                    rows = await conn.fetch("""
+                        SELECT user_id, username, first_name, last_name, phone_number,
+                               points, referral_count
+                        FROM users
+                        WHERE referral_count > 0
+                        ORDER BY referral_count DESC, user_id
+                        LIMIT $1
+                    """, top)
+
+            snapshot = dict(counters) if counters else empty_stats_snapshot()
+            snapshot['top_referrers'] = [
+                dict(row, rank=position) for position, row in enumerate(rows, 1)
+            ]
+            return snapshot
+        except Exception as e:
+            logger.error(f"Error getting stats snapshot: {e}")
+            return empty_stats_snapshot()
+
+    # Lifecycle
+
+    async def close(self):
+        """Close the connection pool"""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
@@ -0,0 +1,181 @@
+"""
+Subscription re-verification sweep
+Re-checks get_chat_member for every user (or only referred users) and stores
+the result in users.is_subscribed. Requests go through a token bucket so the
+sweep stays well under Telegram's limits and leaves room for the running bot.
+Progress is checkpointed with every batch; run again to resume.
+Usage: python sweep_subscriptions.py [--referred-only] [--rate 15] [--restart]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from config import config
+from database import adb
+from ratelimit import TokenBucket
+from utils import SUBSCRIBED_STATUSES
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout),
+        logging.FileHandler('sweep.log')
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+# Defaults: 15 requests/s is half of Telegram's ~30/s bot-wide budget, so the
+# bot keeps answering users while a sweep runs (100k users take ~1h 50m)
+DEFAULT_RATE = 15.0
+DEFAULT_CONCURRENCY = 8
+DEFAULT_BATCH_SIZE = 500
+MAX_ATTEMPTS = 5
+
+
+async def check_member(bot: Bot, bucket: TokenBucket, user_id: int) -> Optional[bool]:
+    """
+    Ask Telegram whether a user is in the channel
+    
+    Returns:
+        True/False, or None if no answer could be obtained
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        await bucket.acquire()
+        try:
+            member = await bot.get_chat_member(chat_id=config.CHANNEL_ID, user_id=user_id)
+            return member.status in SUBSCRIBED_STATUSES
+        except TelegramRetryAfter as e:
+            # Flood control applies to the whole bot: stop every worker
+            logger.warning(f"Flood control, pausing for {e.retry_after}s")
+            bucket.pause(e.retry_after)
+        except TelegramBadRequest as e:
+            if "chat not found" in str(e).lower():
+                raise
+            logger.warning(f"Cannot check user {user_id}: {e}")
+            return None
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logger.warning(f"Attempt {attempt} for user {user_id} failed: {e}")
+            await asyncio.sleep(min(2 ** attempt, 30))
+    
+    logger.error(f"Giving up on user {user_id} after {MAX_ATTEMPTS} attempts")
+    return None
+
+
+async def sweep(bot: Bot, name: str, referred_only: bool, rate: float, concurrency: int,
+                batch_size: int, revoke: bool):
+    """Check users batch by batch, saving results and the checkpoint after each batch"""
+    checkpoint = await adb.get_sweep_checkpoint(name)
+    after_user_id = checkpoint['last_user_id'] if checkpoint else 0
+    if checkpoint:
+        logger.info(
+            f"Resuming sweep '{name}' after user {after_user_id} "
+            f"({checkpoint['checked']} checked, {checkpoint['changed']} changed so far)"
+        )
+    
+    snapshot = await adb.get_stats_snapshot(top=0)
+    estimate = snapshot['total_referrals'] if referred_only else snapshot['total_users']
+    logger.info(f"Up to {estimate} users to check at {rate:g}/s: about {estimate / rate / 60:.0f} min")
+    
+    # No burst allowance: requests are spaced evenly from the first one
+    bucket = TokenBucket(rate, capacity=1)
+    slots = asyncio.Semaphore(concurrency)
+    
+    async def check(user_id: int):
+        async with slots:
+            return user_id, await check_member(bot, bucket, user_id)
+    
+    checked = changed = unknown = revoked = 0
+    started = time.monotonic()
+    
+    while True:
+        user_ids = await adb.get_user_ids_page(after_user_id, batch_size, referred_only)
+        if not user_ids:
+            break
+        
+        results = await asyncio.gather(*(check(user_id) for user_id in user_ids))
+        known = [(user_id, subscribed) for user_id, subscribed in results if subscribed is not None]
+        
+        batch_changed = await adb.save_subscription_sweep(name, known, user_ids[-1])
+        if batch_changed < 0:
+            raise RuntimeError("Could not save sweep results; checkpoint not advanced")
+        
+        if revoke:
+            for user_id, subscribed in known:
+                if not subscribed:
+                    revoked += len(await adb.revoke_referral(user_id))
+        
+        after_user_id = user_ids[-1]
+        checked += len(known)
+        changed += batch_changed
+        unknown += len(user_ids) - len(known)
+        
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Checked {checked + unknown} users ({checked / elapsed:.1f}/s), "
+            f"{changed} changed, {unknown} unknown, last user {after_user_id}"
+        )
+    
+    logger.info("=" * 50)
+    logger.info("SWEEP SUMMARY")
+    logger.info("=" * 50)
+    logger.info(f"Checked: {checked}")
+    logger.info(f"Subscription changed: {changed}")
+    logger.info(f"Could not check: {unknown}")
+    if revoke:
+        logger.info(f"Referrals revoked: {revoked}")
+    logger.info("=" * 50)
+
+
+async def run(args: argparse.Namespace):
+    """Open the bot session, run the sweep and clean up"""
+    name = args.name or ("subscriptions:referred" if args.referred_only else "subscriptions")
+    if args.restart:
+        await adb.reset_sweep_checkpoint(name)
+    
+    bot = Bot(token=config.BOT_TOKEN)
+    try:
+        await sweep(bot, name, args.referred_only, args.rate, args.concurrency, args.batch_size, args.revoke)
+    finally:
+        await bot.session.close()
+        await adb.close()
+
+
+def main():
+    """Parse arguments and start the sweep"""
+    parser = argparse.ArgumentParser(description='Re-check channel subscription of bot users')
+    parser.add_argument('--referred-only', action='store_true',
+                        help='Only check users who were credited as a referral')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'get_chat_member requests per second (default {DEFAULT_RATE:g})')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Requests in flight at once (default {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Users per saved batch (default {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--revoke', action='store_true',
+                        help='Take back referral credit for referred users who are not subscribed')
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore the saved checkpoint and start from the first user')
+    parser.add_argument('--name', help='Checkpoint name (default depends on --referred-only)')
+    args = parser.parse_args()
+    
+    if config.BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
+        logger.error("Bot token not configured! Please set BOT_TOKEN in .env")
+        sys.exit(1)
+    
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        logger.info("Sweep interrupted; run again to resume from the last saved batch")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from config import config
+from ratelimit import limit_outbound
 
 # Configure logging
 logging.basicConfig(
@@ -30,10 +31,10 @@ async def send_test_message(user_id: int, message: str):
         sys.exit(1)
     
     # Initialize bot
-    bot = Bot(
+    bot = limit_outbound(Bot(
         token=config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
+    ))
     
     try:
         logger.info(f"Sending test message to user {user_id}...")
@@ -0,0 +1,28 @@
+"""
+DatabaseExecutor tests
+"""
+import asyncio
+import time
+
+from database import DatabaseExecutor
+
+
+def test_cancelled_jobs_keep_their_slot_until_they_ran():
+    async def scenario():
+        executor = DatabaseExecutor(workers=1, max_queue=2)
+        try:
+            first = asyncio.ensure_future(executor.submit(time.sleep, 0.2))
+            await asyncio.sleep(0.05)
+            pending = [asyncio.ensure_future(executor.submit(time.sleep, 0.2)) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            for task in [first] + pending:
+                task.cancel()
+            await asyncio.gather(first, *pending, return_exceptions=True)
+            # The cancelled jobs are still queued: new ones wait for them instead of failing
+            return await asyncio.wait_for(
+                asyncio.gather(*(executor.submit(lambda n=n: n) for n in range(3))), timeout=5
+            )
+        finally:
+            executor.shutdown()
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
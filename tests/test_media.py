@@ -0,0 +1,75 @@
+"""
+MediaRegistry tests, against a fake bot that rejects one file_id
+"""
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto
+from aiogram.types import FSInputFile
+
+from database import AsyncDatabase, Database
+from media import MediaRegistry
+
+
+class FakeBot:
+    """Accepts only file_ids it handed out itself; every upload gets a new one"""
+
+    def __init__(self):
+        self.uploads = 0
+        self.valid = set()
+
+    async def _photo(self, photo) -> SimpleNamespace:
+        await asyncio.sleep(0.01)
+        if isinstance(photo, FSInputFile):
+            self.uploads += 1
+            photo = f"uploaded-{self.uploads}"
+            self.valid.add(photo)
+        elif photo not in self.valid:
+            raise TelegramBadRequest(SendPhoto(chat_id=1, photo=photo), "Bad Request: wrong file identifier")
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=photo)])
+
+    async def send_photo(self, chat_id: int, photo, **kwargs):
+        return await self._photo(photo)
+
+    async def send_media_group(self, chat_id: int, media: list, **kwargs):
+        return [await self._photo(item.media) for item in media]
+
+
+def run_with_stale_file_ids(tmp_path, send):
+    """Seed a rejected file_id for two images, send to 20 chats at once, return (bot, registry, file_ids)"""
+    paths = []
+    for name in ("a.jpg", "b.jpg"):
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+
+    async def scenario():
+        storage = AsyncDatabase(Database(str(tmp_path / "media.db")))
+        registry = MediaRegistry(storage)
+        bot = FakeBot()
+        try:
+            for path in paths:
+                await registry.remember(path, "stale")
+            await asyncio.gather(*(send(registry, bot, chat_id, paths) for chat_id in range(20)))
+            return bot, registry, [await MediaRegistry(storage).file_id(path) for path in paths]
+        finally:
+            await storage.close()
+
+    return asyncio.run(scenario())
+
+
+def test_rejected_file_id_is_uploaded_again_once(tmp_path):
+    bot, registry, file_ids = run_with_stale_file_ids(
+        tmp_path, lambda registry, bot, chat_id, paths: registry.send_photo(bot, chat_id, paths[0])
+    )
+    assert bot.uploads == registry.uploads == 1
+    assert file_ids[0] in bot.valid
+
+
+def test_rejected_album_is_uploaded_again_once(tmp_path):
+    bot, registry, file_ids = run_with_stale_file_ids(
+        tmp_path, lambda registry, bot, chat_id, paths: registry.send_media_group(bot, chat_id, paths)
+    )
+    assert bot.uploads == registry.uploads == 2
+    assert all(file_id in bot.valid for file_id in file_ids)
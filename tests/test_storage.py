@@ -0,0 +1,57 @@
+"""
+Storage conformance tests
+Runs check_storage.py's scenario against every backend. The PostgreSQL case
+connects through DATABASE_URL and is skipped when it is unset; it works in a
+schema of its own, dropped afterwards, so any database the user can create
+schemas in will do.
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from check_storage import run_checks
+
+
+async def check_sqlite(tmp_path):
+    from database import AsyncDatabase, Database
+    store = AsyncDatabase(Database(str(tmp_path / "check.db")))
+    try:
+        return await run_checks(store)
+    finally:
+        await store.close()
+
+
+async def check_postgres(dsn: str):
+    asyncpg = pytest.importorskip("asyncpg")
+    from storage.postgres import PostgresStorage
+
+    schema = f"check_{uuid.uuid4().hex[:12]}"
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(f"CREATE SCHEMA {schema}")
+        # Unknown DSN parameters are passed to the server as settings
+        separator = "&" if "?" in dsn else "?"
+        store = PostgresStorage(f"{dsn}{separator}search_path={schema}", min_size=1, max_size=4)
+        try:
+            return await run_checks(store)
+        finally:
+            await store.close()
+    finally:
+        await conn.execute(f"DROP SCHEMA {schema} CASCADE")
+        await conn.close()
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "postgres"])
+def test_storage_conformance(backend, tmp_path):
+    if backend == "sqlite":
+        check = asyncio.run(check_sqlite(tmp_path))
+    else:
+        dsn = os.getenv("DATABASE_URL")
+        if not dsn:
+            pytest.skip("DATABASE_URL is not set")
+        check = asyncio.run(check_postgres(dsn))
+
+    assert not check.failures, f"{len(check.failures)} failed: {', '.join(check.failures)}"
+    assert check.passed > 0
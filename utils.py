@@ -3,35 +3,77 @@ Utility functions
 """
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
+from cache import LRUCache
 from config import config
+from database import adb
+from storage import UserProfile
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-async def check_user_subscription(bot: Bot, user_id: int) -> bool:
+# Chat member statuses that count as subscribed
+# Note: "left" means not subscribed, "kicked" means banned
+SUBSCRIBED_STATUSES = ("member", "administrator", "creator")
+
+# Recent get_chat_member answers, keyed by user ID
+subscription_cache = LRUCache(
+    max_entries=config.SUBSCRIPTION_CACHE_MAX_ENTRIES,
+    ttl=config.SUBSCRIPTION_CACHE_TTL
+)
+subscription_api_calls = 0
+
+
+def remember_subscription(user_id: int, is_subscribed: bool):
+    """Cache a membership answer with the TTL for its outcome"""
+    ttl = config.SUBSCRIPTION_CACHE_TTL if is_subscribed else config.SUBSCRIPTION_CACHE_NEGATIVE_TTL
+    subscription_cache.set(user_id, is_subscribed, ttl=ttl)
+
+
+async def check_user_subscription(bot: Bot, user_id: int, force: bool = False,
+                                  profile: Optional[UserProfile] = None) -> bool:
     """
     Check if user is subscribed to the channel
     
+    Local state is used first: once a chat_member update for the user has
+    been seen, users.is_subscribed is kept current by handlers/membership.py
+    and is returned as is. Otherwise answers from Telegram are cached
+    (members for SUBSCRIPTION_CACHE_TTL, non-members for the shorter
+    SUBSCRIPTION_CACHE_NEGATIVE_TTL) and written through to
+    users.is_subscribed. Failed checks are not cached.
+    
     Args:
         bot: Bot instance
         user_id: User's Telegram ID
+        force: Skip local state and the cache and ask Telegram (e.g. right
+            after the user pressed "check subscription")
+        profile: The user's profile if the caller already has it; gives the
+            local state and skips a write-through that would change nothing
         
     Returns:
         True if user is subscribed, False otherwise
     """
+    global subscription_api_calls
+    
+    if not force:
+        if profile and profile.membership_known:
+            return profile.is_subscribed
+        
+        cached = subscription_cache.get(user_id)
+        if cached is not None:
+            return cached
+    
     try:
+        subscription_api_calls += 1
         member = await bot.get_chat_member(chat_id=config.CHANNEL_ID, user_id=user_id)
         logger.info(f"User {user_id} subscription status: {member.status}")
         
         # Check if user is a member, administrator, or creator
-        # Note: "left" means not subscribed, "kicked" means banned
-        is_subscribed = member.status in ["member", "administrator", "creator"]
+        is_subscribed = member.status in SUBSCRIBED_STATUSES
         
         if not is_subscribed:
             logger.info(f"User {user_id} is not subscribed (status: {member.status})")
-        
-        return is_subscribed
     except TelegramBadRequest as e:
         logger.error(f"TelegramBadRequest checking subscription for user {user_id}: {e}")
         logger.error(f"Channel ID used: {config.CHANNEL_ID}")
@@ -40,6 +82,18 @@ async def check_user_subscription(bot: Bot, user_id: int) -> bool:
     except Exception as e:
         logger.error(f"Unexpected error checking subscription for user {user_id}: {e}")
         return False
+    
+    remember_subscription(user_id, is_subscribed)
+    if profile is None or profile.is_subscribed != is_subscribed:
+        await adb.update_user_subscription(user_id, is_subscribed)
+    return is_subscribed
+
+
+def subscription_cache_stats() -> dict:
+    """Subscription cache counters plus the number of get_chat_member calls made"""
+    stats = subscription_cache.stats()
+    stats['api_calls'] = subscription_api_calls
+    return stats
 
 
 def generate_referral_link(user_id: int) -> str:
@@ -0,0 +1,110 @@
+"""
+Webhook serving mode
+Telegram POSTs updates to an embedded aiohttp server instead of the bot
+long-polling getUpdates. Each request is checked against the secret token,
+answered with 200 right away and handled in the background, with at most
+WEBHOOK_CONCURRENCY updates in flight. Once WEBHOOK_BACKLOG updates are
+waiting or running, new requests get 503 and Telegram retries them later.
+Several instances can run behind a load balancer.
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook handler that acknowledges at once but limits updates handled in parallel
+
+    At most `concurrency` updates are handled at a time and at most `backlog`
+    are held in memory (handled or waiting); requests beyond that are refused
+    before their body is read.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int = 100, backlog: int = 1000,
+                 **kwargs: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self._slots = asyncio.Semaphore(concurrency)
+        self.backlog = backlog
+        self.refused = 0
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if len(self._background_feed_update_tasks) >= self.backlog:
+            self.refused += 1
+            return web.Response(text="Backlog full", status=503)
+        return await super()._handle_request_background(bot, request)
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._slots:
+            await super()._background_feed_update(bot, update)
+
+
+def webhook_secret() -> str:
+    """WEBHOOK_SECRET, or a value derived from the bot token so all instances agree"""
+    if config.WEBHOOK_SECRET:
+        return config.WEBHOOK_SECRET
+    return hashlib.sha256(f"webhook:{config.BOT_TOKEN}".encode()).hexdigest()
+
+
+async def healthz(request: web.Request) -> web.Response:
+    """Liveness probe for load balancers"""
+    return web.Response(text="ok")
+
+
+def build_app(dp: Dispatcher, bot: Bot, path: str, secret: str, concurrency: int,
+              backlog: int = config.WEBHOOK_BACKLOG) -> web.Application:
+    """
+    Create the aiohttp application that receives updates
+
+    Args:
+        dp: Dispatcher with all routers included
+        bot: Bot instance
+        path: URL path Telegram posts to
+        secret: Expected X-Telegram-Bot-Api-Secret-Token header
+        concurrency: Maximum number of updates handled at once
+        backlog: Maximum number of updates accepted but not yet handled
+    """
+    app = web.Application()
+    BoundedRequestHandler(dp, bot, concurrency=concurrency, backlog=backlog,
+                          secret_token=secret).register(app, path=path)
+    app.router.add_get("/healthz", healthz)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Register the webhook with Telegram and serve updates until cancelled"""
+    if not config.WEBHOOK_BASE_URL:
+        raise RuntimeError("BOT_MODE=webhook needs WEBHOOK_BASE_URL")
+
+    secret = webhook_secret()
+    url = config.WEBHOOK_BASE_URL.rstrip("/") + config.WEBHOOK_PATH
+    app = build_app(dp, bot, config.WEBHOOK_PATH, secret, config.WEBHOOK_CONCURRENCY, config.WEBHOOK_BACKLOG)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook server listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    try:
+        # Pending updates are kept: Telegram delivers them to the new URL
+        await bot.set_webhook(
+            url,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS
+        )
+        logger.info(f"Webhook set to {url}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()